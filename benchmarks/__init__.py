@@ -0,0 +1,4 @@
+"""Load tests and benchmarks for the api and demo applications.
+
+Run with `python -m benchmarks --help` from the project directory.
+"""
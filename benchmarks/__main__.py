@@ -0,0 +1,93 @@
+import argparse
+import asyncio
+import json
+import sys
+
+from .harness import BenchEnvironment, compare, run_workload
+from .workloads import WORKLOADS
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Benchmarks the api and demo applications.',
+    )
+    parser.add_argument('--target', choices=['inprocess', 'localhost'], default='inprocess')
+    parser.add_argument('--workloads', default=','.join(WORKLOADS),
+                        help=f"comma-separated, among: {', '.join(WORKLOADS)}")
+    parser.add_argument('--requests', type=int, default=500, help='requests per workload')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=20, help='requests per workload before measuring')
+    parser.add_argument('--stub-latency', type=float, default=0.0, help='seconds')
+    parser.add_argument('--stub-jitter', type=float, default=0.0, help='seconds')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--baseline', help='compare with the results in this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed slowdown with respect to the baseline, as a ratio')
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> dict[str, dict]:
+    names = [name.strip() for name in args.workloads.split(',') if name.strip()]
+    unknown = [name for name in names if name not in WORKLOADS]
+    if unknown:
+        raise SystemExit(f"Unknown workloads: {', '.join(unknown)}")
+
+    results = {}
+    async with BenchEnvironment(args.target, args.stub_latency, args.stub_jitter) as env:
+        for name in names:
+            call = WORKLOADS[name](env)
+            if args.warmup:
+                await run_workload(name, call, args.warmup, args.concurrency)
+            result = await run_workload(name, call, args.requests, args.concurrency, env.cpu_clocks())
+            results[name] = result.summary()
+            summary = results[name]
+            by_component = ''.join(
+                f"  {component} {seconds * 1e6:.0f}"
+                for component, seconds in summary['cpu_per_request_by_component'].items()
+            )
+            print(
+                f"{name:<20} {summary['throughput']:>9.1f} req/s"
+                f"  p50 {summary['p50'] * 1000:>7.2f}ms"
+                f"  p95 {summary['p95'] * 1000:>7.2f}ms"
+                f"  p99 {summary['p99'] * 1000:>7.2f}ms"
+                f"  process cpu {summary['process_cpu_per_request'] * 1e6:>7.0f}us/req"
+                + (f" ({by_component.strip()})" if by_component else '')
+                + f"  errors {summary['errors']}",
+                file=sys.stderr,
+            )
+    return results
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    report = {
+        'target': args.target,
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'stub_latency': args.stub_latency,
+        'results': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+        if baseline.get('target') != args.target:
+            print(f"WARNING the baseline was measured with target '{baseline.get('target')}'", file=sys.stderr)
+        regressions = compare(results, baseline['results'], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
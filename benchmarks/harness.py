@@ -0,0 +1,275 @@
+import asyncio
+import json
+import socket
+import statistics
+import tempfile
+import threading
+import time
+from base64 import b64encode
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Awaitable, Callable
+
+import httpx
+import itsdangerous
+import uvicorn
+
+from src import config
+from src.api import db, main as api_main, upstream
+from src.api.schema import Service
+from src.api.storage import JsonStore
+from src.demo.main import app as demo_app
+
+from .stub import create_stub_app
+
+# addresses of the in-process upstreams; nothing listens on them
+STUB_NETLOC = '127.0.0.1:18001'
+DEMO_NETLOC = '127.0.0.1:18002'
+
+
+def session_cookie(user: dict, secret_key: str = config.SESSION_SECRET_KEY) -> str:
+    """Signs a session the way SessionMiddleware does, so that requests skip GitHub OAuth."""
+    data = b64encode(json.dumps({'user': user}).encode())
+    return itsdangerous.TimestampSigner(secret_key).sign(data).decode()
+
+
+class RoutingTransport(httpx.AsyncBaseTransport):
+    """Sends the requests for each host:port to its own transport."""
+
+    def __init__(self, routes: dict[str, httpx.AsyncBaseTransport]):
+        self.routes = routes
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.routes[request.url.netloc.decode()].handle_async_request(request)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class _ServerThread(threading.Thread):
+    def __init__(self, app, port: int):
+        super().__init__(daemon=True)
+        self.server = uvicorn.Server(uvicorn.Config(app, host='127.0.0.1', port=port, log_level='warning'))
+
+    def run(self):
+        self.server.run()
+
+    def start_and_wait(self):
+        self.start()
+        while not self.server.started:
+            time.sleep(0.01)
+
+    def cpu_time(self) -> float:
+        return time.clock_gettime(time.pthread_getcpuclockid(self.ident))
+
+    def stop(self):
+        self.server.should_exit = True
+        self.join()
+
+
+@dataclass
+class WorkloadResult:
+    name: str
+    requests: int
+    errors: int
+    seconds: float
+    # CPU time of the whole benchmark process: client, api, demo and stub together
+    process_cpu_seconds: float
+    latencies: list[float] = field(repr=False)
+    # CPU time of the event loop thread of each component, when they run on threads of their own
+    cpu_seconds_by_component: dict[str, float] = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        latencies = sorted(self.latencies)
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'seconds': self.seconds,
+            'throughput': self.requests / self.seconds if self.seconds else 0.0,
+            'p50': quantiles[49],
+            'p95': quantiles[94],
+            'p99': quantiles[98],
+            'process_cpu_seconds': self.process_cpu_seconds,
+            'process_cpu_per_request': self.process_cpu_seconds / self.requests if self.requests else 0.0,
+            'cpu_per_request_by_component': {
+                component: seconds / self.requests if self.requests else 0.0
+                for component, seconds in self.cpu_seconds_by_component.items()
+            },
+        }
+
+
+class BenchEnvironment:
+    """Runs the api application against a stub upstream and the demo application.
+
+    With target 'inprocess', every application runs on the event loop of the
+    benchmark through ASGI transports; with 'localhost', each one is served by
+    uvicorn on a free port. The services database lives in a temporary
+    directory and the client is authenticated with a signed test session.
+    """
+
+    def __init__(self, target: str = 'inprocess', stub_latency: float = 0.0, stub_jitter: float = 0.0):
+        if target not in ('inprocess', 'localhost'):
+            raise ValueError(f"Unknown target '{target}'")
+        self.target = target
+        self.stub_app = create_stub_app(stub_latency, stub_jitter)
+        self._tmp = tempfile.TemporaryDirectory()
+        self._servers: dict[str, _ServerThread] = {}
+        self._lifespan = None
+        self.client: httpx.AsyncClient | None = None
+
+    def _services(self, stub_url: str, demo_url: str) -> dict[str, Service]:
+        return {
+            'stub': Service(name='Stub', parameters=[], executable_url=f"{stub_url}/predict"),
+            'iris': Service(name='Iris', executable_url=f"{demo_url}/iris"),
+            'digits': Service(name='Digits', executable_url=f"{demo_url}/digits"),
+        }
+
+    async def __aenter__(self) -> 'BenchEnvironment':
+        store = JsonStore(Path(self._tmp.name) / 'services.json')
+        cookies = {'session': session_cookie({'username': 'bench', 'github_id': '0'})}
+
+        if self.target == 'inprocess':
+            stub_url, demo_url = f"http://{STUB_NETLOC}", f"http://{DEMO_NETLOC}"
+            store.save(self._services(stub_url, demo_url))
+            db.set_store(store)
+            self._lifespan = _Lifespans(api_main.app, demo_app)
+            await self._lifespan.__aenter__()
+            # route the upstream calls of the api to the in-process apps
+            await upstream.close_client()
+            upstream._client = httpx.AsyncClient(transport=RoutingTransport({
+                STUB_NETLOC: httpx.ASGITransport(app=self.stub_app),
+                DEMO_NETLOC: httpx.ASGITransport(app=demo_app),
+            }))
+            self.client = httpx.AsyncClient(
+                transport=httpx.ASGITransport(app=api_main.app),
+                base_url='http://api.bench',
+                cookies=cookies,
+            )
+        else:
+            stub_port, demo_port, api_port = _free_port(), _free_port(), _free_port()
+            stub_url, demo_url = f"http://127.0.0.1:{stub_port}", f"http://127.0.0.1:{demo_port}"
+            store.save(self._services(stub_url, demo_url))
+            db.set_store(store)
+            for component, app, port in (
+                ('stub', self.stub_app, stub_port),
+                ('demo', demo_app, demo_port),
+                ('api', api_main.app, api_port),
+            ):
+                server = _ServerThread(app, port)
+                server.start_and_wait()
+                self._servers[component] = server
+            self.client = httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{api_port}",
+                cookies=cookies,
+                limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+            )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.client.aclose()
+        if self._lifespan is not None:
+            await self._lifespan.__aexit__(*exc_info)
+        for server in reversed(list(self._servers.values())):
+            await asyncio.to_thread(server.stop)
+        db.close_store()
+        self._tmp.cleanup()
+
+
+    def cpu_clocks(self) -> dict[str, Callable[[], float]]:
+        """CPU clocks of the event loop thread of each component.
+
+        Only with target 'localhost', where the client runs on this thread and
+        each application on a thread of its own; in-process, they all share
+        one event loop. Work handed to other threads or processes is not counted.
+        """
+        if self.target != 'localhost':
+            return {}
+        return {'client': time.thread_time} | {
+            component: server.cpu_time for component, server in self._servers.items()
+        }
+
+
+class _Lifespans:
+    """Runs the lifespan of several applications, for the in-process target."""
+
+    def __init__(self, *apps):
+        self._contexts = [app.router.lifespan_context(app) for app in apps]
+
+    async def __aenter__(self):
+        for context in self._contexts:
+            await context.__aenter__()
+
+    async def __aexit__(self, *exc_info):
+        for context in reversed(self._contexts):
+            await context.__aexit__(*exc_info)
+
+
+async def run_workload(
+    name: str,
+    call: Callable[[int], Awaitable[httpx.Response]],
+    requests: int,
+    concurrency: int,
+    cpu_clocks: dict[str, Callable[[], float]] | None = None,
+) -> WorkloadResult:
+    """Issues `requests` calls, at most `concurrency` at a time, and measures them.
+
+    `call` receives the index of the request and returns its response;
+    `cpu_clocks` are read before and after, to split CPU time by component.
+    """
+    latencies: list[float] = []
+    errors = 0
+    next_index = 0
+
+    async def worker():
+        nonlocal errors, next_index
+        while next_index < requests:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await call(index)
+                if response.status_code >= 400:
+                    errors += 1
+            except Exception:
+                # e.g. a response that is not what the workload expects
+                errors += 1
+            latencies.append(time.perf_counter() - started)
+
+    cpu_clocks = cpu_clocks or {}
+    cpu_started = time.process_time()
+    component_started = {component: clock() for component, clock in cpu_clocks.items()}
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    return WorkloadResult(
+        name=name,
+        requests=requests,
+        errors=errors,
+        seconds=time.perf_counter() - started,
+        process_cpu_seconds=time.process_time() - cpu_started,
+        latencies=latencies,
+        cpu_seconds_by_component={
+            component: clock() - component_started[component] for component, clock in cpu_clocks.items()
+        },
+    )
+
+
+def compare(results: dict[str, dict], baseline: dict[str, dict], tolerance: float) -> list[str]:
+    """Lists the workloads slower than the baseline by more than `tolerance` (a ratio)."""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result['throughput'] < reference['throughput'] * (1 - tolerance):
+            regressions.append(
+                f"{name}: throughput {result['throughput']:.1f}/s, baseline {reference['throughput']:.1f}/s")
+        if result['p95'] > reference['p95'] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p95 {result['p95'] * 1000:.2f}ms, baseline {reference['p95'] * 1000:.2f}ms")
+        if result['errors'] > reference['errors']:
+            regressions.append(f"{name}: {result['errors']} errors, baseline {reference['errors']}")
+    return regressions
@@ -0,0 +1,237 @@
+"""Replays a traffic journal of the api application against a running gateway.
+
+    python -m benchmarks.replay data/capture/traffic.jsonl --url http://localhost:8000 --speed 2
+
+Requests are issued at the pace they were captured, divided by `--speed`, or
+as fast as `--concurrency` allows with `--speed 0`. The report compares the
+latency of each route with the one measured at capture time.
+
+Services created during the capture get new ids when replayed; the later
+requests to them are sent to the new ids. Requests to services that existed
+before the capture only succeed if the gateway has them under the same ids.
+"""
+import argparse
+import asyncio
+import base64
+import heapq
+import json
+import re
+import statistics
+import sys
+import time
+
+from typing import Iterator
+
+import httpx
+
+from .harness import session_cookie
+
+# ids of services and jobs, so that the routes are compared as a whole
+_ROUTE_IDS = re.compile(r'^/(services|jobs)/[^/]+')
+
+
+def _read(path: str) -> Iterator[dict]:
+    with open(path, 'r') as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def iter_journal(paths: list[str]) -> Iterator[dict]:
+    """Reads the entries of several journal files, e.g. rotated ones, in the order they were captured.
+
+    Each file is read as it goes, so that large journals are not held in memory.
+    """
+    return heapq.merge(*(_read(path) for path in paths), key=lambda entry: entry['ts'])
+
+
+def route(entry: dict) -> str:
+    path = _ROUTE_IDS.sub(r'/\1/{id}', entry['path'])
+    return f"{entry['method']} {path}"
+
+
+def _request(entry: dict, path: str) -> dict:
+    request = {'method': entry['method'], 'url': path}
+    if entry.get('query'):
+        request['url'] += f"?{entry['query']}"
+    if 'payload' in entry:
+        request['json'] = entry['payload']
+    elif 'body_base64' in entry:
+        request['content'] = base64.b64decode(entry['body_base64'])
+        request['headers'] = {'content-type': entry.get('content_type') or 'application/octet-stream'}
+    return request
+
+
+def _created_id(response: httpx.Response | None) -> str | None:
+    if response is None or response.status_code != 200:
+        return None
+    try:
+        return response.json()['id']
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def _quantile(values: list[float], q: int) -> float:
+    if len(values) < 2:
+        return values[0] if values else 0.0
+    return statistics.quantiles(values, n=100)[q - 1]
+
+
+async def replay(
+    entries: Iterator[dict],
+    client: httpx.AsyncClient,
+    speed: float,
+    concurrency: int,
+) -> tuple[list[dict], float]:
+    """Re-issues the captured requests, `concurrency` at a time.
+
+    Returns, for each request, its route, latencies and statuses, along with
+    the time the capture spanned. Entries are read only as workers free up.
+    """
+    queue: asyncio.Queue[dict | None] = asyncio.Queue(maxsize=concurrency)
+    results = []
+    # captured id of each created service -> the id it got when replayed
+    created: dict[str, asyncio.Future] = {}
+    first = last = None
+    started_at = time.perf_counter()
+
+    async def issue(entry: dict):
+        path = entry['path']
+        service_id = entry.get('service_id')
+        if service_id in created:
+            new_id = await created[service_id]
+            if new_id is not None:
+                path = path.replace(f"/services/{service_id}", f"/services/{new_id}", 1)
+        creating = created.get(entry.get('created_id'))
+        request_started_at = time.perf_counter()
+        response = None
+        try:
+            response = await client.request(**_request(entry, path))
+            status = response.status_code
+        except httpx.HTTPError:
+            status = None
+        finally:
+            # the requests to the created service wait for it, even if it failed
+            if creating is not None and not creating.done():
+                creating.set_result(_created_id(response))
+        replayed = time.perf_counter() - request_started_at
+        results.append({
+            'route': route(entry),
+            'captured': entry.get('duration'),
+            'replayed': replayed,
+            'captured_status': entry.get('status'),
+            'replayed_status': status,
+        })
+
+    async def work():
+        while (entry := await queue.get()) is not None:
+            await issue(entry)
+
+    workers = [asyncio.create_task(work()) for _ in range(concurrency)]
+    try:
+        for entry in entries:
+            if entry.get('truncated'):
+                continue
+            if first is None:
+                first = entry['ts']
+            last = entry['ts']
+            if speed > 0:
+                await asyncio.sleep(max(0.0, (entry['ts'] - first) / speed - (time.perf_counter() - started_at)))
+            if entry.get('created_id'):
+                created[entry['created_id']] = asyncio.get_running_loop().create_future()
+            await queue.put(entry)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+    return results, (last - first) if first is not None else 0.0
+
+
+def summarize(results: list[dict]) -> dict[str, dict]:
+    routes: dict[str, list[dict]] = {}
+    for result in results:
+        routes.setdefault(result['route'], []).append(result)
+
+    summary = {}
+    for name, calls in sorted(routes.items()):
+        captured = sorted(call['captured'] for call in calls if call['captured'] is not None)
+        replayed = sorted(call['replayed'] for call in calls)
+        summary[name] = {
+            'requests': len(calls),
+            'status_mismatches': sum(call['captured_status'] != call['replayed_status'] for call in calls),
+            'captured_p50': _quantile(captured, 50),
+            'replayed_p50': _quantile(replayed, 50),
+            'delta_p50': _quantile(replayed, 50) - _quantile(captured, 50),
+            'captured_p95': _quantile(captured, 95),
+            'replayed_p95': _quantile(replayed, 95),
+            'delta_p95': _quantile(replayed, 95) - _quantile(captured, 95),
+        }
+    return summary
+
+
+def parse_args(argv: list[str]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.replay',
+        description='Replays a traffic journal captured with CAPTURE_TRAFFIC against a gateway.',
+    )
+    parser.add_argument('journal', nargs='+', help='journal files, e.g. data/capture/traffic*.jsonl')
+    parser.add_argument('--url', default='http://localhost:8000', help='base url of the gateway')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='multiple of the captured pace; 0 replays as fast as possible')
+    parser.add_argument('--concurrency', type=int, default=64)
+    parser.add_argument('--api-key', help='authenticate with this api key instead of a signed test session')
+    parser.add_argument('--output', help='write the report to this JSON file')
+    return parser.parse_args(argv)
+
+
+async def run(args: argparse.Namespace) -> dict:
+    if args.api_key:
+        auth = {'headers': {'Authorization': f"Bearer {args.api_key}"}}
+    else:
+        auth = {'cookies': {'session': session_cookie({'username': 'replay', 'github_id': '0'})}}
+
+    async with httpx.AsyncClient(
+        base_url=args.url,
+        limits=httpx.Limits(max_connections=None, max_keepalive_connections=None),
+        timeout=None,
+        **auth,
+    ) as client:
+        started_at = time.perf_counter()
+        results, captured_seconds = await replay(iter_journal(args.journal), client, args.speed, args.concurrency)
+        seconds = time.perf_counter() - started_at
+
+    return {
+        'url': args.url,
+        'speed': args.speed,
+        'concurrency': args.concurrency,
+        'requests': len(results),
+        'seconds': seconds,
+        'captured_seconds': captured_seconds,
+        'routes': summarize(results),
+    }
+
+
+def main(argv: list[str]) -> int:
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    for name, summary in report['routes'].items():
+        print(
+            f"{name:<36} {summary['requests']:>6}"
+            f"  p50 {summary['replayed_p50'] * 1000:>7.2f}ms ({summary['delta_p50'] * 1000:+.2f})"
+            f"  p95 {summary['replayed_p95'] * 1000:>7.2f}ms ({summary['delta_p95'] * 1000:+.2f})"
+            f"  status mismatches {summary['status_mismatches']}",
+            file=sys.stderr,
+        )
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
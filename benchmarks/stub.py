@@ -0,0 +1,23 @@
+import asyncio
+import random
+
+from fastapi import FastAPI, Request
+
+
+def create_stub_app(latency: float = 0.0, jitter: float = 0.0) -> FastAPI:
+    """A model server that answers every payload after `latency` (+/- `jitter`) seconds."""
+    app = FastAPI(title='Benchmark stub')
+
+    @app.post("/predict")
+    async def predict(request: Request):
+        payload = await request.json()
+        delay = latency + random.uniform(-jitter, jitter) if jitter else latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return {
+            "message": "OK",
+            "status-code": 200,
+            "data": len(payload),
+        }
+
+    return app
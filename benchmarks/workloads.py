@@ -0,0 +1,84 @@
+import json
+from typing import Awaitable, Callable
+
+import httpx
+
+from .harness import BenchEnvironment
+
+# paths of the demo data, relative to the project directory
+DIGITS_EXAMPLE_FILEPATH = 'data/digit_data.json'
+
+Workload = Callable[[BenchEnvironment], Callable[[int], Awaitable[httpx.Response]]]
+
+
+def _iris_payload(index: int) -> dict:
+    return {
+        'petal_length': (index % 70) / 10,
+        'petal_width': (index % 25) / 10,
+        'sepal_length': 4 + (index % 40) / 10,
+        'sepal_width': 2 + (index % 25) / 10,
+    }
+
+
+def use_stub(env: BenchEnvironment):
+    """use_service against the stub upstream, distinct payloads."""
+    return lambda index: env.client.post('/services/stub/use', json={'x': index})
+
+
+def use_stub_identical(env: BenchEnvironment):
+    """use_service against the stub upstream, always the same payload."""
+    return lambda index: env.client.post('/services/stub/use', json={'x': 0})
+
+
+def use_iris(env: BenchEnvironment):
+    """use_service against the iris demo model, distinct payloads."""
+    return lambda index: env.client.post('/services/iris/use', json=_iris_payload(index))
+
+
+def use_iris_identical(env: BenchEnvironment):
+    """use_service against the iris demo model, always the same payload."""
+    return lambda index: env.client.post('/services/iris/use', json=_iris_payload(0))
+
+
+def use_digits(env: BenchEnvironment):
+    """use_service against the digits demo model."""
+    with open(DIGITS_EXAMPLE_FILEPATH, 'r') as file:
+        pixels = json.load(file)['pixels']
+    return lambda index: env.client.post('/services/digits/use', json={'pixels': pixels})
+
+
+def list_services(env: BenchEnvironment):
+    """GET /services."""
+    return lambda index: env.client.get('/services')
+
+
+def crud_churn(env: BenchEnvironment):
+    """Creates a service, patches it and deletes it; each call is one such cycle of three requests.
+
+    The steps of a cycle run in order, so that the registry keeps its size;
+    the response of the first failing step is returned, if any.
+    """
+
+    async def call(index: int) -> httpx.Response:
+        response = await env.client.post('/services', json={'name': f'bench {index}', 'description': 'churn'})
+        if response.status_code >= 400:
+            return response
+        service_id = response.json()['id']
+        try:
+            response = await env.client.patch(f'/services/{service_id}', json={'description': 'patched'})
+        finally:
+            deleted = await env.client.delete(f'/services/{service_id}')
+        return response if response.status_code >= 400 else deleted
+
+    return call
+
+
+WORKLOADS: dict[str, Workload] = {
+    'use-stub': use_stub,
+    'use-stub-identical': use_stub_identical,
+    'use-iris': use_iris,
+    'use-iris-identical': use_iris_identical,
+    'use-digits': use_digits,
+    'list': list_services,
+    'crud': crud_churn,
+}
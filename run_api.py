@@ -7,5 +7,7 @@ if __name__ == "__main__":
         "src.api.main:app",
         host=config.THIS_HOST,
         port=int(config.THIS_PORT),
-        reload=True  # Remove in production
+        reload=not config.PRODUCTION,
+        # uvicorn cannot reload several workers
+        workers=config.API_WORKERS if config.PRODUCTION else None,
     )
@@ -7,5 +7,5 @@ if __name__ == "__main__":
         "src.demo.main:app",
         host=config.DEMO_HOST,
         port=config.DEMO_PORT,
-        reload=True  # Remove in production
+        reload=not config.PRODUCTION
     )
@@ -7,6 +7,7 @@ import seaborn as sns
 import pickle
 
 from src.demo import paths
+from src.demo.artifacts import export_model
 
 # Load the digits dataset
 digits = load_digits()
@@ -29,6 +30,9 @@ y_pred = model.predict(X_test)
 with open(paths.DIGITS_MODEL_FILEPATH, 'wb') as file:
     pickle.dump(model, file)
 
+# pickle-free version, loaded by the demo application
+export_model(model, paths.DIGITS_MODEL_DIR)
+
 # Evaluate the model
 print("Accuracy:", accuracy_score(y_test, y_pred))
 print("\nClassification Report:\n", classification_report(y_test, y_pred))
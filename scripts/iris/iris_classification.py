@@ -8,6 +8,7 @@ from sklearn.metrics import accuracy_score
 from sklearn.datasets import load_iris
 
 from src.demo import paths
+from src.demo.artifacts import export_model
 
 # Load the Iris dataset
 iris = load_iris()
@@ -26,6 +27,9 @@ model.fit(X_train, y_train)
 with open(paths.IRIS_MODEL_FILEPATH, 'wb') as file:
     pickle.dump(model, file)
 
+# pickle-free version, loaded by the demo application
+export_model(model, paths.IRIS_MODEL_DIR, labels=iris.target_names.tolist())
+
 # Predict using the test data
 y_pred = model.predict(X_test)
 
@@ -0,0 +1,154 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from .schema import APIKey, GitHubUser
+from .storage import atomic_write
+
+KEY_PREFIX = 'xk'
+SCOPES = ('services:read', 'services:write', 'services:use')
+
+
+def hash_secret(secret: str) -> str:
+    # keys are random and long, so a fast hash is enough, unlike passwords
+    return hashlib.sha256(secret.encode()).hexdigest()
+
+
+def split_key(key: str) -> tuple[str, str] | None:
+    """Splits a key of the form xk_<key id>_<secret> into its id and secret."""
+    parts = key.split('_', 2)
+    if len(parts) != 3 or parts[0] != KEY_PREFIX or not parts[1] or not parts[2]:
+        return None
+    return parts[1], parts[2]
+
+
+class APIKeyStore:
+    """API keys, indexed in memory by key id and persisted in a JSON file.
+
+    Only a hash of each secret is kept. Verified keys, valid or not, are
+    cached for `cache_ttl` seconds, so that a client sending the same key
+    again skips the verification; a revoked key may thus be accepted for
+    up to `cache_ttl` seconds by the other workers. Valid and invalid keys
+    are cached apart, each up to `cache_max_entries` with the oldest ones
+    evicted first, so that a flood of bad keys cannot evict the valid ones.
+    """
+
+    def __init__(self, path: Path, cache_ttl: float, cache_max_entries: int):
+        self.path = path
+        self.cache_ttl = cache_ttl
+        self.cache_max_entries = cache_max_entries
+        self._lock = threading.Lock()
+        self._keys: dict[str, APIKey] = {}
+        self._mtime_ns: int | None = None
+        self._valid: OrderedDict[str, tuple[float, APIKey]] = OrderedDict()
+        self._invalid: OrderedDict[str, float] = OrderedDict()
+
+    def _reload_if_changed(self):
+        # other workers may have issued or revoked keys
+        try:
+            mtime_ns = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            mtime_ns = None
+        if mtime_ns == self._mtime_ns:
+            return
+        keys = {}
+        if mtime_ns is not None:
+            with open(self.path, 'r') as file:
+                keys = {key_id: APIKey.model_validate(data) for key_id, data in json.load(file).items()}
+        self._keys = keys
+        self._mtime_ns = mtime_ns
+
+    def _write(self):
+        atomic_write(self.path, json.dumps({key_id: key.model_dump() for key_id, key in self._keys.items()}))
+        self._mtime_ns = os.stat(self.path).st_mtime_ns
+        # new caches rather than cleared ones, since verify() may be using them on the event loop
+        self._valid = OrderedDict()
+        self._invalid = OrderedDict()
+
+    def issue(self, user: GitHubUser, name: str, scopes: list[str], ttl: float | None = None) -> tuple[APIKey, str]:
+        """Creates a key for `user`; returns it along with the only copy of the full key."""
+        key_id = secrets.token_hex(6)
+        secret = secrets.token_urlsafe(32)
+        now = time.time()
+        api_key = APIKey(
+            key_id=key_id,
+            name=name,
+            username=user.username,
+            github_id=user.github_id,
+            scopes=scopes,
+            secret_hash=hash_secret(secret),
+            created_at=now,
+            expires_at=now + ttl if ttl else None,
+        )
+        with self._lock:
+            self._reload_if_changed()
+            self._keys[key_id] = api_key
+            self._write()
+        return api_key, f"{KEY_PREFIX}_{key_id}_{secret}"
+
+    def revoke(self, github_id: str, key_id: str) -> APIKey | None:
+        with self._lock:
+            self._reload_if_changed()
+            api_key = self._keys.get(key_id)
+            if api_key is None or api_key.github_id != github_id:
+                return None
+            del self._keys[key_id]
+            self._write()
+        return api_key
+
+    def list(self, github_id: str) -> list[APIKey]:
+        with self._lock:
+            self._reload_if_changed()
+            return [api_key for api_key in self._keys.values() if api_key.github_id == github_id]
+
+    async def verify(self, key: str) -> APIKey | None:
+        """Returns the API key matching `key` if it is valid, None otherwise.
+
+        Keys missing from the cache are looked up in a thread, since the file
+        may have to be read again.
+        """
+        now = time.monotonic()
+        cached = self._valid.get(key)
+        if cached is not None and cached[0] > now:
+            api_key = cached[1]
+        elif self._invalid.get(key, 0.0) > now:
+            return None
+        elif split_key(key) is None:
+            return None
+        else:
+            api_key = await asyncio.to_thread(self._lookup, key)
+            if api_key is None:
+                _remember(self._invalid, key, now + self.cache_ttl, self.cache_max_entries)
+                return None
+            _remember(self._valid, key, (now + self.cache_ttl, api_key), self.cache_max_entries)
+        if api_key.expires_at is not None and api_key.expires_at <= time.time():
+            return None
+        return api_key
+
+    def _lookup(self, key: str) -> APIKey | None:
+        parts = split_key(key)
+        if parts is None:
+            return None
+        key_id, secret = parts
+        with self._lock:
+            self._reload_if_changed()
+            api_key = self._keys.get(key_id)
+        # compare even if the id is unknown, so that timing tells nothing about it
+        expected = api_key.secret_hash if api_key is not None else '0' * 64
+        if not hmac.compare_digest(expected, hash_secret(secret)) or api_key is None:
+            return None
+        return api_key
+
+
+def _remember(cache: OrderedDict, key: str, value, max_entries: int):
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > max_entries:
+        cache.popitem(last=False)
@@ -1,16 +1,43 @@
-import os
+from typing import TYPE_CHECKING
 
-from authlib.integrations.starlette_client import OAuth
 from starlette.config import Config
 
-from fastapi import Depends, HTTPException, status, Request
+from fastapi import Depends, HTTPException, status
+from fastapi.requests import HTTPConnection
 from fastapi.security import OAuth2PasswordBearer
 
+from .. import config as app_config
+from . import paths
+from .apikeys import APIKeyStore
 from .schema import GitHubUser
 
+if TYPE_CHECKING:
+    from authlib.integrations.starlette_client import OAuth
+
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def integrate_github_auth(oauth: OAuth, config: Config):
+_oauth: "OAuth | None" = None
+
+API_KEYS = APIKeyStore(
+    paths.API_KEYS_FILEPATH,
+    cache_ttl=app_config.API_KEY_CACHE_TTL,
+    cache_max_entries=app_config.API_KEY_CACHE_MAX_ENTRIES,
+)
+
+
+def get_oauth(config: Config) -> "OAuth":
+    """Builds the OAuth client on first use, since importing authlib is slow."""
+    global _oauth
+    if _oauth is None:
+        from authlib.integrations.starlette_client import OAuth
+
+        oauth = OAuth(config)
+        integrate_github_auth(oauth, config)
+        _oauth = oauth
+    return _oauth
+
+
+def integrate_github_auth(oauth: "OAuth", config: Config):
     oauth.register(
         name='github',
         client_id=config.get("GITHUB_CLIENT_ID"),
@@ -22,7 +49,46 @@ def integrate_github_auth(oauth: OAuth, config: Config):
     )
 
 
-async def get_current_github_user(request: Request) -> GitHubUser:
+def required_scope(request: HTTPConnection) -> str:
+    """The scope an api key needs for the request."""
+    path = request.url.path
+    if (
+        request.scope["type"] == "websocket"
+        or path.endswith(("/use", "/use/raw", "/use/batch", "/jobs"))
+        or path.startswith("/jobs/")
+    ):
+        return 'services:use'
+    if request.scope["method"] in ("GET", "HEAD", "OPTIONS"):
+        return 'services:read'
+    return 'services:write'
+
+
+async def get_current_github_user(request: HTTPConnection) -> GitHubUser:
+    """Authenticates the request by its api key, if any, or by its session.
+
+    Api keys are sent as `Authorization: Bearer <key>`; the user they were
+    issued to is stored in `request.state.api_key`.
+    """
+    # a HTTPConnection, so that websockets are authenticated the same way
+    authorization = request.headers.get("authorization")
+    if authorization:
+        scheme, _, key = authorization.partition(" ")
+        api_key = await API_KEYS.verify(key.strip()) if scheme.lower() == "bearer" else None
+        if api_key is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid API key",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        scope = required_scope(request)
+        if scope not in api_key.scopes:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail=f"API key lacks the '{scope}' scope",
+            )
+        request.state.api_key = api_key
+        return GitHubUser(username=api_key.username, github_id=api_key.github_id)
+
     user = request.session.get("user")
     if not user:
         raise HTTPException(
@@ -0,0 +1,133 @@
+import time
+from collections import deque
+
+from .schema import Service
+
+POLICIES = ('least-outstanding', 'ewma')
+
+# weight of the latest latency in the moving average of a replica
+EWMA_ALPHA = 0.3
+# latencies kept per replica to estimate its percentiles
+LATENCY_WINDOW = 200
+# latencies needed before a percentile is trusted, e.g. to hedge
+MIN_SAMPLES = 20
+
+
+def replica_urls(service: Service) -> list[str]:
+    """The executable url of the service followed by its replicas, without duplicates."""
+    urls = [service.executable_url] + service.replica_urls
+    return list(dict.fromkeys(url for url in urls if url))
+
+
+class Replica:
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ewma = 0.0
+        self.ejected_until = 0.0
+        self.ejections = 0
+        self._latencies: deque[float] = deque(maxlen=LATENCY_WINDOW)
+
+    def is_ejected(self, now: float) -> bool:
+        return self.ejected_until > now
+
+    def record(self, latency: float, failed: bool, eject_after: int, eject_for: float):
+        self.requests += 1
+        if failed:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= eject_after:
+                self.ejected_until = time.monotonic() + eject_for
+                self.ejections += 1
+                self.consecutive_failures = 0
+            return
+        self.consecutive_failures = 0
+        self._latencies.append(latency)
+        self.ewma = latency if len(self._latencies) == 1 else EWMA_ALPHA * latency + (1 - EWMA_ALPHA) * self.ewma
+
+    def percentile(self, q: float) -> float | None:
+        if len(self._latencies) < MIN_SAMPLES:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q / 100))]
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            'url': self.url,
+            'outstanding': self.outstanding,
+            'requests': self.requests,
+            'failures': self.failures,
+            'ewma_latency': self.ewma,
+            'p50_latency': self.percentile(50),
+            'p95_latency': self.percentile(95),
+            'ejected': self.is_ejected(now),
+            'ejected_for': max(0.0, self.ejected_until - now),
+            'ejections': self.ejections,
+        }
+
+
+class ReplicaSet:
+    """The replicas of a service, and the policy to pick one for each call."""
+
+    def __init__(self, replicas: list[Replica], policy: str):
+        self.replicas = replicas
+        self.policy = policy
+
+    def __len__(self) -> int:
+        return len(self.replicas)
+
+    def pick(self, exclude: set[str] = frozenset()) -> Replica:
+        """Picks a healthy replica not in `exclude`.
+
+        Ejected replicas are picked only if no other is left, and replicas
+        in `exclude` only if every replica is.
+        """
+        now = time.monotonic()
+        candidates = [replica for replica in self.replicas if replica.url not in exclude]
+        healthy = [replica for replica in candidates if not replica.is_ejected(now)]
+        candidates = healthy or candidates or self.replicas
+        if self.policy == 'ewma':
+            # penalize busy replicas, so that a fast one is not flooded
+            return min(candidates, key=lambda replica: (replica.ewma * (replica.outstanding + 1), replica.requests))
+        return min(candidates, key=lambda replica: (replica.outstanding, replica.requests))
+
+
+class ReplicaPool:
+    """The replica sets of the services, by service id.
+
+    Stats of a replica are kept as long as its url stays in the service.
+    """
+
+    def __init__(self, policy: str, eject_after: int, eject_for: float):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown balancing policy '{policy}', expected one of {POLICIES}")
+        self.policy = policy
+        self.eject_after = eject_after
+        self.eject_for = eject_for
+        self._sets: dict[str, ReplicaSet] = {}
+
+    def get(self, service_id: str, service: Service) -> ReplicaSet:
+        urls = replica_urls(service)
+        policy = service.balancing_policy or self.policy
+        replica_set = self._sets.get(service_id)
+        if replica_set is None or [replica.url for replica in replica_set.replicas] != urls:
+            known = {replica.url: replica for replica in replica_set.replicas} if replica_set else {}
+            replica_set = self._sets[service_id] = ReplicaSet(
+                [known.get(url) or Replica(url) for url in urls], policy
+            )
+        replica_set.policy = policy
+        return replica_set
+
+    def record(self, replica: Replica, latency: float, failed: bool):
+        replica.record(latency, failed, self.eject_after, self.eject_for)
+
+    def forget(self, service_id: str):
+        self._sets.pop(service_id, None)
+
+    def stats(self, service_id: str, service: Service) -> list[dict]:
+        return [replica.snapshot() for replica in self.get(service_id, service).replicas]
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from .schema import ServiceOutput
+
+
+def payload_key(payload: dict) -> str:
+    """Hashes a payload so that equal payloads get the same key regardless of key order."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    output: ServiceOutput
+    expires_at: float
+
+
+class ResponseCache:
+    """LRU cache of service outputs, keyed by service id and payload hash.
+
+    Entries expire after the TTL given when they are stored; the least
+    recently used entries are evicted once `max_entries` is exceeded.
+    """
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[tuple[str, str], CacheEntry] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, service_id: str, key: str) -> ServiceOutput | None:
+        entry = self._entries.get((service_id, key))
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry.expires_at <= time.monotonic():
+            del self._entries[(service_id, key)]
+            self.misses += 1
+            return None
+        self._entries.move_to_end((service_id, key))
+        self.hits += 1
+        return entry.output
+
+    def put(self, service_id: str, key: str, output: ServiceOutput, ttl: float):
+        self._entries[(service_id, key)] = CacheEntry(output, time.monotonic() + ttl)
+        self._entries.move_to_end((service_id, key))
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, service_id: str) -> int:
+        stale = [entry_key for entry_key in self._entries if entry_key[0] == service_id]
+        for entry_key in stale:
+            del self._entries[entry_key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
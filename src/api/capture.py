@@ -0,0 +1,219 @@
+"""Journal of the traffic of the gateway, for replaying it with `python -m benchmarks.replay`."""
+import base64
+import json
+import os
+import threading
+import time
+from collections import deque
+from logging import Logger
+from pathlib import Path
+
+
+class TrafficJournal:
+    """Writes the captured requests as JSON lines, to files rotated by size.
+
+    record() only appends the entry to a bounded buffer, dropping it if the
+    buffer already holds `max_buffered` entries or `max_buffered_bytes` of
+    bodies; a thread encodes and writes the buffered entries, so that the
+    requests never wait for the disk. `name.jsonl` is the current file,
+    `name.1.jsonl` the previous one and so on, up to `max_files`.
+
+    Each count is only updated by one thread: `dropped` and the bytes
+    buffered by the event loop, `written`, `failed` and the bytes taken out
+    of the buffer by the writer.
+    """
+
+    def __init__(
+        self,
+        directory: Path,
+        name: str,
+        logger: Logger,
+        max_bytes: int,
+        max_files: int,
+        max_buffered: int,
+        max_buffered_bytes: int,
+        flush_interval: float = 0.5,
+    ):
+        self.directory = directory
+        self.name = name
+        self.logger = logger
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_buffered = max_buffered
+        self.max_buffered_bytes = max_buffered_bytes
+        self.flush_interval = flush_interval
+        # entries along with the size of their bodies
+        self._buffer: deque[tuple[dict, int]] = deque()
+        self._bytes_in = 0
+        self._bytes_out = 0
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread: threading.Thread | None = None
+        self._file = None
+        self.dropped = 0
+        self.written = 0
+        self.failed = 0
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"{self.name}.jsonl"
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(self.path, 'ab')
+        self._stopping = False
+        self._thread = threading.Thread(target=self._write_forever, name='traffic-journal', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Writes what is still buffered and closes the file."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        self._file.close()
+        self._file = None
+
+    @property
+    def buffered_bytes(self) -> int:
+        return self._bytes_in - self._bytes_out
+
+    def record(self, entry: dict):
+        size = len(entry.get('body') or b'') + len(entry.get('response_body') or b'')
+        if (
+            self._thread is None
+            or len(self._buffer) >= self.max_buffered
+            or self.buffered_bytes + size > self.max_buffered_bytes
+        ):
+            self.dropped += 1
+            return
+        self._bytes_in += size
+        self._buffer.append((entry, size))
+        if len(self._buffer) >= self.max_buffered // 2 or self.buffered_bytes >= self.max_buffered_bytes // 2:
+            self._wakeup.set()
+
+    def _write_forever(self):
+        while not self._stopping:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        lines = []
+        while self._buffer:
+            entry, size = self._buffer.popleft()
+            self._bytes_out += size
+            lines.append(_encode(entry))
+        if not lines:
+            return
+        try:
+            self._file.write(b''.join(lines))
+            self._file.flush()
+            self.written += len(lines)
+            if self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            self.failed += len(lines)
+            self.logger.error(f"Could not write the traffic journal: {e}")
+
+    def _rotate(self):
+        self._file.close()
+        for index in range(self.max_files - 1, 0, -1):
+            source = self.path if index == 1 else self.directory / f"{self.name}.{index - 1}.jsonl"
+            if source.exists():
+                os.replace(source, self.directory / f"{self.name}.{index}.jsonl")
+        if self.max_files <= 1:
+            os.remove(self.path)
+        self._file = open(self.path, 'ab')
+
+
+def _encode(entry: dict) -> bytes:
+    """Decodes the body, if JSON, so that the journal stays readable; otherwise keeps it as base64."""
+    created = entry.pop('response_body', None)
+    if created:
+        # the id of a new service, so that a replay can map it to the one it creates
+        try:
+            entry['created_id'] = json.loads(created)['id']
+        except (ValueError, KeyError, TypeError):
+            pass
+    body = entry.pop('body', None)
+    if body:
+        try:
+            if not entry.get('content_type', '').startswith('application/json'):
+                raise ValueError
+            entry['payload'] = json.loads(body)
+        except ValueError:
+            entry['body_base64'] = base64.b64encode(body).decode()
+    return json.dumps(entry, separators=(',', ':')).encode() + b'\n'
+
+
+class CaptureMiddleware:
+    """Records the requests to the services, along with their status and duration.
+
+    Only the requests under /services are recorded, without their headers, so
+    that no credentials end up in the journal. Bodies larger than `max_body`
+    bytes are left out.
+    """
+
+    def __init__(self, app, journal: TrafficJournal, max_body: int):
+        self.app = app
+        self.journal = journal
+        self.max_body = max_body
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path', '')
+        if scope['type'] != 'http' or not (path == '/services' or path.startswith('/services/')):
+            await self.app(scope, receive, send)
+            return
+
+        started_at = time.perf_counter()
+        entry = {
+            'ts': time.time(),
+            'method': scope['method'],
+            'path': path,
+            'query': scope['query_string'].decode('latin-1'),
+            'service_id': path.split('/')[2] if path.count('/') >= 2 else None,
+            'content_type': '',
+            'status': None,
+        }
+        for name, value in scope['headers']:
+            if name == b'content-type':
+                entry['content_type'] = value.decode('latin-1')
+        chunks = []
+        size = 0
+        creates = scope['method'] == 'POST' and path.rstrip('/') == '/services'
+        response_chunks = []
+
+        async def receive_and_keep():
+            nonlocal size
+            message = await receive()
+            if message['type'] == 'http.request' and size <= self.max_body:
+                chunk = message.get('body', b'')
+                size += len(chunk)
+                chunks.append(chunk)
+            return message
+
+        async def send_and_time(message):
+            if message['type'] == 'http.response.start':
+                entry['status'] = message['status']
+            elif creates and message['type'] == 'http.response.body':
+                response_chunks.append(message.get('body', b''))
+            await send(message)
+            if message['type'] == 'http.response.body' and not message.get('more_body', False):
+                entry['duration'] = time.perf_counter() - started_at
+
+        try:
+            await self.app(scope, receive_and_keep, send_and_time)
+        finally:
+            if 'duration' not in entry:
+                entry['duration'] = time.perf_counter() - started_at
+            if size > self.max_body:
+                entry['truncated'] = True
+            else:
+                entry['body'] = b''.join(chunks)
+            if response_chunks:
+                entry['response_body'] = b''.join(response_chunks)
+            self.journal.record(entry)
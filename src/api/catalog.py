@@ -0,0 +1,148 @@
+import base64
+import bisect
+import hashlib
+import re
+import secrets
+
+from .schema import Service
+
+SUMMARY_FIELDS = ('id', 'name', 'description', 'thumbnail_url')
+PROJECTABLE_FIELDS = ('id',) + tuple(Service.model_fields)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text: str | None) -> set[str]:
+    return set(TOKEN_PATTERN.findall(text.lower())) if text else set()
+
+
+def encode_cursor(id: str) -> str:
+    return base64.urlsafe_b64encode(id.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> str:
+    # a cursor that does not decode to an id must not restart from the first page
+    try:
+        id = base64.b64decode(cursor.encode(), altchars=b'-_', validate=True).decode()
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not id or not id.isprintable():
+        raise ValueError("Invalid cursor")
+    return id
+
+
+class ServiceCatalog:
+    """Read-optimized view of the services, used by the listing endpoints.
+
+    Keeps the ids in sorted order for cursor pagination, an inverted index
+    over the words of name and description for search, and the ETag of each
+    service. Must be told about every create, patch and delete.
+    """
+
+    def __init__(self):
+        # changes on every restart, so that ETags of different runs never match
+        self._epoch = secrets.token_hex(4)
+        self.version = 0
+        self._services: dict[str, Service] = {}
+        self._ids: list[str] = []
+        self._index: dict[str, set[str]] = {}
+        self._vocabulary: list[str] = []
+        self._tokens: dict[str, set[str]] = {}
+        self._etags: dict[str, str] = {}
+
+    @property
+    def etag(self) -> str:
+        return f'"{self._epoch}-{self.version}"'
+
+    def etag_of(self, id: str) -> str | None:
+        return self._etags.get(id)
+
+    def rebuild(self, services: dict[str, Service]):
+        self._services = {}
+        self._ids = []
+        self._index = {}
+        self._vocabulary = []
+        self._tokens = {}
+        self._etags = {}
+        for id, service in services.items():
+            self.put(id, service)
+
+    def put(self, id: str, service: Service):
+        if id in self._services:
+            self._unindex(id)
+        else:
+            bisect.insort(self._ids, id)
+        self._services[id] = service
+        self._etags[id] = '"' + hashlib.sha1(service.model_dump_json().encode()).hexdigest() + '"'
+
+        tokens = tokenize(service.name) | tokenize(service.description)
+        self._tokens[id] = tokens
+        for token in tokens:
+            ids = self._index.get(token)
+            if ids is None:
+                ids = self._index[token] = set()
+                bisect.insort(self._vocabulary, token)
+            ids.add(id)
+        self.version += 1
+
+    def remove(self, id: str):
+        if id not in self._services:
+            return
+        self._unindex(id)
+        del self._services[id]
+        del self._etags[id]
+        self._ids.pop(bisect.bisect_left(self._ids, id))
+        self.version += 1
+
+    def _unindex(self, id: str):
+        for token in self._tokens.pop(id, ()):
+            ids = self._index[token]
+            ids.discard(id)
+            if not ids:
+                del self._index[token]
+                self._vocabulary.pop(bisect.bisect_left(self._vocabulary, token))
+
+    def _match_prefix(self, prefix: str) -> set[str]:
+        matches: set[str] = set()
+        start = bisect.bisect_left(self._vocabulary, prefix)
+        for token in self._vocabulary[start:]:
+            if not token.startswith(prefix):
+                break
+            matches |= self._index[token]
+        return matches
+
+    def search(self, query: str) -> set[str]:
+        """Ids of the services having, for each word of the query, a word starting with it."""
+        result: set[str] | None = None
+        for token in tokenize(query):
+            matches = self._match_prefix(token)
+            result = matches if result is None else result & matches
+            if not result:
+                return set()
+        return result if result is not None else set(self._ids)
+
+    def page(
+        self,
+        cursor: str | None = None,
+        limit: int | None = None,
+        query: str | None = None,
+        fields: tuple[str, ...] = SUMMARY_FIELDS,
+    ) -> tuple[list[dict], str | None]:
+        """Returns the projected services after `cursor`, in id order, and the next cursor."""
+        start = bisect.bisect_right(self._ids, decode_cursor(cursor)) if cursor is not None else 0
+        matches = self.search(query) if query else None
+
+        items = []
+        last_id = None
+        for id in self._ids[start:]:
+            if matches is not None and id not in matches:
+                continue
+            if limit is not None and len(items) == limit:
+                return items, encode_cursor(last_id)
+            items.append(self._project(id, fields))
+            last_id = id
+        return items, None
+
+    def _project(self, id: str, fields: tuple[str, ...]) -> dict:
+        service = self._services[id]
+        return {field: id if field == 'id' else getattr(service, field) for field in fields}
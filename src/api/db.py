@@ -1,46 +1,148 @@
+import asyncio
 import os
-import json
 import random
 import string
 
 from logging import Logger
 
+from .. import config
 from . import paths
 from .schema import Service
+from .storage import JsonStore, LogStore, ServiceStore, SqliteStore
 
 RANDOM_STRING_CHARS = string.ascii_letters + string.digits
 
-def save_services(logger: Logger, services: dict[str, Service]):
-    try:
+_store: ServiceStore | None = None
+# version of the latest change of the store reflected in the services of this process
+_synced_version = 0
+# writes run in a thread, one at a time, so that they reach the store in order
+_write_lock = asyncio.Lock()
+# syncs read the store one at a time, so that an older read is never applied after a newer one
+_sync_lock = asyncio.Lock()
+
+
+def get_store() -> ServiceStore:
+    global _store
+    if _store is None:
         # create directory if doesn't exist already
         os.makedirs(paths.DB_DIR.resolve(), exist_ok=True)
-    except Exception as e:
-        logger.error("error while creating directory", e)
+        if config.SERVICES_DB_BACKEND == 'sqlite':
+            _store = SqliteStore(paths.SERVICES_SQLITE_FILEPATH.resolve())
+        elif config.SERVICES_DB_BACKEND == 'log':
+            _store = LogStore(paths.SERVICES_LOG_FILEPATH.resolve())
+        else:
+            _store = JsonStore(paths.SERVICES_DB_FILEPATH.resolve())
+    return _store
+
+
+def set_store(store: ServiceStore):
+    """Replaces the store, e.g. to keep benchmarks away from the real database."""
+    global _store
+    close_store()
+    _store = store
+
+
+def close_store():
+    global _store
+    if _store is not None:
+        _store.close()
+        _store = None
 
+
+def save_services(logger: Logger, services: dict[str, Service]):
+    store = get_store()
+    # every change of a shared store is already persisted; saving this copy
+    # would overwrite the changes made by other processes in the meantime
+    if store.shared:
+        return
     try:
-        # save the services dictionary to file
-        with open(paths.SERVICES_DB_FILEPATH.resolve(), "w") as file:
-            json.dump({k: v.model_dump() for k, v in services.items()}, file)
+        store.save(services)
     except Exception as e:
-        logger.error("error while writing database", e)
+        logger.error(f"error while writing database: {e}")
 
 
 def load_services(logger: Logger) -> dict[str, Service]:
+    """Loads the services; raises if they cannot be read, rather than starting without them."""
+    global _synced_version
+    try:
+        store = get_store()
+        # read before loading: changes made in between are replayed by the next sync
+        _synced_version = store.version()
+        services = store.load()
+        # first run on a new backend: import the services of the json file
+        if not services and not isinstance(store, JsonStore) \
+                and os.path.exists(paths.SERVICES_DB_FILEPATH.resolve()):
+            logger.info(f"Importing {paths.SERVICES_DB_FILEPATH} into the {config.SERVICES_DB_BACKEND} database")
+            services = JsonStore(paths.SERVICES_DB_FILEPATH.resolve()).load()
+            store.save(services)
+        return services
+    except Exception as e:
+        logger.error(f"error while reading database: {e}")
+        raise
+
 
-    # if there is no services file, return empty dict 
-    if not os.path.exists(paths.SERVICES_DB_FILEPATH.resolve()):
-        return {}
-    # otherwise, try to read its contents
+def _read_changes(store: ServiceStore, version: int):
+    """The latest version and the changes after `version`, or every stored service if they cannot be replayed."""
+    latest, changes = store.changes_since(version)
+    if changes is None:
+        return latest, None, store.load()
+    return latest, changes, None
+
+
+async def sync_services(
+    logger: Logger,
+    services: dict[str, Service],
+) -> list[tuple[str, Service | None]]:
+    """Applies the changes made to the store by other processes to `services`, in place.
+
+    The store is read in a thread, since it may wait for the locks of other
+    processes; only the changes are applied on the event loop. Returns the
+    services that changed, with their new value or None if deleted.
+    """
+    global _synced_version
+    async with _sync_lock:
+        try:
+            latest, changes, stored = await asyncio.to_thread(_read_changes, get_store(), _synced_version)
+        except Exception as e:
+            logger.error(f"error while syncing database: {e}")
+            return []
+        if changes is None:
+            changes = [(id, None) for id in services if id not in stored] + list(stored.items())
+        _synced_version = latest
+
+        applied = []
+        for id, service in changes:
+            # changes made by this process are already applied
+            if services.get(id) == service:
+                continue
+            if service is None:
+                services.pop(id, None)
+            else:
+                services[id] = service
+            applied.append((id, service))
+        return applied
+
+
+def compact_services(logger: Logger):
     try:
-        with open(paths.SERVICES_DB_FILEPATH.resolve(), "r") as file:
-            data = json.load(file)
-            return {k: Service.model_validate(v) for k, v in data.items()}
+        store = get_store()
+        if isinstance(store, LogStore) and store.garbage_ratio < config.SERVICES_DB_COMPACT_RATIO:
+            return
+        store.compact()
     except Exception as e:
-        logger.error(e)
-        return {}
+        logger.error(f"error while compacting database: {e}")
+
 
+async def _write(logger: Logger, message: str, write, *args):
+    async with _write_lock:
+        try:
+            await asyncio.to_thread(write, *args)
+        except Exception as e:
+            logger.error(f"{message}: {e}")
+            raise
 
-def create_service(
+
+async def create_service(
     logger: Logger,
     services: dict[str, Service],
     new_service: Service,
@@ -59,6 +161,43 @@ def create_service(
     if not id:
         logger.error("Exceded maximum number of attemps while generating unique ID for a service")
         return None
-    # update the dictionary in place
-    services[id] = new_service
+    # update the dictionary in place and persist the new service
+    await update_service(logger, services, id, new_service)
     return id
+
+
+async def update_service(
+    logger: Logger,
+    services: dict[str, Service],
+    id: str,
+    service: Service,
+):
+    """Raises if the service cannot be persisted, leaving `services` as it was."""
+    previous = services.get(id)
+    services[id] = service
+    try:
+        await _write(logger, f"error while writing service {id}", get_store().put, id, service)
+    except Exception:
+        # the registry must not differ from what is stored
+        if previous is None:
+            services.pop(id, None)
+        else:
+            services[id] = previous
+        raise
+
+
+async def delete_service(
+    logger: Logger,
+    services: dict[str, Service],
+    id: str,
+) -> Service | None:
+    """Raises if the deletion cannot be persisted, leaving `services` as it was."""
+    removed = services.pop(id, None)
+    if removed is None:
+        return None
+    try:
+        await _write(logger, f"error while deleting service {id}", get_store().delete, id)
+    except Exception:
+        services[id] = removed
+        raise
+    return removed
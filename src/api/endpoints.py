@@ -0,0 +1,111 @@
+import asyncio
+import http.client
+import socket
+import time
+from dataclasses import dataclass, field
+from logging import Logger
+from urllib.parse import urlparse
+
+
+@dataclass
+class Endpoint:
+    url: str
+    scheme: str = ''
+    hostname: str = ''
+    port: int = 0
+    addresses: tuple[str, ...] = ()
+    is_self: bool = False                   # the url points back to this server
+    error: str | None = None                # why the url cannot be used, if so
+    resolved_at: float = field(default_factory=time.monotonic)
+
+
+def parse_endpoint(url: str) -> Endpoint:
+    parsed_url = urlparse(url)
+    if not parsed_url.scheme or not parsed_url.netloc:
+        return Endpoint(url=url, error="Executable URL is invalid.")
+
+    try:
+        port = parsed_url.port
+    except ValueError:
+        return Endpoint(url=url, error="Executable URL is invalid.")
+    if not port:
+        if parsed_url.scheme == "http":
+            port = http.client.HTTP_PORT
+        elif parsed_url.scheme == "https":
+            port = http.client.HTTPS_PORT
+        else:
+            port = 0
+
+    return Endpoint(
+        url=url,
+        scheme=parsed_url.scheme,
+        hostname=parsed_url.hostname if parsed_url.hostname else '',
+        port=port,
+    )
+
+
+class EndpointResolver:
+    """Resolves the executable urls of the services ahead of the calls.
+
+    The parsed url, its addresses and whether it loops back to this server
+    are computed when a service is loaded, created or patched, and kept
+    until the DNS cache entry expires; stale endpoints are still served
+    while they are refreshed in the background.
+    """
+
+    def __init__(self, this_host: str, this_port: int, ttl: float, logger: Logger):
+        self.this_host = this_host
+        self.this_port = int(this_port)
+        self.ttl = ttl
+        self.logger = logger
+        self._endpoints: dict[str, Endpoint] = {}
+        self._dns: dict[str, tuple[float, tuple[str, ...]]] = {}
+        self._refreshing: dict[str, asyncio.Task] = {}
+
+    async def resolve_host(self, hostname: str) -> tuple[str, ...]:
+        cached = self._dns.get(hostname)
+        if cached is not None and cached[0] > time.monotonic():
+            return cached[1]
+
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(hostname, None, proto=socket.IPPROTO_TCP)
+            addresses = tuple(sorted({info[4][0] for info in infos}))
+        except OSError as e:
+            self.logger.error(f"Could not resolve {hostname}: {e}")
+            addresses = ()
+
+        self._dns[hostname] = (time.monotonic() + self.ttl, addresses)
+        return addresses
+
+    async def refresh(self, url: str) -> Endpoint:
+        endpoint = parse_endpoint(url)
+        if endpoint.error is None:
+            addresses, this_addresses = await asyncio.gather(
+                self.resolve_host(endpoint.hostname),
+                self.resolve_host(self.this_host),
+            )
+            endpoint.addresses = addresses
+            endpoint.is_self = (
+                endpoint.port == self.this_port
+                and not set(addresses).isdisjoint(this_addresses)
+            )
+        self._endpoints[url] = endpoint
+        return endpoint
+
+    async def refresh_all(self, urls: list[str]):
+        await asyncio.gather(*[self.refresh(url) for url in set(urls)])
+
+    async def get(self, url: str) -> Endpoint:
+        endpoint = self._endpoints.get(url)
+        if endpoint is None:
+            return await self.refresh(url)
+
+        if time.monotonic() - endpoint.resolved_at > self.ttl and url not in self._refreshing:
+            task = asyncio.create_task(self.refresh(url))
+            self._refreshing[url] = task
+            task.add_done_callback(lambda _: self._refreshing.pop(url, None))
+        return endpoint
+
+    def forget(self, url: str):
+        self._endpoints.pop(url, None)
@@ -0,0 +1,393 @@
+import asyncio
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from logging import Logger
+from pathlib import Path
+from typing import Awaitable, Callable
+
+from .schema import ServiceOutput
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+@dataclass
+class Job:
+    id: str
+    service_id: str
+    owner: str                                  # github id of the user who submitted the job
+    payload: dict
+    status: str = QUEUED
+    status_code: int | None = None              # what /use would have answered
+    output: dict | None = None
+    errors: list = field(default_factory=list)
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    expires_at: float | None = None             # once finished, the job is forgotten at this time
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def snapshot(self) -> dict:
+        return {
+            'job_id': self.id,
+            'service_id': self.service_id,
+            'status': self.status,
+            'status-code': self.status_code,
+            'output': self.output,
+            'errors': self.errors,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'expires_at': self.expires_at,
+        }
+
+
+class SharedJobs:
+    """A copy of the jobs in SQLite, so that every worker can answer for any job.
+
+    Its methods may wait for the locks of other workers: call them off the event loop.
+    """
+
+    def __init__(self, path: Path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, owner TEXT NOT NULL, data TEXT NOT NULL, expires_at REAL)"
+        )
+        # cancellations asked to a worker other than the one running the job
+        self._conn.execute("CREATE TABLE IF NOT EXISTS cancels (id TEXT PRIMARY KEY)")
+
+    def put_many(self, jobs: list[tuple[str, str, dict, float | None]], purge: bool = False):
+        """Writes the snapshots of several jobs, given with their id, owner and expiry, in one transaction.
+
+        With `purge`, the expired jobs are also deleted.
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO jobs (id, owner, data, expires_at) VALUES (?, ?, ?, ?)",
+                    [(id, owner, json.dumps(snapshot), expires_at) for id, owner, snapshot, expires_at in jobs],
+                )
+                if purge:
+                    self._purge()
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, job_id: str) -> tuple[str, dict] | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner, data FROM jobs WHERE id = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (job_id, time.time()),
+            ).fetchone()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def request_cancel(self, job_id: str):
+        with self._lock:
+            self._conn.execute("INSERT OR IGNORE INTO cancels (id) VALUES (?)", (job_id,))
+
+    def take_cancel_requests(self, job_ids: set[str]) -> set[str]:
+        """Returns the cancellations asked for among `job_ids`, and forgets them."""
+        with self._lock:
+            requested = {row[0] for row in self._conn.execute("SELECT id FROM cancels").fetchall()} & job_ids
+            self._conn.executemany("DELETE FROM cancels WHERE id = ?", [(id,) for id in requested])
+        return requested
+
+    def _purge(self):
+        self._conn.execute("DELETE FROM jobs WHERE expires_at <= ?", (time.time(),))
+        self._conn.execute("DELETE FROM cancels WHERE id NOT IN (SELECT id FROM jobs)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class JobManager:
+    """Runs service calls in the background, for clients to fetch their results later.
+
+    At most `workers` jobs run at once, and at most `service_concurrency(id)`
+    of the same service, so that a slow service cannot hold every worker.
+    Jobs of a busy service wait for it without taking a worker. Results are
+    kept for `ttl` seconds after the job finishes.
+
+    With `shared`, the jobs of every worker can be read and cancelled from
+    any of them; a worker checks every `cancel_interval` seconds whether the
+    others were asked to cancel one of its jobs. The shared copy is only
+    accessed from threads: the changes of the jobs are written by a task,
+    several at a time, while a new job is written before its id is returned.
+    """
+
+    def __init__(
+        self,
+        execute: Callable[[Job], Awaitable[tuple[int, ServiceOutput]]],
+        logger: Logger,
+        workers: int,
+        service_concurrency: Callable[[str], int],
+        max_queued: int,
+        ttl: float,
+        shared: SharedJobs | None = None,
+        cancel_interval: float = 0.25,
+    ):
+        self.execute = execute
+        self.logger = logger
+        self.workers = workers
+        self.service_concurrency = service_concurrency
+        self.max_queued = max_queued
+        self.ttl = ttl
+        self.shared = shared
+        self.cancel_interval = cancel_interval
+        self._cancel_watch: asyncio.Task | None = None
+        # snapshots of the jobs changed since the shared copy was last written
+        self._unsaved: dict[str, tuple[str, str, dict, float | None]] = {}
+        self._purge_shared = False
+        self._writer: asyncio.Task | None = None
+        self._unsaved_event: asyncio.Event | None = None
+        self._write_lock: asyncio.Lock | None = None
+        self._jobs: dict[str, Job] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._changed: dict[str, asyncio.Event] = {}
+        # finished jobs by expiry time, which is also the order they finished in
+        self._expiry: deque[tuple[float, str]] = deque()
+        self._slots: asyncio.Semaphore | None = None
+        self._service_slots: dict[str, tuple[int, asyncio.Semaphore]] = {}
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    async def submit(self, service_id: str, owner: str, payload: dict) -> Job:
+        self._purge()
+        if len(self._tasks) >= self.max_queued:
+            raise JobQueueFull(f"Too many pending jobs (max {self.max_queued})")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+        job = Job(id=secrets.token_urlsafe(12), service_id=service_id, owner=owner, payload=payload)
+        self._jobs[job.id] = job
+        self._changed[job.id] = asyncio.Event()
+        self._save(job)
+        task = asyncio.create_task(self._run(job))
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+        if self.shared is not None:
+            if self._cancel_watch is None or self._cancel_watch.done():
+                self._cancel_watch = asyncio.create_task(self._watch_cancels())
+            # the other workers must know the job as soon as its id is known
+            await self._write_shared()
+        return job
+
+    async def get(self, job_id: str, owner: str) -> dict | None:
+        """The snapshot of a job of `owner`, or None if unknown, expired or not theirs."""
+        self._purge()
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.snapshot() if job.owner == owner else None
+        if self.shared is not None:
+            stored = await asyncio.to_thread(self.shared.get, job_id)
+            if stored is not None and stored[0] == owner:
+                return stored[1]
+        return None
+
+    async def wait(self, job_id: str, owner: str, timeout: float, status: str | None = None) -> dict | None:
+        """Returns the snapshot of the job once it finishes, or after `timeout` seconds.
+
+        If `status` is given, the snapshot is returned as soon as the job
+        leaves that status instead, and right away if it is not in it.
+        """
+        snapshot = await self.get(job_id, owner)
+        if snapshot is None or snapshot['status'] in FINISHED:
+            return snapshot
+        if status is not None and snapshot['status'] != status:
+            return snapshot
+
+        def done(current: dict | None) -> bool:
+            if current is None or current['status'] in FINISHED:
+                return True
+            return status is not None and current['status'] != status
+
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            event = self._changed.get(job_id)
+            if event is not None:
+                try:
+                    await asyncio.wait_for(event.wait(), remaining)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                # a job of another worker: poll the shared copy
+                await asyncio.sleep(min(0.25, remaining))
+            current = await self.get(job_id, owner)
+            if done(current):
+                return current
+            snapshot = current
+        return snapshot
+
+    async def cancel(self, job_id: str, owner: str) -> tuple[dict, bool] | None:
+        """Cancels a job of `owner`; returns its snapshot, and whether it was cancelled here.
+
+        A job running on another worker is only asked to cancel: that worker
+        cancels it shortly after, which the status of the job will show.
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            if job.owner != owner:
+                return None
+            task = self._tasks.get(job_id)
+            if task is not None:
+                task.cancel()
+            return job.snapshot(), True
+        snapshot = await self.get(job_id, owner)
+        if snapshot is None:
+            return None
+        if snapshot['status'] in FINISHED:
+            return snapshot, True
+        try:
+            await asyncio.to_thread(self.shared.request_cancel, job_id)
+        except Exception as e:
+            self.logger.error(f"error while sharing the cancellation of job {job_id}: {e}")
+            raise
+        return snapshot, False
+
+    async def _watch_cancels(self):
+        while self._tasks:
+            await asyncio.sleep(self.cancel_interval)
+            try:
+                requested = await asyncio.to_thread(self.shared.take_cancel_requests, set(self._tasks))
+            except Exception as e:
+                self.logger.error(f"error while reading shared cancellations: {e}")
+                continue
+            for job_id in requested:
+                task = self._tasks.get(job_id)
+                if task is not None:
+                    task.cancel()
+
+    async def _run(self, job: Job):
+        try:
+            limit = self.service_concurrency(job.service_id)
+            cached = self._service_slots.get(job.service_id)
+            # a new limit takes new slots; running jobs release the old ones
+            if cached is None or cached[0] != limit:
+                cached = self._service_slots[job.service_id] = (limit, asyncio.Semaphore(limit))
+            async with cached[1], self._slots:
+                self._update(job, status=RUNNING, started_at=time.time())
+                status_code, output = await self.execute(job)
+            self._finish(
+                job,
+                SUCCEEDED if status_code < 400 else FAILED,
+                status_code,
+                output=output.output if len(output.errors) == 0 else None,
+                errors=output.errors,
+            )
+        except asyncio.CancelledError:
+            self._finish(job, CANCELLED, None, errors=["Job was cancelled."])
+        except Exception as e:
+            self.logger.error(f"Job {job.id} on service {job.service_id} failed: {e}")
+            self._finish(job, FAILED, 500, errors=[str(e)])
+
+    def _finish(self, job: Job, status: str, status_code: int | None, output: dict | None = None, errors: list | None = None):
+        now = time.time()
+        self._update(
+            job,
+            status=status,
+            status_code=status_code,
+            output=output,
+            errors=errors or [],
+            finished_at=now,
+            expires_at=now + self.ttl,
+        )
+        # the payload is no longer needed
+        job.payload = {}
+        self._expiry.append((time.monotonic() + self.ttl, job.id))
+
+    def _update(self, job: Job, **changes):
+        for name, value in changes.items():
+            setattr(job, name, value)
+        self._save(job)
+        # wake up the waiters, and give the next ones a fresh event
+        event = self._changed.get(job.id)
+        if event is not None:
+            event.set()
+            self._changed[job.id] = asyncio.Event()
+
+    def _save(self, job: Job):
+        if self.shared is None:
+            return
+        self._unsaved[job.id] = (job.id, job.owner, job.snapshot(), job.expires_at)
+        self._wake_writer()
+
+    def _wake_writer(self):
+        if self._writer is None or self._writer.done():
+            self._unsaved_event = asyncio.Event()
+            self._write_lock = asyncio.Lock()
+            self._writer = asyncio.create_task(self._write_forever())
+        self._unsaved_event.set()
+
+    async def _write_forever(self):
+        while True:
+            await self._unsaved_event.wait()
+            self._unsaved_event.clear()
+            await self._write_shared()
+
+    async def _write_shared(self):
+        # one write at a time, so that a job is never written over by an older snapshot
+        async with self._write_lock:
+            jobs = list(self._unsaved.values())
+            purge = self._purge_shared
+            self._unsaved.clear()
+            self._purge_shared = False
+            if not jobs and not purge:
+                return
+            try:
+                await asyncio.to_thread(self.shared.put_many, jobs, purge)
+            except Exception as e:
+                self.logger.error(f"error while sharing jobs: {e}")
+
+    def _purge(self):
+        now = time.monotonic()
+        purged = False
+        while self._expiry and self._expiry[0][0] <= now:
+            _, job_id = self._expiry.popleft()
+            self._jobs.pop(job_id, None)
+            self._changed.pop(job_id, None)
+            purged = True
+        if purged and self.shared is not None:
+            self._purge_shared = True
+            self._wake_writer()
+
+    async def stop(self):
+        if self._cancel_watch is not None:
+            self._cancel_watch.cancel()
+        tasks = list(self._tasks.values())
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self._writer is not None:
+            # not in the middle of a write
+            async with self._write_lock:
+                self._writer.cancel()
+            await asyncio.gather(self._writer, return_exceptions=True)
+            # the final status of the cancelled jobs
+            await self._write_shared()
+            self._writer = None
+        if self.shared is not None:
+            self.shared.close()
@@ -1,60 +1,213 @@
+from ..startup import StartupProfile
+
+# created first, so that the profile covers the imports below
+PROFILE = StartupProfile()
+
+import asyncio
+import json
 import logging
+import math
+import os
 
 from contextlib import asynccontextmanager
 from http import HTTPStatus
-from typing import Annotated
+from typing import Annotated, AsyncIterator, Literal
 from pydantic import ValidationError
 
 from starlette.middleware.sessions import SessionMiddleware
 
-from authlib.integrations.starlette_client import OAuth
-
-from fastapi import FastAPI, Depends, HTTPException, Path, Request
+from fastapi import FastAPI, Depends, HTTPException, Path, Query, Request, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 
-from .utils import validate_url
+from .utils import iter_ndjson, parse_json_object, validate_url
 from .auth import (
-    integrate_github_auth,
+    API_KEYS,
+    get_oauth,
     get_current_github_user,
 )
 from .schema import (
+    APIKeyRequest,
+    GitHubUser,
     User,
-    Service
+    Service,
+    ServiceOutput,
 )
 
 from .. import config
-from . import db
-from .services import serve
+from ..metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from . import db, upstream
+from .monitoring import REGISTRY, STREAM_SESSIONS, STREAM_SUPERSEDED
+from . import paths
+from .balancer import replica_urls
+from .capture import CaptureMiddleware, TrafficJournal
+from .catalog import PROJECTABLE_FIELDS, SUMMARY_FIELDS, ServiceCatalog
+from .jobs import FINISHED, Job, JobManager, JobQueueFull, SharedJobs
+from .resilience import ServiceUnavailable
+from .services import ENDPOINTS, GUARDS, REPLICAS, RESPONSE_CACHE, VALIDATORS, serve, serve_cached, serve_many
 
 
 SERVICES_DB: dict[str, Service] = {}
+# indexes of SERVICES_DB for listing and search, kept in sync on every change
+CATALOG = ServiceCatalog()
 
 logger = logging.getLogger("uvicorn")
 
+
+async def _execute_job(job: Job) -> tuple[int, ServiceOutput]:
+    service = SERVICES_DB.get(job.service_id)
+    if not service:
+        return HTTPStatus.NOT_FOUND, ServiceOutput(errors=[f"Service with id {job.service_id} not found"])
+    try:
+        output = await serve_cached(job.service_id, service, job.payload, logger)
+    except ServiceUnavailable as e:
+        return HTTPStatus.SERVICE_UNAVAILABLE, ServiceOutput(errors=[str(e)])
+    return (HTTPStatus.OK if len(output.errors) == 0 else HTTPStatus.UNPROCESSABLE_ENTITY), output
+
+
+def _job_concurrency(service_id: str) -> int:
+    service = SERVICES_DB.get(service_id)
+    if service is not None and service.max_concurrency:
+        return min(service.max_concurrency, config.JOBS_SERVICE_CONCURRENCY)
+    return config.JOBS_SERVICE_CONCURRENCY
+
+
+JOBS = JobManager(
+    execute=_execute_job,
+    logger=logger,
+    workers=config.JOBS_WORKERS,
+    service_concurrency=_job_concurrency,
+    max_queued=config.JOBS_MAX_QUEUED,
+    ttl=config.JOBS_TTL,
+    # with several workers, a job may be asked for to any of them
+    shared=SharedJobs(paths.JOBS_SQLITE_FILEPATH.resolve()) if config.API_WORKERS > 1 else None,
+)
+REGISTRY.gauge(
+    'gateway_jobs_pending',
+    'Jobs queued or running.',
+    collect=lambda: {(): JOBS.pending},
+)
+
+JOURNAL = TrafficJournal(
+    paths.CAPTURE_DIR.resolve(),
+    # with several workers, each one writes its own files
+    name='traffic' if config.API_WORKERS == 1 else f"traffic-{os.getpid()}",
+    logger=logger,
+    max_bytes=config.CAPTURE_MAX_BYTES,
+    max_files=config.CAPTURE_MAX_FILES,
+    max_buffered=config.CAPTURE_MAX_BUFFERED,
+    max_buffered_bytes=config.CAPTURE_MAX_BUFFERED_BYTES,
+)
+# read from the counts of the journal, which its writer thread updates
+REGISTRY.counter(
+    'gateway_capture_recorded_total',
+    'Requests written to the traffic journal.',
+    collect=lambda: {(): JOURNAL.written},
+)
+REGISTRY.counter(
+    'gateway_capture_dropped_total',
+    'Requests left out of the traffic journal, because its buffer was full or it could not be written.',
+    collect=lambda: {(): JOURNAL.dropped + JOURNAL.failed},
+)
+
 # setup lifespan
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Context manager to handle application lifespan events.
 
-    Used to load the database into memory.
+    Used to load the database into memory and to open the pool of
+    connections towards the services. Changes are persisted as they happen;
+    the database is compacted periodically and, unless it is shared with
+    other workers, saved again on shutdown.
+
+    In production, the slower warm-up steps run in the background, while
+    /ready reports that the application is not ready yet.
     """
     global SERVICES_DB
 
+    PROFILE.mark("import")
     logger.info("Loading database...")
-    SERVICES_DB = db.load_services(logger)
+    with PROFILE.phase("load services"):
+        SERVICES_DB = db.load_services(logger)
+        CATALOG.rebuild(SERVICES_DB)
+        for service_id, service in SERVICES_DB.items():
+            VALIDATORS.get(service_id, service)
+    if config.API_WORKERS > 1 and not db.get_store().shared:
+        logger.warning(
+            f"The {config.SERVICES_DB_BACKEND} database is not shared: "
+            f"each of the {config.API_WORKERS} workers keeps its own services"
+        )
+    compaction = asyncio.create_task(_compact_periodically())
+    sync = asyncio.create_task(_sync_periodically())
+    upstream.start_client()
+    if config.CAPTURE_TRAFFIC:
+        JOURNAL.start()
+
+    if config.PRODUCTION:
+        warm_up = PROFILE.warm_up_in_background(_warm_up(), logger)
+    else:
+        warm_up = None
+        await _warm_up()
 
     yield
 
+    if warm_up is not None:
+        warm_up.cancel()
+    compaction.cancel()
+    sync.cancel()
+    await JOBS.stop()
+    await upstream.close_client()
+    JOURNAL.stop()
     logger.info("Saving database...")
     db.save_services(logger, SERVICES_DB)
+    db.close_store()
+
+
+async def _warm_up():
+    with PROFILE.phase("resolve endpoints"):
+        await ENDPOINTS.refresh_all([
+            url for service in SERVICES_DB.values() for url in replica_urls(service)
+        ])
+    if config.PRODUCTION:
+        await asyncio.to_thread(PROFILE.import_module, "authlib.integrations.starlette_client")
+        get_oauth(config.configDict)
+    PROFILE.mark_ready()
+    logger.info(f"Startup profile: {json.dumps(PROFILE.report())}")
 
 
+async def _compact_periodically():
+    while True:
+        await asyncio.sleep(config.SERVICES_DB_COMPACT_INTERVAL)
+        await asyncio.to_thread(db.compact_services, logger)
+
+
+async def _sync_periodically():
+    if not db.get_store().shared:
+        return
+    while True:
+        await asyncio.sleep(config.SERVICES_DB_SYNC_INTERVAL)
+        await _sync_services()
+
+
+async def _sync_services():
+    """Applies the changes made by other workers, along with everything derived from the services."""
+    changes = await db.sync_services(logger, SERVICES_DB)
+    for service_id, service in changes:
+        RESPONSE_CACHE.invalidate(service_id)
+        GUARDS.forget(service_id)
+        if service is None:
+            CATALOG.remove(service_id)
+            REPLICAS.forget(service_id)
+            VALIDATORS.forget(service_id)
+        else:
+            CATALOG.put(service_id, service)
+            VALIDATORS.get(service_id, service)
+    urls = [url for service_id, service in changes if service is not None for url in replica_urls(service)]
+    if urls:
+        await ENDPOINTS.refresh_all(urls)
+
 
-# setup github oauth app
-oauth = OAuth(config.configDict)
-integrate_github_auth(oauth, config.configDict)
 
 # setup FastAPI app
 app = FastAPI(
@@ -78,7 +231,9 @@ app.add_middleware(
 )
 app.add_middleware(
     SessionMiddleware,
-    secret_key="!secret")  # TODO Use a real secret key in production
+    secret_key=config.SESSION_SECRET_KEY)
+if config.CAPTURE_TRAFFIC:
+    app.add_middleware(CaptureMiddleware, journal=JOURNAL, max_body=config.CAPTURE_MAX_BODY)
 
     # mount static files directory
 app.mount("/static", StaticFiles(directory="static"), name="static")
@@ -91,6 +246,37 @@ async def root():
     return {"message": "Hello World"}
 
 
+@app.get("/ready", tags=["Monitoring"])
+async def ready():
+    if not PROFILE.ready:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=PROFILE.report()
+        )
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": PROFILE.report(),
+    }
+
+
+@app.get("/metrics", tags=["Monitoring"])
+async def metrics():
+    """Exposes the metrics of the gateway in the Prometheus text format."""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/stats/cache", tags=["Monitoring"])
+async def cache_stats(
+    current_user: Annotated[str, Depends(get_current_github_user)]
+):
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": RESPONSE_CACHE.stats(),
+    }
+
+
 # ==============================================================
 # AUTHENTICATION
 # ==============================================================
@@ -106,7 +292,7 @@ async def login_with_github(request: Request, next_url: str="/docs"):
     try:
         request.session['nextUrl'] = next_url
         redirect_uri = request.url_for('auth_callback')
-        return await oauth.github.authorize_redirect(request, redirect_uri)
+        return await get_oauth(config.configDict).github.authorize_redirect(request, redirect_uri)
     except Exception as exc:
         logger.error(f"GitHub login error: {exc}")
         raise HTTPException(status_code=401, detail='Login failed while reaching GitHub') 
@@ -115,8 +301,9 @@ async def login_with_github(request: Request, next_url: str="/docs"):
 @app.get('/auth/github', tags=["Auth"])
 async def auth_callback(request: Request):
     try:
-        token = await oauth.github.authorize_access_token(request)
-        github_response = await oauth.github.get('user', token=token)
+        github = get_oauth(config.configDict).github
+        token = await github.authorize_access_token(request)
+        github_response = await github.get('user', token=token)
         github_user_data = github_response.json()
 
         # store user temporarily
@@ -161,6 +348,72 @@ async def read_current_user(
     return current_user
 
 
+def _require_session(request: Request):
+    # a leaked key must not be able to issue more keys
+    if getattr(request.state, "api_key", None) is not None:
+        raise HTTPException(
+            status_code=HTTPStatus.FORBIDDEN,
+            detail="API keys can only be managed from a browser session"
+        )
+
+
+@app.post("/users/me/keys", tags=["Users"])
+async def issue_api_key(
+    current_user: Annotated[GitHubUser, Depends(get_current_github_user)],
+    request: Request,
+    payload: APIKeyRequest,
+):
+    """Issues an api key, to be sent as `Authorization: Bearer <key>`.
+
+    The key is returned only once: only its hash is stored.
+    """
+    _require_session(request)
+    api_key, key = await asyncio.to_thread(
+        API_KEYS.issue, current_user, payload.name, list(payload.scopes), payload.ttl
+    )
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": api_key.model_dump(exclude={"secret_hash"}) | {"key": key},
+    }
+
+
+@app.get("/users/me/keys", tags=["Users"])
+async def list_api_keys(
+    current_user: Annotated[GitHubUser, Depends(get_current_github_user)],
+    request: Request,
+):
+    _require_session(request)
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": [
+            api_key.model_dump(exclude={"secret_hash"})
+            for api_key in await asyncio.to_thread(API_KEYS.list, current_user.github_id)
+        ],
+    }
+
+
+@app.delete("/users/me/keys/{key_id}", tags=["Users"])
+async def revoke_api_key(
+    current_user: Annotated[GitHubUser, Depends(get_current_github_user)],
+    request: Request,
+    key_id: str,
+):
+    _require_session(request)
+    revoked = await asyncio.to_thread(API_KEYS.revoke, current_user.github_id, key_id)
+    if revoked is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail=f"API key with id {key_id} not found"
+        )
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": revoked.model_dump(exclude={"secret_hash"}),
+    }
+
+
 # ==============================================================
 # SERVICES
 # ==============================================================
@@ -169,23 +422,49 @@ async def read_current_user(
 #       However, it is needed for calling Depends, which in turn enforces authentication,
 #       this makes sure that only verified users can call this method
 
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    candidates = [value.strip().removeprefix("W/") for value in if_none_match.split(",")]
+    return "*" in candidates or etag in candidates
+
+
 @app.get("/services", tags=["Services"])
 async def list_available_services(
-    current_user: Annotated[str, Depends(get_current_github_user)]
+    current_user: Annotated[str, Depends(get_current_github_user)],
+    request: Request,
+    response: Response,
+    cursor: Annotated[str | None, Query(description="next_cursor of the previous page")] = None,
+    limit: Annotated[int | None, Query(ge=1, le=1000)] = None,
+    q: Annotated[str | None, Query(description="words to look for in name and description")] = None,
+    fields: Annotated[str | None, Query(description="comma-separated fields to return")] = None,
 ):
-    services_list = []
-    for id, service in SERVICES_DB.items():
-        services_list.append({
-            'id': id,
-            'name': service.name,
-            'description': service.description,
-            'thumbnail_url': service.thumbnail_url
-        }) 
+    etag = CATALOG.etag
+    if _etag_matches(request, etag):
+        return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+
+    projection = SUMMARY_FIELDS
+    if fields:
+        projection = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = [field for field in projection if field not in PROJECTABLE_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail=f"Unknown fields: {', '.join(unknown)}"
+            )
 
+    try:
+        services_list, next_cursor = CATALOG.page(cursor, limit, q, projection)
+    except ValueError as e:
+        raise HTTPException(status_code=HTTPStatus.BAD_REQUEST, detail=str(e))
+
+    response.headers["ETag"] = etag
     return {
         "message": HTTPStatus.OK.phrase,
         "status-code": HTTPStatus.OK,
         "data": services_list,
+        "next_cursor": next_cursor,
     }
 
 
@@ -193,8 +472,14 @@ async def list_available_services(
 async def list_service_info(
     current_user: Annotated[str, Depends(get_current_github_user)],
     service_id: Annotated[str, Path(title="The ID of the item to get")],
+    request: Request,
+    response: Response,
+    stats: bool = False,
 ):
+    """Gets a service; with `stats`, also the load and health of its replicas.
 
+    Replica stats change on every call, so they are never covered by the ETag.
+    """
     service = SERVICES_DB.get(service_id)
     if not service:
         return {
@@ -203,6 +488,21 @@ async def list_service_info(
             "details" : f"Service with id {service_id} not Found"
         }
 
+    if stats:
+        return {
+            "message": HTTPStatus.OK.phrase,
+            "status-code": HTTPStatus.OK,
+            "data": service,
+            "replicas": REPLICAS.stats(service_id, service),
+            "circuit": GUARDS.breaker(service_id).snapshot(),
+        }
+
+    etag = CATALOG.etag_of(service_id)
+    if etag:
+        if _etag_matches(request, etag):
+            return Response(status_code=HTTPStatus.NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+
     return {
         "message": HTTPStatus.OK.phrase,
         "status-code": HTTPStatus.OK,
@@ -210,6 +510,26 @@ async def list_service_info(
     }
 
 
+async def _check_replica_urls(service: Service, message: str):
+    """Rejects replicas that could never be called, so that they are not balanced over."""
+    await ENDPOINTS.refresh_all(service.replica_urls)
+    for url in service.replica_urls:
+        endpoint = await ENDPOINTS.get(url)
+        if endpoint.error or endpoint.is_self:
+            reason = endpoint.error or "it points back to this server."
+            raise HTTPException(
+                status_code=HTTPStatus.BAD_REQUEST,
+                detail=f"{message}: replica {url} is unusable, {reason}"
+            )
+
+
+def _not_persisted(message: str) -> HTTPException:
+    return HTTPException(
+        status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
+        detail=f"{message}: the database could not be written."
+    )
+
+
 @app.post("/services", tags=["Services"])
 async def create_service(
     current_user: Annotated[str, Depends(get_current_github_user)],
@@ -219,7 +539,7 @@ async def create_service(
             {
                 'name': 'Untitled',
                 'description': '',
-                'data_type': '',
+                'data_type': 'number',
             }
         ],
         'description': '',
@@ -231,13 +551,29 @@ async def create_service(
             detail="Payload is required"
         )
 
-    new_service = Service(**payload)
-    new_service_id = db.create_service(logger, SERVICES_DB, new_service)
+    try:
+        new_service = Service.model_validate(payload, context={'strict_data_types': True})
+    except ValidationError:
+        raise HTTPException(
+            status_code=HTTPStatus.BAD_REQUEST,
+            detail="Could not add service: check payload syntax."
+        )
+    await _check_replica_urls(new_service, "Could not add service")
+    # catch up with the other workers, so that the new id does not conflict
+    await _sync_services()
+    try:
+        new_service_id = await db.create_service(logger, SERVICES_DB, new_service)
+    except Exception:
+        raise _not_persisted("Could not add service")
     if not new_service_id:
         raise HTTPException(
             status_code=HTTPStatus.INTERNAL_SERVER_ERROR,
             detail="Could not add service due to conflicting id."
         )
+    CATALOG.put(new_service_id, new_service)
+    VALIDATORS.get(new_service_id, new_service)
+
+    await ENDPOINTS.refresh_all(replica_urls(new_service))
 
     response = new_service.model_dump()
     response['id'] = new_service_id
@@ -249,6 +585,8 @@ async def update_service(
     service_id: Annotated[str, Path(title="The ID of the item to get")],
     payload: dict,
 ):
+    # catch up with the other workers, so that the update applies to the latest version
+    await _sync_services()
     service = SERVICES_DB.get(service_id)
     if not service:
         return {
@@ -259,14 +597,34 @@ async def update_service(
     
     upd_service: Service
     try:
-        upd_service = Service(**{**service.model_dump(), **payload})
+        upd_service = Service.model_validate({**service.model_dump(), **payload}, context={'strict_data_types': True})
     except ValidationError:
         raise HTTPException(
             status_code=HTTPStatus.BAD_REQUEST,
             detail="Could not update service: check payload syntax."
         )
+    await _check_replica_urls(upd_service, "Could not update service")
+
+    try:
+        await db.update_service(logger, SERVICES_DB, service_id, upd_service)
+    except Exception:
+        raise _not_persisted("Could not update service")
+    CATALOG.put(service_id, upd_service)
+    VALIDATORS.get(service_id, upd_service)
+    if upd_service.executable_url != service.executable_url:
+        # failures of the previous executable say nothing about the new one
+        GUARDS.forget(service_id)
+    new_urls = set(replica_urls(upd_service)) - set(replica_urls(service))
+    if new_urls:
+        await ENDPOINTS.refresh_all(list(new_urls))
+    # cached outputs may not hold for the new executable or parameters
+    if (
+        upd_service.executable_url != service.executable_url
+        or upd_service.parameters != service.parameters
+        or not upd_service.cache_ttl
+    ):
+        RESPONSE_CACHE.invalidate(service_id)
 
-    SERVICES_DB[service_id] = upd_service
     return {
         "message": HTTPStatus.OK.phrase,
         "status-code": HTTPStatus.OK,
@@ -279,14 +637,22 @@ async def delete_service(
     current_user: Annotated[str, Depends(get_current_github_user)],
     service_id: Annotated[str, Path(title="The ID of the item to get")],
 ):
-
-    removed = SERVICES_DB.pop(service_id, None)
+    await _sync_services()
+    try:
+        removed = await db.delete_service(logger, SERVICES_DB, service_id)
+    except Exception:
+        raise _not_persisted("Could not delete service")
     if not removed:
         return {
             "status-code": HTTPStatus.NOT_FOUND,
             "message": HTTPStatus.NOT_FOUND.phrase,
             "details": f"Service with id {service_id} not found"
         }
+    CATALOG.remove(service_id)
+    RESPONSE_CACHE.invalidate(service_id)
+    GUARDS.forget(service_id)
+    REPLICAS.forget(service_id)
+    VALIDATORS.forget(service_id)
 
     return {
         "status-code": HTTPStatus.OK,
@@ -295,12 +661,62 @@ async def delete_service(
         "deleted": removed.model_dump()
     }
 
+def _unavailable(service_id: str, error: ServiceUnavailable) -> HTTPException:
+    headers = None
+    if error.retry_after is not None:
+        headers = {"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    return HTTPException(
+        status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+        detail={
+            'service_id': service_id,
+            'errors': [str(error)],
+        },
+        headers=headers,
+    )
+
+
+def _passthrough(service: Service) -> bool:
+    return service.passthrough if service.passthrough is not None else config.UPSTREAM_PASSTHROUGH
+
+
+def _passthrough_response(service_id: str, output: ServiceOutput, envelope: bool) -> Response:
+    """Forwards the raw output of a service, without decoding it.
+
+    The output is spliced into the usual envelope, or, without `envelope`,
+    sent alone with the metadata of the envelope in headers.
+    """
+    if not envelope:
+        return Response(
+            content=output.raw_output,
+            media_type="application/json",
+            headers={"X-Service-Id": service_id, "X-Message": HTTPStatus.OK.phrase},
+        )
+    input_payload = json.dumps(
+        output.input_payload, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode()
+    content = b"".join((
+        b'{"message":"', HTTPStatus.OK.phrase.encode(),
+        b'","status-code":', str(int(HTTPStatus.OK)).encode(),
+        b',"data":{"input_payload":', input_payload,
+        b',"output":', output.raw_output,
+        b',"errors":[]}}',
+    ))
+    return Response(content=content, media_type="application/json")
+
+
 @app.post("/services/{service_id}/use", tags=["Services"])
 async def use_service(
     current_user: Annotated[str, Depends(get_current_github_user)],
     service_id: Annotated[str, Path(title="The ID of the item to get")],
     payload: dict,
+    envelope: bool = True,
 ):
+    """Uses a service on a JSON payload.
+
+    Unless the service disables passthrough, its output is forwarded as
+    returned by the executable; with `envelope=false`, it is sent without the
+    envelope. Errors are always reported in full.
+    """
 
     service = SERVICES_DB.get(service_id)
     if not service:
@@ -310,8 +726,13 @@ async def use_service(
         )
 
 
-    output = serve(service, payload, logger)
+    try:
+        output = await serve_cached(service_id, service, payload, logger, raw=_passthrough(service))
+    except ServiceUnavailable as e:
+        raise _unavailable(service_id, e)
 
+    if len(output.errors) == 0 and output.raw_output is not None:
+        return _passthrough_response(service_id, output, envelope)
     if len(output.errors) == 0:
         return {
             "message": HTTPStatus.OK.phrase,
@@ -330,3 +751,331 @@ async def use_service(
             'expected_params': expected_params
         }
     )
+
+
+@app.post(
+    "/services/{service_id}/use/raw",
+    tags=["Services"],
+    openapi_extra={
+        "requestBody": {
+            "content": {"application/octet-stream": {"schema": {"type": "string", "format": "binary"}}},
+        },
+    },
+)
+async def use_service_raw(
+    current_user: Annotated[str, Depends(get_current_github_user)],
+    service_id: Annotated[str, Path(title="The ID of the item to get")],
+    request: Request,
+    envelope: bool = True,
+):
+    """Uses a service on a binary payload, e.g. a buffer of pixels.
+
+    The body is forwarded as is, with its content type and query parameters,
+    so that it is never decoded by this server; so is the output, as in
+    use_service.
+    """
+    service = SERVICES_DB.get(service_id)
+    if not service:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail=f"Service with id {service_id} not found"
+        )
+
+    try:
+        output = await serve(
+            service_id,
+            service,
+            {},
+            logger,
+            content=await request.body(),
+            content_type=request.headers.get("content-type"),
+            params={k: v for k, v in request.query_params.items() if k != "envelope"},
+            raw=_passthrough(service),
+        )
+    except ServiceUnavailable as e:
+        raise _unavailable(service_id, e)
+
+    if len(output.errors) == 0 and output.raw_output is not None:
+        return _passthrough_response(service_id, output, envelope)
+    if len(output.errors) == 0:
+        return {
+            "message": HTTPStatus.OK.phrase,
+            "status-code": HTTPStatus.OK,
+            "data": output
+        }
+
+    raise HTTPException(
+        status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+        detail={
+            'service_id': service_id,
+            'errors': output.errors,
+            'expected_params': [param.model_dump() for param in service.parameters]
+        }
+    )
+
+
+@app.post("/services/{service_id}/use/batch", tags=["Services"])
+async def use_service_batch(
+    current_user: Annotated[str, Depends(get_current_github_user)],
+    service_id: Annotated[str, Path(title="The ID of the item to get")],
+    request: Request,
+    concurrency: Annotated[int, Query(ge=1, le=config.BATCH_MAX_CONCURRENCY)] = config.BATCH_MAX_CONCURRENCY,
+    order: Literal["completion", "input"] = "completion",
+):
+    """Uses a service on many payloads at once.
+
+    The body is either a JSON list of payloads or, with content type
+    `application/x-ndjson`, one payload per line. Results are streamed back
+    as NDJSON as soon as they are ready, one line per payload, carrying its
+    index.
+    """
+    service = SERVICES_DB.get(service_id)
+    if not service:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail=f"Service with id {service_id} not found"
+        )
+
+    if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+        input_payloads = iter_ndjson(await request.body())
+    else:
+        try:
+            body = await request.json()
+        except ValueError:
+            body = None
+        if not isinstance(body, list):
+            raise HTTPException(
+                status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+                detail="Payload must be a list of objects or an NDJSON stream"
+            )
+        input_payloads = (
+            item if isinstance(item, dict) else ValueError("Each item must be a JSON object")
+            for item in body
+        )
+
+    async def stream_results() -> AsyncIterator[bytes]:
+        try:
+            async for index, output, unavailable in serve_many(
+                service_id, service, input_payloads, logger, concurrency, ordered=(order == "input")
+            ):
+                if unavailable is not None:
+                    # as /use answers, so that clients retry these items later
+                    status_code = HTTPStatus.SERVICE_UNAVAILABLE
+                elif len(output.errors) == 0:
+                    status_code = HTTPStatus.OK
+                else:
+                    status_code = HTTPStatus.UNPROCESSABLE_ENTITY
+                line = {"index": index, "status-code": status_code}
+                if unavailable is not None and unavailable.retry_after is not None:
+                    line["retry-after"] = max(1, math.ceil(unavailable.retry_after))
+                line |= output.model_dump()
+                yield json.dumps(line).encode() + b"\n"
+        except Exception as e:
+            logger.error(f"Batch on service {service_id} interrupted: {e}")
+            line = {"index": None, "status-code": HTTPStatus.BAD_REQUEST, "errors": [str(e)]}
+            yield json.dumps(line).encode() + b"\n"
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.post("/services/{service_id}/jobs", tags=["Jobs"], status_code=HTTPStatus.ACCEPTED)
+async def submit_job(
+    current_user: Annotated[GitHubUser, Depends(get_current_github_user)],
+    service_id: Annotated[str, Path(title="The ID of the item to get")],
+    payload: dict,
+    response: Response,
+):
+    """Uses a service in the background; the result is fetched from /jobs/{job_id}.
+
+    Answers right away, so that slow services hold neither a connection nor
+    a worker of this server while they run.
+    """
+    if service_id not in SERVICES_DB:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail=f"Service with id {service_id} not found"
+        )
+    try:
+        job = await JOBS.submit(service_id, current_user.github_id, payload)
+    except JobQueueFull as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return {
+        "message": HTTPStatus.ACCEPTED.phrase,
+        "status-code": HTTPStatus.ACCEPTED,
+        "data": job.snapshot(),
+    }
+
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def get_job(
+    current_user: Annotated[GitHubUser, Depends(get_current_github_user)],
+    job_id: str,
+    wait: Annotated[float, Query(ge=0, le=config.JOBS_MAX_WAIT)] = 0,
+):
+    """Gets the status of a job and, once finished, its result.
+
+    With `wait`, a job not finished yet is answered as soon as it finishes,
+    or after `wait` seconds (long polling).
+    """
+    if wait > 0:
+        snapshot = await JOBS.wait(job_id, current_user.github_id, wait)
+    else:
+        snapshot = await JOBS.get(job_id, current_user.github_id)
+    if snapshot is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail=f"Job with id {job_id} not found"
+        )
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": snapshot,
+    }
+
+
+@app.get("/jobs/{job_id}/events", tags=["Jobs"])
+async def stream_job_events(
+    current_user: Annotated[GitHubUser, Depends(get_current_github_user)],
+    job_id: str,
+):
+    """Streams the status of a job as server-sent events, until it finishes."""
+    snapshot = await JOBS.get(job_id, current_user.github_id)
+    if snapshot is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail=f"Job with id {job_id} not found"
+        )
+
+    async def events() -> AsyncIterator[bytes]:
+        current = snapshot
+        yield f"event: status\ndata: {json.dumps(current)}\n\n".encode()
+        while current["status"] not in FINISHED:
+            latest = await JOBS.wait(job_id, current_user.github_id, config.JOBS_MAX_WAIT, status=current["status"])
+            if latest is None:
+                return
+            if latest["status"] == current["status"]:
+                # keeps proxies from closing an idle connection
+                yield b": keep-alive\n\n"
+                continue
+            current = latest
+            yield f"event: status\ndata: {json.dumps(current)}\n\n".encode()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.delete("/jobs/{job_id}", tags=["Jobs"])
+async def cancel_job(
+    current_user: Annotated[GitHubUser, Depends(get_current_github_user)],
+    job_id: str,
+    response: Response,
+):
+    """Cancels a job; answers 202 if it runs on another worker, which cancels it shortly after."""
+    cancelled = await JOBS.cancel(job_id, current_user.github_id)
+    if cancelled is None:
+        raise HTTPException(
+            status_code=HTTPStatus.NOT_FOUND,
+            detail=f"Job with id {job_id} not found"
+        )
+    snapshot, here = cancelled
+    if not here:
+        response.status_code = HTTPStatus.ACCEPTED
+        return {
+            "message": HTTPStatus.ACCEPTED.phrase,
+            "status-code": HTTPStatus.ACCEPTED,
+            "data": snapshot,
+        }
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": snapshot,
+    }
+
+
+@app.websocket("/services/{service_id}/stream")
+async def stream_service(
+    websocket: WebSocket,
+    service_id: str,
+):
+    """Streams payloads to a service over a single authenticated connection.
+
+    Each text frame is a JSON payload, each binary frame a raw body as for
+    /use/raw; frames are numbered from 0 in the order they arrive. A single
+    call runs at a time: frames arriving meanwhile replace each other, so
+    only the latest one is sent next and the superseded ones are dropped.
+    Every call sent answers with a JSON frame carrying its number as `seq`.
+    """
+    try:
+        await get_current_github_user(websocket)
+    except HTTPException as e:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=str(e.detail))
+        return
+    if service_id not in SERVICES_DB:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason=f"Service with id {service_id} not found")
+        return
+
+    await websocket.accept()
+    STREAM_SESSIONS.inc(service_id)
+    latest: tuple[int, dict | bytes | Exception] | None = None
+    arrived = asyncio.Event()
+
+    async def receive_frames():
+        nonlocal latest
+        seq = 0
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                return
+            if message.get("bytes") is not None:
+                frame = message["bytes"]
+            else:
+                frame = parse_json_object(message.get("text") or "")
+            if latest is not None:
+                STREAM_SUPERSEDED.inc(service_id)
+            latest = (seq, frame)
+            seq += 1
+            arrived.set()
+
+    async def send_results():
+        nonlocal latest
+        while True:
+            await arrived.wait()
+            arrived.clear()
+            seq, frame = latest
+            latest = None
+            line = {"seq": seq} | await _stream_frame(service_id, frame)
+            await websocket.send_text(json.dumps(line))
+
+    receiver = asyncio.create_task(receive_frames())
+    sender = asyncio.create_task(send_results())
+    try:
+        await asyncio.wait({receiver, sender}, return_when=asyncio.FIRST_COMPLETED)
+        # a failed sender means the client went away
+        if sender.done() and sender.exception() is not None:
+            logger.info(f"Stream on service {service_id} closed: {sender.exception()}")
+    finally:
+        receiver.cancel()
+        sender.cancel()
+        STREAM_SESSIONS.dec(service_id)
+
+
+async def _stream_frame(service_id: str, frame: dict | bytes | Exception) -> dict:
+    service = SERVICES_DB.get(service_id)
+    if not service:
+        return {"status-code": HTTPStatus.NOT_FOUND, "errors": [f"Service with id {service_id} not found"]}
+    if isinstance(frame, Exception):
+        return {"status-code": HTTPStatus.UNPROCESSABLE_ENTITY, "errors": [str(frame)]}
+
+    try:
+        if isinstance(frame, bytes):
+            output = await serve(service_id, service, {}, logger, content=frame)
+        else:
+            output = await serve_cached(service_id, service, frame, logger)
+    except ServiceUnavailable as e:
+        return {"status-code": HTTPStatus.SERVICE_UNAVAILABLE, "errors": [str(e)]}
+
+    status_code = HTTPStatus.OK if len(output.errors) == 0 else HTTPStatus.UNPROCESSABLE_ENTITY
+    return {"status-code": status_code} | output.model_dump()
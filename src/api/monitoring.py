@@ -0,0 +1,63 @@
+"""Metrics of the gateway, exposed on /metrics."""
+from ..metrics import MetricsRegistry
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter(
+    'gateway_requests_total',
+    'Calls to the executable of a service.',
+    ('service_id',),
+)
+
+# classes: invalid_url, self_loop, validation, upstream_client (4xx), upstream_server (5xx),
+# timeout, connection, other,
+# and circuit_open, bulkhead_full for the calls rejected before reaching the service
+ERRORS = REGISTRY.counter(
+    'gateway_errors_total',
+    'Failed calls to the executable of a service, by class of error.',
+    ('service_id', 'class'),
+)
+
+# stages: queue (endpoint resolution and wait for a pooled connection),
+# upstream (request sent to response received), serialization (decoding the response)
+LATENCY = REGISTRY.histogram(
+    'gateway_latency_seconds',
+    'Time spent in each stage of a call to the executable of a service.',
+    ('service_id', 'stage'),
+)
+
+RETRIES = REGISTRY.counter(
+    'gateway_retries_total',
+    'Calls to the executable of a service attempted again.',
+    ('service_id',),
+)
+
+COALESCED = REGISTRY.counter(
+    'gateway_coalesced_total',
+    'Calls that shared the upstream call of an identical call already in flight.',
+    ('service_id',),
+)
+
+HEDGES = REGISTRY.counter(
+    'gateway_hedges_total',
+    'Calls sent to a second replica because the first was slow.',
+    ('service_id',),
+)
+
+IN_FLIGHT = REGISTRY.gauge(
+    'gateway_in_flight_requests',
+    'Calls to the executable of a service currently running.',
+    ('service_id',),
+)
+
+STREAM_SESSIONS = REGISTRY.gauge(
+    'gateway_stream_sessions',
+    'Websocket sessions streaming payloads to a service.',
+    ('service_id',),
+)
+
+STREAM_SUPERSEDED = REGISTRY.counter(
+    'gateway_stream_superseded_total',
+    'Streamed payloads dropped because a newer one arrived before they were sent.',
+    ('service_id',),
+)
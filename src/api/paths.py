@@ -10,3 +10,9 @@ if not DB_DIR.exists():
     os.makedirs(DB_DIR)
 
 SERVICES_DB_FILEPATH = DB_DIR / Path('services.json')
+SERVICES_SQLITE_FILEPATH = DB_DIR / Path('services.sqlite3')
+SERVICES_LOG_FILEPATH = DB_DIR / Path('services.log')
+API_KEYS_FILEPATH = DB_DIR / Path('api_keys.json')
+JOBS_SQLITE_FILEPATH = DB_DIR / Path('jobs.sqlite3')
+
+CAPTURE_DIR = DATA_DIR / Path('capture')
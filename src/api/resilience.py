@@ -0,0 +1,173 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class ServiceUnavailable(Exception):
+    """The call was rejected before reaching the executable of the service."""
+
+    def __init__(self, message: str, retry_after: float | None = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpen(ServiceUnavailable):
+    pass
+
+
+class BulkheadFull(ServiceUnavailable):
+    pass
+
+
+class CircuitBreaker:
+    """Fails fast once a service keeps failing.
+
+    The circuit opens after `failure_threshold` consecutive failures, and
+    rejects every call for `reset_timeout` seconds. Then it is half-open:
+    at most `half_open_probes` calls go through at once, and the circuit
+    closes after as many successes, or opens again on the first failure.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, half_open_probes: int):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        # counts the half-open periods, so that probes from an earlier one are told apart
+        self._half_opened = 0
+
+    def acquire(self) -> int | None:
+        """Raises CircuitOpen if the call must not be attempted.
+
+        Returns a token to pass back to release() or record(): the half-open
+        period the call probes, or None for a call made while closed.
+        """
+        if self.state == OPEN:
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0:
+                raise CircuitOpen("Service is unavailable: too many recent failures.", retry_after=remaining)
+            self.state = HALF_OPEN
+            self._half_opened += 1
+            self._probes = 0
+            self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= self.half_open_probes:
+                raise CircuitOpen("Service is unavailable: recovery is being probed.", retry_after=self.reset_timeout)
+            self._probes += 1
+            return self._half_opened
+        return None
+
+    def _is_probe(self, token: int | None) -> bool:
+        return token is not None and self.state == HALF_OPEN and token == self._half_opened
+
+    def release(self, token: int | None):
+        """Gives back a call that was allowed but never reached the service."""
+        if self._is_probe(token):
+            self._probes -= 1
+
+    def record(self, token: int | None, failed: bool):
+        if self._is_probe(token):
+            self._probes -= 1
+            if failed:
+                self._open()
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_probes:
+                self.state = CLOSED
+                self.failures = 0
+            return
+        # calls started before the circuit opened say nothing about the recovery
+        if token is not None or self.state != CLOSED:
+            return
+        if not failed:
+            self.failures = 0
+            return
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self):
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.failures = 0
+
+    def snapshot(self) -> dict:
+        return {
+            'state': self.state,
+            'failures': self.failures,
+        }
+
+
+class Bulkhead:
+    """Caps the calls in flight to a single service."""
+
+    def __init__(self, max_concurrency: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise BulkheadFull(
+                f"Service is unavailable: too many calls in flight (max {self.max_concurrency}).",
+                retry_after=self.queue_timeout,
+            )
+        try:
+            yield
+        finally:
+            self._slots.release()
+
+
+class ServiceGuards:
+    """The circuit breaker and bulkhead of each service, by service id."""
+
+    def __init__(
+        self,
+        failure_threshold: int,
+        reset_timeout: float,
+        half_open_probes: int,
+        queue_timeout: float,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.queue_timeout = queue_timeout
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._bulkheads: dict[str, Bulkhead] = {}
+
+    def breaker(self, service_id: str) -> CircuitBreaker:
+        breaker = self._breakers.get(service_id)
+        if breaker is None:
+            breaker = self._breakers[service_id] = CircuitBreaker(
+                self.failure_threshold, self.reset_timeout, self.half_open_probes
+            )
+        return breaker
+
+    def bulkhead(self, service_id: str, max_concurrency: int | None) -> Bulkhead | None:
+        if not max_concurrency:
+            self._bulkheads.pop(service_id, None)
+            return None
+        bulkhead = self._bulkheads.get(service_id)
+        # a new limit takes a new bulkhead; calls in flight release the old one
+        if bulkhead is None or bulkhead.max_concurrency != max_concurrency:
+            bulkhead = self._bulkheads[service_id] = Bulkhead(max_concurrency, self.queue_timeout)
+        return bulkhead
+
+    def forget(self, service_id: str):
+        self._breakers.pop(service_id, None)
+        self._bulkheads.pop(service_id, None)
+
+    def states(self) -> dict[str, str]:
+        return {service_id: breaker.state for service_id, breaker in self._breakers.items()}
@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from typing import Literal
+
+from pydantic import BaseModel, PrivateAttr, ValidationInfo, field_validator
 
 class User(BaseModel):
     username: str
@@ -6,9 +8,42 @@ class User(BaseModel):
 class GitHubUser(User):
     github_id: str
 
+DATA_TYPES = ('number', 'integer', 'string', 'boolean', 'array', 'object')
+# names found in registries written before data types were checked
+LEGACY_DATA_TYPES = {
+    'float': 'number',
+    'double': 'number',
+    'int': 'integer',
+    'str': 'string',
+    'bool': 'boolean',
+    'list': 'array',
+    'dict': 'object',
+}
+
 class ServiceParameter(BaseModel):
     name: str
     description: str | None = None
+    # type of the value, checked and coerced before calling the executable; any value if not set
+    data_type: Literal['number', 'integer', 'string', 'boolean', 'array', 'object'] | None = None
+    shape: list[int] | None = None                      # for arrays, the length of each dimension; -1 for any
+
+    @field_validator('data_type', mode='before')
+    @classmethod
+    def normalize_data_type(cls, value, info: ValidationInfo):
+        """Maps legacy names to data types; any other value leaves the parameter untyped.
+
+        With the `strict_data_types` context, as for the services sent by
+        clients, an unknown data type is rejected instead.
+        """
+        if value is None:
+            return None
+        normalized = value.strip().lower() if isinstance(value, str) else None
+        normalized = LEGACY_DATA_TYPES.get(normalized, normalized)
+        if normalized in DATA_TYPES:
+            return normalized
+        if info.context and info.context.get('strict_data_types'):
+            raise ValueError(f"Unknown data type {value!r}, expected one of {', '.join(DATA_TYPES)}")
+        return None
 
 # NOTE: order of parameters matters!
 # imagine the model expecting parameters (A, B), both floats;
@@ -19,8 +54,40 @@ class Service(BaseModel):
     parameters: list[ServiceParameter] = []             # description of the required fields
     thumbnail_url: str | None = None                    # a decorative image
     executable_url: str | None = None                   # the url of the executable
+    replica_urls: list[str] = []                        # more urls serving the same executable
+    balancing_policy: Literal['least-outstanding', 'ewma'] | None = None  # overrides the global default
+    hedge_percentile: float | None = None               # e.g. 95; calls slower than this latency percentile are sent to a second replica
+    connect_timeout: float | None = None                # seconds, overrides the global default
+    read_timeout: float | None = None                   # seconds, overrides the global default
+    cache_ttl: float | None = None                      # seconds; if set, outputs are cached
+    passthrough: bool | None = None                     # outputs are forwarded without being decoded; overrides the global default
+    coalesce: bool | None = None                        # identical concurrent calls share one upstream call; overrides the global default
+    max_concurrency: int | None = None                  # calls in flight at once; unlimited if not set
+    retries: int | None = None                          # overrides the global default
+    latency_slo: float | None = None                    # seconds; slower calls count as failures
 
 class ServiceOutput(BaseModel):
     input_payload: dict = {}
     output: dict = {}
     errors: list = []
+    # the body of the executable's response, not decoded, in place of `output`
+    _raw_output: bytes | None = PrivateAttr(default=None)
+
+    @property
+    def raw_output(self) -> bytes | None:
+        return self._raw_output
+
+class APIKey(BaseModel):
+    key_id: str
+    name: str
+    username: str
+    github_id: str
+    scopes: list[str] = []
+    secret_hash: str                                    # sha256 of the secret part of the key
+    created_at: float                                   # unix time
+    expires_at: float | None = None                     # unix time; never expires if not set
+
+class APIKeyRequest(BaseModel):
+    name: str = 'Untitled'
+    scopes: list[Literal['services:read', 'services:write', 'services:use']] = ['services:read', 'services:use']
+    ttl: float | None = None                            # seconds before the key expires
@@ -1,69 +1,522 @@
-import http
-import http.client
-import requests
+import asyncio
+import json
+import logging
+import time
+from contextlib import nullcontext
 from logging import Logger
-from urllib.parse import urlparse
+from typing import AsyncIterator, Iterable
+
+import httpx
 
 from .. import config
-from . import utils
+from . import upstream
+from .balancer import Replica, ReplicaPool, ReplicaSet
+from .cache import ResponseCache, payload_key
+from .endpoints import Endpoint, EndpointResolver
+from .monitoring import COALESCED, ERRORS, HEDGES, IN_FLIGHT, LATENCY, REGISTRY, REQUESTS, RETRIES
+from .resilience import HALF_OPEN, OPEN, BulkheadFull, CircuitOpen, ServiceGuards, ServiceUnavailable
 from .schema import Service, ServiceOutput
+from .validation import PayloadError, ValidatorCache
+
+RESPONSE_CACHE = ResponseCache(max_entries=config.RESPONSE_CACHE_MAX_ENTRIES)
+
+ENDPOINTS = EndpointResolver(
+    this_host=config.THIS_HOST,
+    this_port=config.THIS_PORT,
+    ttl=config.DNS_CACHE_TTL,
+    logger=logging.getLogger("uvicorn"),
+)
+
+GUARDS = ServiceGuards(
+    failure_threshold=config.BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=config.BREAKER_RESET_TIMEOUT,
+    half_open_probes=config.BREAKER_HALF_OPEN_PROBES,
+    queue_timeout=config.UPSTREAM_BULKHEAD_TIMEOUT,
+)
+
+VALIDATORS = ValidatorCache()
+
+# upstream calls in flight, by service id and payload key, for identical calls to share
+IN_FLIGHT_CALLS: dict[tuple[str, str], asyncio.Task] = {}
+
+REPLICAS = ReplicaPool(
+    policy=config.LOAD_BALANCING_POLICY,
+    eject_after=config.REPLICA_EJECT_FAILURES,
+    eject_for=config.REPLICA_EJECT_DURATION,
+)
+
+REGISTRY.counter(
+    'gateway_cache_events_total',
+    'Lookups and evictions of the response cache.',
+    ('event',),
+    collect=lambda: {
+        ('hit',): RESPONSE_CACHE.hits,
+        ('miss',): RESPONSE_CACHE.misses,
+        ('eviction',): RESPONSE_CACHE.evictions,
+    },
+)
+REGISTRY.gauge(
+    'gateway_cache_entries',
+    'Entries in the response cache.',
+    collect=lambda: {(): len(RESPONSE_CACHE)},
+)
+REGISTRY.gauge(
+    'gateway_upstream_connections',
+    'Connections of the upstream pool, and requests waiting for one.',
+    ('state',),
+    collect=lambda: {(state,): count for state, count in upstream.pool_stats().items()},
+)
+REGISTRY.gauge(
+    'gateway_circuit_open',
+    'Whether the circuit of a service is open (1), half-open (0.5) or closed (0).',
+    ('service_id',),
+    collect=lambda: {
+        (service_id,): {OPEN: 1, HALF_OPEN: 0.5}.get(state, 0)
+        for service_id, state in GUARDS.states().items()
+    },
+)
+
+
+# error classes that count as failures of the service for its circuit breaker,
+# unlike the errors caused by the payload of a client (validation, upstream_client);
+# calls that never reached it (invalid url, self loop) do not count either way
+BREAKER_FAILURES = {'timeout', 'connection', 'upstream_server'}
+NOT_ATTEMPTED = {'invalid_url', 'self_loop'}
+
+# statuses of a response worth retrying, as the next attempt may succeed
+RETRY_STATUSES = {502, 503, 504}
+
+
+def classify_error(error: Exception) -> str:
+    if isinstance(error, httpx.TimeoutException):
+        return 'timeout'
+    if isinstance(error, httpx.HTTPStatusError):
+        if error.response.status_code == 422:
+            return 'validation'
+        if error.response.status_code >= 500:
+            return 'upstream_server'
+        return 'upstream_client'
+    if isinstance(error, httpx.TransportError):
+        return 'connection'
+    return 'other'
+
+
+async def serve(
+    service_id: str,
+    service: Service,
+    input_payload: dict,
+    logger: Logger,
+    content: bytes | None = None,
+    content_type: str | None = None,
+    params: dict | None = None,
+    raw: bool = False,
+) -> ServiceOutput:
+    """Calls the executable of the service with `input_payload` as JSON.
+
+    If `content` is given, it is sent as is instead, with `content_type`;
+    `params` are appended to the url as query parameters. If `raw`, a JSON
+    object returned by the executable is kept as bytes in `raw_output`,
+    rather than decoded into `output`.
+
+    Raises ServiceUnavailable without calling the executable while the
+    circuit of the service is open, or if its calls in flight stay at
+    `max_concurrency` for too long.
+    """
+    REQUESTS.inc(service_id)
+    breaker = GUARDS.breaker(service_id)
+    try:
+        token = breaker.acquire()
+    except CircuitOpen:
+        ERRORS.inc(service_id, 'circuit_open')
+        raise
+    bulkhead = GUARDS.bulkhead(service_id, service.max_concurrency)
+
+    IN_FLIGHT.inc(service_id)
+    started_at = time.perf_counter()
+    try:
+        async with bulkhead.slot() if bulkhead is not None else nullcontext():
+            output, error_class = await _serve(
+                service_id, service, input_payload, logger, content, content_type, params, raw, started_at
+            )
+    except BaseException as e:
+        breaker.release(token)
+        if isinstance(e, BulkheadFull):
+            ERRORS.inc(service_id, 'bulkhead_full')
+        raise
+    finally:
+        IN_FLIGHT.dec(service_id)
+
+    if error_class is not None:
+        ERRORS.inc(service_id, error_class)
+    if error_class in NOT_ATTEMPTED:
+        breaker.release(token)
+    else:
+        elapsed = time.perf_counter() - started_at
+        slow = service.latency_slo is not None and elapsed > service.latency_slo
+        breaker.record(token, failed=slow or error_class in BREAKER_FAILURES)
+    return output
+
+
+def is_json_object(response: httpx.Response) -> bool:
+    """Tells, without decoding it, whether the body looks like a JSON object."""
+    if not response.headers.get("content-type", "").startswith("application/json"):
+        return False
+    body = response.content.strip()
+    return body[:1] == b"{" and body[-1:] == b"}"
+
+
+def decode_raw_output(output: ServiceOutput) -> ServiceOutput:
+    """Decodes the raw output, for callers that need `output` itself."""
+    if output.raw_output is None:
+        return output
+    try:
+        return ServiceOutput(input_payload=output.input_payload, output=json.loads(output.raw_output))
+    except ValueError as e:
+        return ServiceOutput(input_payload=output.input_payload, errors=[f"Invalid JSON output: {e}"])
 
-def serve(service: Service, input_payload: dict, logger: Logger) -> ServiceOutput:
 
-    executable_url = service.executable_url
+class _UnusableEndpoint(Exception):
+    """The url of a replica cannot be called at all."""
 
-    if not executable_url:
+    def __init__(self, message: str, error_class: str):
+        super().__init__(message)
+        self.error_class = error_class
+
+
+async def _serve(
+    service_id: str,
+    service: Service,
+    input_payload: dict,
+    logger: Logger,
+    content: bytes | None,
+    content_type: str | None,
+    params: dict | None,
+    raw: bool,
+    started_at: float,
+) -> tuple[ServiceOutput, str | None]:
+    """Returns the output of the call and, if it failed, the class of its error."""
+    replicas = REPLICAS.get(service_id, service)
+
+    if len(replicas) == 0:
         return ServiceOutput(
             errors=[
                 "Executable URL is missing."
             ]
-        )
+        ), 'invalid_url'
 
-    parsed_url = urlparse(executable_url)
-    if not parsed_url.scheme or not parsed_url.netloc:
-        logger.error("Invalid Executable URL!")
-        return ServiceOutput(
-            errors=[
-                "Executable URL is invalid."
-            ]
-        )
-    
-    url_hostname = parsed_url.hostname if parsed_url.hostname else ''
-    if parsed_url.port:
-        url_port = parsed_url.port
-    elif parsed_url.scheme == "http":
-        url_port = http.client.HTTP_PORT
-    elif parsed_url.scheme == "https":
-        url_port = http.client.HTTPS_PORT
+    # the time the request starts being sent, after waiting for a pooled connection
+    sent_at = None
+
+    async def trace(event_name: str, info: dict):
+        nonlocal sent_at
+        if sent_at is None and event_name.endswith("send_request_headers.started"):
+            sent_at = time.perf_counter()
+
+    if content is not None:
+        request_body = {"content": content, "headers": {"content-type": content_type or "application/octet-stream"}}
     else:
-        url_port = 0
-
-    if utils.is_same_process(
-        hostname_a  = url_hostname,
-        port_a      = url_port,
-        hostname_b  = config.THIS_HOST,
-        port_b      = config.THIS_PORT
-    ):
-        logger.error("Requesting path operation on this server")
-        return ServiceOutput(
-            errors=[
-                "Cannot perform a path operation on this server while this request is running because it causes deadlock."
-            ]
-        )
+        request_body = {"json": input_payload}
+    request = {
+        "params": params,
+        "timeout": upstream.get_timeout(service),
+        "extensions": {"trace": trace},
+        **request_body,
+    }
 
+    attempts = 1 + (service.retries if service.retries is not None else config.UPSTREAM_RETRIES)
+    # replicas already called, so that retries and hedges go elsewhere if possible
+    tried: set[str] = set()
     try:
-        response = requests.post(url=executable_url, json=input_payload)
+        posted_at = time.perf_counter()
+        for attempt in range(attempts):
+            try:
+                response = await _post_hedged(service_id, service, replicas, tried, request, logger)
+            except httpx.TransportError:
+                if attempt + 1 == attempts:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt + 1 == attempts:
+                    break
+            RETRIES.inc(service_id)
+            await asyncio.sleep(config.UPSTREAM_RETRY_BACKOFF * 2 ** attempt)
+        received_at = time.perf_counter()
+        if sent_at is None:
+            sent_at = posted_at
+        LATENCY.observe(sent_at - started_at, service_id, 'queue')
+        LATENCY.observe(received_at - sent_at, service_id, 'upstream')
         # raise an exception if response has an error status
         response.raise_for_status()
-        result = response.json()
+        if raw and is_json_object(response):
+            output = ServiceOutput(input_payload=input_payload)
+            output._raw_output = response.content
+        else:
+            result = response.json()
+            output = ServiceOutput(
+                input_payload=input_payload,
+                output=result
+            )
+        LATENCY.observe(time.perf_counter() - received_at, service_id, 'serialization')
+        return output, None
+    except _UnusableEndpoint as e:
         return ServiceOutput(
-            input_payload=input_payload,
-            output=result
-        )
+            errors=[
+                str(e)
+            ]
+        ), e.error_class
     except Exception as e:
         logger.error(f"Request failed: {e}")
         return ServiceOutput(
             errors=[
                 str(e)
             ]
+        ), classify_error(e)
+
+
+async def _post_hedged(
+    service_id: str,
+    service: Service,
+    replicas: ReplicaSet,
+    tried: set[str],
+    request: dict,
+    logger: Logger,
+) -> httpx.Response:
+    """Calls a replica and, if it is slower than its `hedge_percentile`, a second one.
+
+    The first successful response wins and the other call is cancelled;
+    predictions are idempotent, so calling twice is harmless.
+    """
+    replica = await _pick(replicas, tried, logger)
+    delay = None
+    if service.hedge_percentile is not None and len(replicas) > 1:
+        delay = replica.percentile(service.hedge_percentile)
+    if delay is None:
+        return await _post(replica, request, logger)
+
+    primary = asyncio.create_task(_post(replica, request, logger))
+    tasks = [primary]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done:
+            second = await _pick(replicas, tried, logger, untried_only=True)
+            if second is not None:
+                HEDGES.inc(service_id)
+                tasks.append(asyncio.create_task(_post(second, request, logger)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    return task.result()
+        return primary.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def _check_endpoint(endpoint: Endpoint, logger: Logger):
+    if endpoint.error:
+        logger.error("Invalid Executable URL!")
+        raise _UnusableEndpoint(endpoint.error, 'invalid_url')
+
+    if endpoint.is_self:
+        logger.error("Requesting path operation on this server")
+        raise _UnusableEndpoint(
+            "Cannot perform a path operation on this server while this request is running because it causes deadlock.",
+            'self_loop',
         )
+
+
+async def _pick(
+    replicas: ReplicaSet,
+    tried: set[str],
+    logger: Logger,
+    untried_only: bool = False,
+) -> Replica | None:
+    """Picks a replica whose url can be called, preferring those not in `tried`.
+
+    A replica whose url cannot be called counts as failed, so that it gets
+    ejected, and the next one is picked instead. Once every replica was
+    tried, one of them is picked again, unless `untried_only`.
+    """
+    while True:
+        replica = replicas.pick(exclude=tried)
+        retried = replica.url in tried
+        if retried and untried_only:
+            return None
+        tried.add(replica.url)
+        try:
+            _check_endpoint(await ENDPOINTS.get(replica.url), logger)
+        except _UnusableEndpoint:
+            REPLICAS.record(replica, 0.0, failed=True)
+            if retried:
+                raise
+            continue
+        return replica
+
+
+async def _post(replica: Replica, request: dict, logger: Logger) -> httpx.Response:
+    replica.outstanding += 1
+    started_at = time.perf_counter()
+    try:
+        response = await upstream.get_client().post(url=replica.url, **request)
+    except Exception:
+        REPLICAS.record(replica, time.perf_counter() - started_at, failed=True)
+        raise
+    finally:
+        replica.outstanding -= 1
+    REPLICAS.record(replica, time.perf_counter() - started_at, failed=response.status_code >= 500)
+    return response
+
+
+async def serve_cached(
+    service_id: str,
+    service: Service,
+    input_payload: dict,
+    logger: Logger,
+    raw: bool = False,
+) -> ServiceOutput:
+    """Serves a payload, reusing the cached output if the service enables caching.
+
+    The payload is first checked against the parameters of the service, so
+    that a bad payload is rejected without calling the executable. Unless
+    the service disables coalescing, concurrent calls with the same payload
+    share a single upstream call.
+
+    With `raw`, the output may be left undecoded in `raw_output`, as in serve().
+    """
+    try:
+        input_payload = VALIDATORS.get(service_id, service)(input_payload)
+    except PayloadError as e:
+        ERRORS.inc(service_id, 'validation')
+        return ServiceOutput(input_payload=input_payload, errors=e.errors)
+
+    coalesce = service.coalesce if service.coalesce is not None else config.COALESCE_REQUESTS
+    if not service.cache_ttl and not coalesce:
+        output = await serve(service_id, service, input_payload, logger, raw=raw)
+        return output if raw else decode_raw_output(output)
+
+    key = payload_key(input_payload)
+    output = RESPONSE_CACHE.get(service_id, key) if service.cache_ttl else None
+    if output is None:
+        if coalesce:
+            output = await _serve_coalesced(service_id, service, input_payload, logger, key, raw)
+        else:
+            output = await serve(service_id, service, input_payload, logger, raw=raw)
+        # errors may be transient, never cache them
+        if service.cache_ttl and len(output.errors) == 0:
+            RESPONSE_CACHE.put(service_id, key, output, service.cache_ttl)
+    # outputs are shared with callers that may not want them raw
+    return output if raw else decode_raw_output(output)
+
+
+async def _serve_coalesced(
+    service_id: str,
+    service: Service,
+    input_payload: dict,
+    logger: Logger,
+    key: str,
+    raw: bool,
+) -> ServiceOutput:
+    """Attaches to the call in flight for the same payload, or starts it.
+
+    The call runs in a task of its own, so that it completes for the other
+    callers even if the one that started it goes away; its output, or its
+    exception, is handed to every caller.
+    """
+    flight_key = (service_id, key)
+    task = IN_FLIGHT_CALLS.get(flight_key)
+    if task is None:
+        task = asyncio.create_task(serve(service_id, service, input_payload, logger, raw=raw))
+        IN_FLIGHT_CALLS[flight_key] = task
+
+        def land(task: asyncio.Task):
+            IN_FLIGHT_CALLS.pop(flight_key, None)
+            # every caller may be gone: retrieve the exception so that it is not reported as lost
+            if not task.cancelled():
+                task.exception()
+
+        task.add_done_callback(land)
+    else:
+        COALESCED.inc(service_id)
+    return await asyncio.shield(task)
+
+
+async def serve_many(
+    service_id: str,
+    service: Service,
+    input_payloads: Iterable[dict | Exception],
+    logger: Logger,
+    concurrency: int,
+    ordered: bool = False,
+) -> AsyncIterator[tuple[int, ServiceOutput, ServiceUnavailable | None]]:
+    """Serves a stream of payloads with at most `concurrency` calls in flight.
+
+    Yields (index, output, unavailable) triples, in completion order or, if
+    `ordered`, in input order; `unavailable` is set if the call was rejected
+    before reaching the service. Items that could not be parsed are passed
+    as exceptions and reported as errors without reaching the service.
+    """
+    results: asyncio.Queue[tuple[int, ServiceOutput, ServiceUnavailable | None]] = asyncio.Queue()
+    slots = asyncio.Semaphore(concurrency)
+    tasks: set[asyncio.Task] = set()
+    total: int | None = None
+    failure: Exception | None = None
+
+    async def serve_one(index: int, input_payload: dict | Exception):
+        unavailable = None
+        try:
+            if isinstance(input_payload, Exception):
+                ERRORS.inc(service_id, 'validation')
+                output = ServiceOutput(errors=[str(input_payload)])
+            else:
+                output = await serve_cached(service_id, service, input_payload, logger)
+        except ServiceUnavailable as e:
+            unavailable = e
+            output = ServiceOutput(input_payload=input_payload, errors=[str(e)])
+        except Exception as e:
+            output = ServiceOutput(input_payload=input_payload, errors=[str(e)])
+        finally:
+            slots.release()
+        results.put_nowait((index, output, unavailable))
+
+    async def produce():
+        nonlocal total, failure
+        count = 0
+        try:
+            for input_payload in input_payloads:
+                await slots.acquire()
+                task = asyncio.create_task(serve_one(count, input_payload))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                count += 1
+        except Exception as e:
+            failure = e
+        finally:
+            total = count
+            # wake up the consumer, in case every result was already yielded
+            results.put_nowait((-1, ServiceOutput(), None))
+
+    producer = asyncio.create_task(produce())
+    try:
+        emitted = 0
+        next_index = 0
+        pending: dict[int, tuple[ServiceOutput, ServiceUnavailable | None]] = {}
+        while total is None or emitted < total:
+            index, output, unavailable = await results.get()
+            if index < 0:
+                if failure is not None:
+                    raise failure
+                continue
+            if not ordered:
+                emitted += 1
+                yield index, output, unavailable
+                continue
+            pending[index] = (output, unavailable)
+            while next_index in pending:
+                emitted += 1
+                yield next_index, *pending.pop(next_index)
+                next_index += 1
+    finally:
+        producer.cancel()
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,334 @@
+import json
+import os
+import sqlite3
+import threading
+from pathlib import Path
+
+from .schema import Service
+
+
+def _fsync_dir(path: Path):
+    # makes a rename durable; not supported on every platform
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def atomic_write(path: Path, data: str):
+    """Replaces the contents of `path` so that a crash leaves either the old or the new file."""
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as file:
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, path)
+    _fsync_dir(path.parent)
+
+
+class StoreNotLoaded(Exception):
+    pass
+
+
+class ServiceStore:
+    """Persists the services; subclasses implement a storage format.
+
+    If the latest load failed, writing is refused, so that a registry that
+    could not be read is never overwritten by the few services known since.
+    """
+
+    # whether several processes can use the store at once and see each other's changes
+    shared = False
+    # set by subclasses while their latest load failed
+    load_failed = False
+
+    def _check_writable(self):
+        if self.load_failed:
+            raise StoreNotLoaded(f"{self.path} could not be loaded, refusing to write it")
+
+    def load(self) -> dict[str, Service]:
+        raise NotImplementedError
+
+    def put(self, id: str, service: Service):
+        raise NotImplementedError
+
+    def delete(self, id: str):
+        raise NotImplementedError
+
+    def save(self, services: dict[str, Service]):
+        """Replaces every stored service with `services`."""
+        raise NotImplementedError
+
+    def version(self) -> int:
+        """The version of the latest change, for stores that track changes."""
+        return 0
+
+    def changes_since(self, version: int) -> tuple[int, list[tuple[str, Service | None]] | None]:
+        """Returns the latest version and the changes made after `version`, in order.
+
+        A change is the id of a service and its new value, None if deleted.
+        Changes are None if they cannot be replayed, e.g. after they were
+        compacted away, and the services must be loaded again.
+        """
+        return self.version(), []
+
+    def compact(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class JsonStore(ServiceStore):
+    """The whole registry in a single JSON file, rewritten atomically on each change.
+
+    Each change costs as much as writing every service; for large registries,
+    prefer the 'sqlite' or 'log' backends.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._services: dict[str, Service] = {}
+
+    def load(self) -> dict[str, Service]:
+        with self._lock:
+            self.load_failed = True
+            if self.path.exists():
+                with open(self.path, 'r') as file:
+                    data = json.load(file)
+                self._services = {k: Service.model_validate(v) for k, v in data.items()}
+            else:
+                self._services = {}
+            self.load_failed = False
+            return dict(self._services)
+
+    def _write(self):
+        atomic_write(self.path, json.dumps({k: v.model_dump() for k, v in self._services.items()}))
+
+    def put(self, id: str, service: Service):
+        with self._lock:
+            self._check_writable()
+            self._services[id] = service
+            self._write()
+
+    def delete(self, id: str):
+        with self._lock:
+            self._check_writable()
+            if self._services.pop(id, None) is not None:
+                self._write()
+
+    def save(self, services: dict[str, Service]):
+        with self._lock:
+            self._check_writable()
+            self._services = dict(services)
+            self._write()
+
+
+class SqliteStore(ServiceStore):
+    """One row per service in a SQLite database, in WAL mode.
+
+    Several processes can share the database: every change is also appended
+    to a table of versioned changes, which the others replay to stay in sync.
+    """
+
+    shared = True
+
+    # changes kept by compaction, for processes lagging behind
+    KEEP_CHANGES = 1000
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10.0)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS services (id TEXT PRIMARY KEY, data TEXT NOT NULL)")
+        # a change with a NULL id replaces every service, as done by save()
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS changes (version INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT, data TEXT)"
+        )
+        # changes when another connection commits, so polling it is cheap
+        self._data_version = None
+
+    def load(self) -> dict[str, Service]:
+        self.load_failed = True
+        with self._lock:
+            rows = self._conn.execute("SELECT id, data FROM services").fetchall()
+        services = {id: Service.model_validate_json(data) for id, data in rows}
+        self.load_failed = False
+        return services
+
+    def _write(self, statements: list[tuple[str, tuple]]):
+        self._check_writable()
+        with self._lock:
+            # IMMEDIATE takes the write lock upfront, so that concurrent writers queue up
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement, parameters in statements:
+                    self._conn.execute(statement, parameters)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def put(self, id: str, service: Service):
+        data = service.model_dump_json()
+        self._write([
+            ("INSERT OR REPLACE INTO services (id, data) VALUES (?, ?)", (id, data)),
+            ("INSERT INTO changes (id, data) VALUES (?, ?)", (id, data)),
+        ])
+
+    def delete(self, id: str):
+        self._write([
+            ("DELETE FROM services WHERE id = ?", (id,)),
+            ("INSERT INTO changes (id, data) VALUES (?, NULL)", (id,)),
+        ])
+
+    def save(self, services: dict[str, Service]):
+        self._write(
+            [("DELETE FROM services", ())]
+            + [
+                ("INSERT INTO services (id, data) VALUES (?, ?)", (id, service.model_dump_json()))
+                for id, service in services.items()
+            ]
+            + [("INSERT INTO changes (id, data) VALUES (NULL, NULL)", ())]
+        )
+
+    def version(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT max(version) FROM changes").fetchone()
+        return row[0] or 0
+
+    def changes_since(self, version: int) -> tuple[int, list[tuple[str, Service | None]] | None]:
+        with self._lock:
+            data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version == self._data_version:
+                return version, []
+            self._data_version = data_version
+            self._conn.execute("BEGIN")
+            try:
+                oldest = self._conn.execute("SELECT min(version) FROM changes").fetchone()[0]
+                rows = self._conn.execute(
+                    "SELECT version, id, data FROM changes WHERE version > ? ORDER BY version", (version,)
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+        if not rows:
+            return version, []
+        latest = rows[-1][0]
+        # the changes right after `version` were compacted away, or one replaces everything
+        if (oldest is not None and oldest > version + 1) or any(id is None for _, id, _ in rows):
+            return latest, None
+        return latest, [
+            (id, Service.model_validate_json(data) if data is not None else None)
+            for _, id, data in rows
+        ]
+
+    def compact(self):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM changes WHERE version <= (SELECT max(version) FROM changes) - ?",
+                (self.KEEP_CHANGES,),
+            )
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class LogStore(ServiceStore):
+    """An append-only log of changes, one JSON line each, replayed at startup.
+
+    Compaction rewrites the log as one line per live service.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._services: dict[str, Service] = {}
+        self._records = 0
+        self._file = None
+
+    def load(self) -> dict[str, Service]:
+        self.load_failed = True
+        self._services = {}
+        self._records = 0
+        if self.path.exists():
+            with open(self.path, 'r') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a crash may leave the last line truncated
+                        break
+                    if record['op'] == 'put':
+                        self._services[record['id']] = Service.model_validate(record['service'])
+                    elif record['op'] == 'delete':
+                        self._services.pop(record['id'], None)
+                    self._records += 1
+        self.load_failed = False
+        # rewrite the log, dropping the truncated tail if any
+        self.compact()
+        return dict(self._services)
+
+    @property
+    def garbage_ratio(self) -> float:
+        """Share of the records in the log that are obsolete."""
+        if self._records == 0:
+            return 0.0
+        return 1 - len(self._services) / self._records
+
+    def _append(self, record: dict):
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(json.dumps(record) + '\n')
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._records += 1
+
+    def put(self, id: str, service: Service):
+        with self._lock:
+            self._check_writable()
+            # appended first, so that a failed write leaves the services as they were
+            self._append({'op': 'put', 'id': id, 'service': service.model_dump()})
+            self._services[id] = service
+
+    def delete(self, id: str):
+        with self._lock:
+            self._check_writable()
+            if id in self._services:
+                self._append({'op': 'delete', 'id': id})
+                del self._services[id]
+
+    def save(self, services: dict[str, Service]):
+        with self._lock:
+            self._check_writable()
+            self._services = dict(services)
+        self.compact()
+
+    def compact(self):
+        with self._lock:
+            self._check_writable()
+            atomic_write(self.path, ''.join(
+                json.dumps({'op': 'put', 'id': id, 'service': service.model_dump()}) + '\n'
+                for id, service in self._services.items()
+            ))
+            self._records = len(self._services)
+            # the old handle points to the replaced file
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,68 @@
+import httpx
+
+from .. import config
+from .schema import Service
+
+# shared client, created and closed by the lifespan of the app
+_client: httpx.AsyncClient | None = None
+
+
+def start_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                config.UPSTREAM_READ_TIMEOUT,
+                connect=config.UPSTREAM_CONNECT_TIMEOUT,
+            ),
+            limits=httpx.Limits(
+                max_connections=config.UPSTREAM_MAX_CONNECTIONS,
+                max_keepalive_connections=config.UPSTREAM_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=config.UPSTREAM_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    # lazily start the client, e.g. when the app runs without lifespan events
+    return _client if _client is not None else start_client()
+
+
+def get_timeout(service: Service) -> httpx.Timeout:
+    """Builds the timeout of a single upstream request.
+
+    Values not set on the service fall back to the global configuration.
+    """
+    connect = service.connect_timeout
+    read = service.read_timeout
+    return httpx.Timeout(
+        read if read is not None else config.UPSTREAM_READ_TIMEOUT,
+        connect=connect if connect is not None else config.UPSTREAM_CONNECT_TIMEOUT,
+    )
+
+
+def pool_stats() -> dict[str, int]:
+    """Counts the pooled connections of the client and the requests waiting for one.
+
+    Reads the internals of the httpcore pool, so it reports nothing if the
+    client runs on another transport, e.g. in benchmarks.
+    """
+    pool = getattr(getattr(_client, '_transport', None), '_pool', None)
+    if pool is None:
+        return {}
+    connections = list(pool.connections)
+    idle = sum(1 for connection in connections if connection.is_idle())
+    queued = sum(1 for request in getattr(pool, '_requests', []) if request.is_queued())
+    return {
+        'active': len(connections) - idle,
+        'idle': idle,
+        'queued': queued,
+    }
@@ -1,4 +1,5 @@
-import socket
+import json
+from typing import Iterator
 from urllib.parse import urlparse
 
 def validate_url(url: str, allowed_origins: list[str]) -> bool:
@@ -15,17 +16,22 @@ def validate_url(url: str, allowed_origins: list[str]) -> bool:
     
     return False
 
-def is_same_process(
-    hostname_a: str = '',
-    port_a: int = 0,
-    hostname_b: str = '',
-    port_b: int = 0
-) -> bool:
+def iter_ndjson(body: bytes) -> Iterator[dict | Exception]:
+    """Parses newline-delimited JSON objects.
 
-    addr_a = socket.gethostbyname(hostname_a) 
-    addr_b = socket.gethostbyname(hostname_b) 
+    Lines that are not JSON objects are yielded as exceptions, so that the
+    caller can report them without stopping at the first bad line.
+    """
+    for line in body.splitlines():
+        if line.strip():
+            yield parse_json_object(line)
 
-    same_host = addr_a == addr_b 
-    same_port = int(port_a) == int(port_b)
 
-    return same_host and same_port
+def parse_json_object(line: bytes | str) -> dict | Exception:
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        return ValueError(f"Invalid JSON: {e}")
+    if not isinstance(item, dict):
+        return ValueError("Each item must be a JSON object")
+    return item
@@ -0,0 +1,150 @@
+import math
+from typing import Any, Callable
+
+from .schema import Service, ServiceParameter
+
+Validator = Callable[[dict], dict]
+
+
+class PayloadError(Exception):
+
+    def __init__(self, errors: list[str]):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+def _to_number(value: Any) -> float:
+    if isinstance(value, bool):
+        raise ValueError
+    if isinstance(value, (int, float)):
+        number = float(value)
+    elif isinstance(value, str):
+        number = float(value.strip())
+    else:
+        raise ValueError
+    if not math.isfinite(number):
+        raise ValueError
+    return number
+
+
+def _to_integer(value: Any) -> int:
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    number = _to_number(value)
+    if not number.is_integer():
+        raise ValueError
+    return int(number)
+
+
+def _to_string(value: Any) -> str:
+    if not isinstance(value, str):
+        raise ValueError
+    return value
+
+
+def _to_boolean(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    raise ValueError
+
+
+def _to_object(value: Any) -> dict:
+    if not isinstance(value, dict):
+        raise ValueError
+    return value
+
+
+def _array_of_shape(shape: tuple[int, ...]) -> Callable[[Any], list]:
+    def check(value: Any, depth: int = 0) -> list:
+        if not isinstance(value, list):
+            raise ValueError
+        if depth < len(shape):
+            if shape[depth] >= 0 and len(value) != shape[depth]:
+                raise ValueError
+            if depth + 1 < len(shape):
+                for item in value:
+                    check(item, depth + 1)
+        return value
+    return check
+
+
+def _any(value: Any) -> Any:
+    return value
+
+
+def _describe(parameter: ServiceParameter) -> str:
+    if parameter.data_type == 'array' and parameter.shape:
+        return f"an array of shape {parameter.shape}"
+    return {
+        'number': "a number",
+        'integer': "an integer",
+        'string': "a string",
+        'boolean': "a boolean",
+        'array': "an array",
+        'object': "an object",
+    }.get(parameter.data_type or '', "a value")
+
+
+def _converter(parameter: ServiceParameter) -> Callable[[Any], Any]:
+    if parameter.data_type == 'array':
+        return _array_of_shape(tuple(parameter.shape or ()))
+    return {
+        'number': _to_number,
+        'integer': _to_integer,
+        'string': _to_string,
+        'boolean': _to_boolean,
+        'object': _to_object,
+    }.get(parameter.data_type or '', _any)
+
+
+def compile_validator(parameters: list[ServiceParameter]) -> Validator:
+    """Builds a function checking and coercing a payload against `parameters`.
+
+    The function returns the declared fields in the declared order, since
+    executables may rely on it, followed by any other field as is; it raises
+    PayloadError listing every missing or invalid field.
+    """
+    if not parameters:
+        return _any
+    fields = [(parameter.name, _converter(parameter), _describe(parameter)) for parameter in parameters]
+    names = {name for name, _, _ in fields}
+
+    def validate(payload: dict) -> dict:
+        result = {}
+        errors = []
+        for name, convert, description in fields:
+            if name not in payload:
+                errors.append(f"Field '{name}' is missing.")
+                continue
+            try:
+                result[name] = convert(payload[name])
+            except (TypeError, ValueError, OverflowError):
+                errors.append(f"Field '{name}' must be {description}.")
+        if errors:
+            raise PayloadError(errors)
+        if len(payload) > len(result):
+            result.update((key, value) for key, value in payload.items() if key not in names)
+        return result
+
+    return validate
+
+
+class ValidatorCache:
+    """The compiled validator of each service, rebuilt only when the service is replaced."""
+
+    def __init__(self):
+        self._validators: dict[str, tuple[Service, Validator]] = {}
+
+    def get(self, service_id: str, service: Service) -> Validator:
+        cached = self._validators.get(service_id)
+        # services are never modified in place, a change always brings a new object
+        if cached is not None and cached[0] is service:
+            return cached[1]
+        validator = compile_validator(service.parameters)
+        self._validators[service_id] = (service, validator)
+        return validator
+
+    def forget(self, service_id: str):
+        self._validators.pop(service_id, None)
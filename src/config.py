@@ -3,13 +3,115 @@ from starlette.config import Config
 # load environment variables
 configDict = Config('.env')
 
+# 'production' disables auto-reload and warms the applications in the background
+STARTUP_MODE = configDict.get('STARTUP_MODE', default='development')
+PRODUCTION = STARTUP_MODE == 'production'
+
 FRONTEND_PROCESS: str = f"http://{configDict.get('FRONTEND_HOST')}:{configDict.get('FRONTEND_PORT')}"
 
 THIS_HOST = configDict.get('THIS_HOST', default='localhost')
 THIS_PORT = int(configDict.get('THIS_PORT', default=8000))
 THIS_PROCESS: str = f"http://{THIS_HOST}:{THIS_PORT}"
+# worker processes of the api application; more than one requires a shared store
+API_WORKERS = int(configDict.get('API_WORKERS', default=1))
+
+# seconds a verified api key, valid or not, is remembered
+API_KEY_CACHE_TTL = float(configDict.get('API_KEY_CACHE_TTL', default=30.0))
+API_KEY_CACHE_MAX_ENTRIES = int(configDict.get('API_KEY_CACHE_MAX_ENTRIES', default=10000))
+
+# storage of the services: 'json', 'sqlite' or 'log' (append-only);
+# 'json' rewrites the whole file on each change, so it only suits small
+# registries; only 'sqlite' can be shared by several workers, so it is the default then
+SERVICES_DB_BACKEND = configDict.get('SERVICES_DB_BACKEND', default='sqlite' if API_WORKERS > 1 else 'json')
+# seconds between two checks for the changes made by other workers
+SERVICES_DB_SYNC_INTERVAL = float(configDict.get('SERVICES_DB_SYNC_INTERVAL', default=0.5))
+SERVICES_DB_COMPACT_INTERVAL = float(configDict.get('SERVICES_DB_COMPACT_INTERVAL', default=300.0))
+# the append-only log is compacted when this share of its records is obsolete
+SERVICES_DB_COMPACT_RATIO = float(configDict.get('SERVICES_DB_COMPACT_RATIO', default=0.5))
 
 DEMO_HOST = configDict.get('DEMO_HOST', default='localhost')
 DEMO_PORT = configDict.get('DEMO_PORT', default=8001)
 
+# models kept in memory by the demo application
+DEMO_MODELS_MEMORY_BUDGET = int(configDict.get('DEMO_MODELS_MEMORY_BUDGET', default=256 * 1024 * 1024))
+DEMO_MODELS_CHECK_INTERVAL = float(configDict.get('DEMO_MODELS_CHECK_INTERVAL', default=1.0))
+# use the compiled (pickle-free, memory-mapped) artifacts when available
+DEMO_MODELS_COMPILED = configDict.get('DEMO_MODELS_COMPILED', cast=bool, default=True)
+
+# micro-batching of concurrent single-sample predictions
+DEMO_BATCH_WINDOW = float(configDict.get('DEMO_BATCH_WINDOW', default=0.002))
+DEMO_MAX_BATCH_SIZE = int(configDict.get('DEMO_MAX_BATCH_SIZE', default=64))
+
+# where predictions run: 'process', 'thread' or 'inline' (on the event loop)
+DEMO_EXECUTOR_KIND = configDict.get('DEMO_EXECUTOR_KIND', default='process')
+DEMO_EXECUTOR_WORKERS = int(configDict.get('DEMO_EXECUTOR_WORKERS', default=0)) or None
+# models whose predict releases the GIL, run in threads even with kind 'process'
+DEMO_EXECUTOR_THREAD_MODELS = [
+    name.strip() for name in configDict.get('DEMO_EXECUTOR_THREAD_MODELS', default='').split(',') if name.strip()
+]
+DEMO_EXECUTOR_MAX_PENDING = int(configDict.get('DEMO_EXECUTOR_MAX_PENDING', default=256))
+DEMO_EXECUTOR_QUEUE_TIMEOUT = float(configDict.get('DEMO_EXECUTOR_QUEUE_TIMEOUT', default=1.0))
+
 ALLOW_ORIGINS = [FRONTEND_PROCESS, THIS_PROCESS]
+
+SESSION_SECRET_KEY = configDict.get('SESSION_SECRET_KEY', default='!secret')  # TODO Use a real secret key in production
+
+# upstream connection pool (shared by every service)
+UPSTREAM_CONNECT_TIMEOUT = float(configDict.get('UPSTREAM_CONNECT_TIMEOUT', default=5.0))
+UPSTREAM_READ_TIMEOUT = float(configDict.get('UPSTREAM_READ_TIMEOUT', default=30.0))
+UPSTREAM_MAX_CONNECTIONS = int(configDict.get('UPSTREAM_MAX_CONNECTIONS', default=100))
+UPSTREAM_MAX_KEEPALIVE_CONNECTIONS = int(configDict.get('UPSTREAM_MAX_KEEPALIVE_CONNECTIONS', default=20))
+UPSTREAM_KEEPALIVE_EXPIRY = float(configDict.get('UPSTREAM_KEEPALIVE_EXPIRY', default=5.0))
+# retries of an upstream call failing on a connection error or a 502/503/504,
+# unless the service sets its own; the backoff doubles on each retry
+UPSTREAM_RETRIES = int(configDict.get('UPSTREAM_RETRIES', default=0))
+UPSTREAM_RETRY_BACKOFF = float(configDict.get('UPSTREAM_RETRY_BACKOFF', default=0.1))
+# seconds a call waits for a free slot of a service that sets max_concurrency
+UPSTREAM_BULKHEAD_TIMEOUT = float(configDict.get('UPSTREAM_BULKHEAD_TIMEOUT', default=1.0))
+# consecutive failures that open the circuit of a service, seconds before
+# it is probed again, and successful probes that close it
+BREAKER_FAILURE_THRESHOLD = int(configDict.get('BREAKER_FAILURE_THRESHOLD', default=5))
+BREAKER_RESET_TIMEOUT = float(configDict.get('BREAKER_RESET_TIMEOUT', default=30.0))
+BREAKER_HALF_OPEN_PROBES = int(configDict.get('BREAKER_HALF_OPEN_PROBES', default=1))
+# how a replica is picked among those of a service: 'least-outstanding' or 'ewma'
+LOAD_BALANCING_POLICY = configDict.get('LOAD_BALANCING_POLICY', default='least-outstanding')
+# consecutive failures that eject a replica, and seconds before it is used again
+REPLICA_EJECT_FAILURES = int(configDict.get('REPLICA_EJECT_FAILURES', default=3))
+REPLICA_EJECT_DURATION = float(configDict.get('REPLICA_EJECT_DURATION', default=30.0))
+# seconds before the resolved address of an executable url is refreshed
+DNS_CACHE_TTL = float(configDict.get('DNS_CACHE_TTL', default=60.0))
+
+# upstream calls in flight for a single batch request
+BATCH_MAX_CONCURRENCY = int(configDict.get('BATCH_MAX_CONCURRENCY', default=16))
+
+# background jobs: running at once, overall and per service, waiting at most,
+# seconds their results are kept, and longest wait of a long-polling client
+JOBS_WORKERS = int(configDict.get('JOBS_WORKERS', default=32))
+JOBS_SERVICE_CONCURRENCY = int(configDict.get('JOBS_SERVICE_CONCURRENCY', default=8))
+JOBS_MAX_QUEUED = int(configDict.get('JOBS_MAX_QUEUED', default=10000))
+JOBS_TTL = float(configDict.get('JOBS_TTL', default=600.0))
+JOBS_MAX_WAIT = float(configDict.get('JOBS_MAX_WAIT', default=30.0))
+
+# whether identical concurrent calls to a service share one upstream call,
+# unless the service says otherwise; off by default, since it is only safe
+# for deterministic services without side effects, which opt in with `coalesce`
+COALESCE_REQUESTS = configDict.get('COALESCE_REQUESTS', cast=bool, default=False)
+
+# whether the outputs of the services are forwarded to clients as returned by
+# the executables, without being decoded, unless the service says otherwise
+UPSTREAM_PASSTHROUGH = configDict.get('UPSTREAM_PASSTHROUGH', cast=bool, default=True)
+
+# journal of the requests to the services, for replaying them with
+# `python -m benchmarks.replay`; files are rotated past CAPTURE_MAX_BYTES,
+# requests beyond CAPTURE_MAX_BUFFERED, or beyond CAPTURE_MAX_BUFFERED_BYTES
+# of bodies, waiting to be written are dropped
+CAPTURE_TRAFFIC = configDict.get('CAPTURE_TRAFFIC', cast=bool, default=False)
+CAPTURE_MAX_BYTES = int(configDict.get('CAPTURE_MAX_BYTES', default=64 * 1024 * 1024))
+CAPTURE_MAX_FILES = int(configDict.get('CAPTURE_MAX_FILES', default=10))
+CAPTURE_MAX_BUFFERED = int(configDict.get('CAPTURE_MAX_BUFFERED', default=10000))
+CAPTURE_MAX_BUFFERED_BYTES = int(configDict.get('CAPTURE_MAX_BUFFERED_BYTES', default=32 * 1024 * 1024))
+# bodies larger than this are left out of the journal
+CAPTURE_MAX_BODY = int(configDict.get('CAPTURE_MAX_BODY', default=1024 * 1024))
+
+# outputs cached for the services that set a cache_ttl
+RESPONSE_CACHE_MAX_ENTRIES = int(configDict.get('RESPONSE_CACHE_MAX_ENTRIES', default=10000))
@@ -0,0 +1,226 @@
+"""Pickle-free model artifacts.
+
+A compiled model is a directory holding a `meta.json` file and one `.npy`
+file per array. Arrays are memory-mapped when loaded, so that loading is
+almost instant and worker processes share the same pages; predictions are
+computed with NumPy only.
+
+Supported models: DecisionTreeClassifier and SVC (linear and rbf kernels).
+"""
+import hashlib
+import json
+import os
+import shutil
+import sys
+import uuid
+from pathlib import Path
+
+import numpy as np
+
+FORMAT_VERSION = 1
+META_FILENAME = 'meta.json'
+
+
+def meta_path(directory: Path) -> Path:
+    return directory / META_FILENAME
+
+
+def is_compiled(path: Path) -> bool:
+    return path.is_dir() and meta_path(path).exists()
+
+
+def _labels(meta: dict) -> dict[int, str] | None:
+    labels = meta.get('labels')
+    return {i: name for i, name in enumerate(labels)} if labels else None
+
+
+def _check_finite(X: np.ndarray):
+    # sklearn rejects these rows rather than predicting an arbitrary class
+    if not np.isfinite(X).all():
+        raise ValueError("Input X contains NaN or infinity.")
+
+
+class CompiledTree:
+    """Evaluates a decision tree classifier level by level for all rows at once."""
+
+    def __init__(self, meta: dict, arrays: dict[str, np.ndarray]):
+        self.n_features_in_ = meta['n_features_in']
+        self.labels = _labels(meta)
+        self.max_depth = meta['max_depth']
+        self.classes_ = arrays['classes']
+        self.children_left = arrays['children_left']
+        self.children_right = arrays['children_right']
+        self.feature = arrays['feature']
+        self.threshold = arrays['threshold']
+        self.leaf_class = arrays['leaf_class']
+
+    def predict(self, X) -> np.ndarray:
+        # sklearn compares float32 features against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).reshape(-1, self.n_features_in_)
+        _check_finite(X)
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.intp)
+        for _ in range(self.max_depth):
+            left = self.children_left[node]
+            is_leaf = left == -1
+            if is_leaf.all():
+                break
+            feature = np.where(is_leaf, 0, self.feature[node])
+            go_left = X[rows, feature] <= self.threshold[node]
+            node = np.where(is_leaf, node, np.where(go_left, left, self.children_right[node]))
+        return self.classes_[self.leaf_class[node]]
+
+
+class CompiledSVC:
+    """Evaluates a one-vs-one SVC classifier, voting like libsvm."""
+
+    def __init__(self, meta: dict, arrays: dict[str, np.ndarray]):
+        self.n_features_in_ = meta['n_features_in']
+        self.labels = _labels(meta)
+        self.kernel = meta['kernel']
+        self.gamma = meta['gamma']
+        self.classes_ = arrays['classes']
+        self.support_vectors = arrays['support_vectors']
+        self.dual_coef = arrays['dual_coef']
+        self.intercept = arrays['intercept']
+        self.n_support = arrays['n_support']
+        self._starts = np.concatenate([[0], np.cumsum(self.n_support)[:-1]])
+        self._sv_sq_norms = np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)
+
+    def _kernel(self, X: np.ndarray) -> np.ndarray:
+        products = X @ self.support_vectors.T
+        if self.kernel == 'linear':
+            return products
+        sq_distances = np.einsum('ij,ij->i', X, X)[:, None] + self._sv_sq_norms[None, :] - 2 * products
+        return np.exp(-self.gamma * np.maximum(sq_distances, 0))
+
+    def predict(self, X) -> np.ndarray:
+        X = np.asarray(X, dtype=np.float64).reshape(-1, self.n_features_in_)
+        _check_finite(X)
+        K = self._kernel(X)
+        n_classes = len(self.classes_)
+        votes = np.zeros((len(X), n_classes), dtype=np.intp)
+        pair = 0
+        for i in range(n_classes):
+            sv_i = slice(self._starts[i], self._starts[i] + self.n_support[i])
+            for j in range(i + 1, n_classes):
+                sv_j = slice(self._starts[j], self._starts[j] + self.n_support[j])
+                decision = (
+                    K[:, sv_i] @ self.dual_coef[j - 1, sv_i]
+                    + K[:, sv_j] @ self.dual_coef[i, sv_j]
+                    + self.intercept[pair]
+                )
+                positive = decision > 0
+                votes[positive, i] += 1
+                votes[~positive, j] += 1
+                pair += 1
+        return self.classes_[np.argmax(votes, axis=1)]
+
+
+COMPILED_KINDS = {
+    'tree': CompiledTree,
+    'svc': CompiledSVC,
+}
+
+
+def _tree_arrays(model) -> tuple[dict, dict[str, np.ndarray]]:
+    tree = model.tree_
+    meta = {'kind': 'tree', 'max_depth': int(tree.max_depth) + 1}
+    arrays = {
+        'classes': np.asarray(model.classes_),
+        'children_left': tree.children_left.astype(np.intp),
+        'children_right': tree.children_right.astype(np.intp),
+        'feature': tree.feature.astype(np.intp),
+        'threshold': tree.threshold.astype(np.float64),
+        'leaf_class': np.argmax(tree.value[:, 0, :], axis=1).astype(np.intp),
+    }
+    return meta, arrays
+
+
+def _svc_arrays(model) -> tuple[dict, dict[str, np.ndarray]]:
+    if model.kernel not in ('linear', 'rbf'):
+        raise ValueError(f"Unsupported SVC kernel '{model.kernel}'")
+    dual_coef = np.asarray(model.dual_coef_, dtype=np.float64)
+    intercept = np.asarray(model.intercept_, dtype=np.float64)
+    # sklearn flips the signs of binary models; store them as libsvm computes them
+    if len(model.classes_) == 2:
+        dual_coef, intercept = -dual_coef, -intercept
+    meta = {'kind': 'svc', 'kernel': model.kernel, 'gamma': float(model._gamma)}
+    arrays = {
+        'classes': np.asarray(model.classes_),
+        'support_vectors': np.asarray(model.support_vectors_, dtype=np.float64),
+        'dual_coef': dual_coef,
+        'intercept': intercept,
+        'n_support': np.asarray(model.n_support_, dtype=np.intp),
+    }
+    return meta, arrays
+
+
+def export_model(model, directory: Path, labels: list[str] | None = None):
+    """Writes a fitted sklearn model as a compiled artifact in `directory`.
+
+    `labels` optionally names the predicted classes, by class value.
+
+    The artifact is written next to the destination and swapped in with a
+    rename, so that readers never see a partial artifact.
+    """
+    if hasattr(model, 'tree_'):
+        meta, arrays = _tree_arrays(model)
+    elif hasattr(model, 'support_vectors_'):
+        meta, arrays = _svc_arrays(model)
+    else:
+        raise ValueError(f"Cannot compile a {type(model).__name__}")
+
+    meta['format'] = FORMAT_VERSION
+    meta['n_features_in'] = int(model.n_features_in_)
+    meta['arrays'] = sorted(arrays)
+    if labels is not None:
+        meta['labels'] = [str(label) for label in labels]
+
+    directory = Path(directory)
+    staging = directory.with_name(f"{directory.name}.{uuid.uuid4().hex}.tmp")
+    staging.mkdir(parents=True)
+    digest = hashlib.sha256()
+    for name in meta['arrays']:
+        array = np.ascontiguousarray(arrays[name])
+        np.save(staging / f"{name}.npy", array, allow_pickle=False)
+        digest.update(name.encode())
+        digest.update(array.tobytes())
+    meta['digest'] = digest.hexdigest()
+    with open(meta_path(staging), 'w') as file:
+        json.dump(meta, file, indent=2)
+
+    if directory.exists():
+        old = directory.with_name(f"{directory.name}.{uuid.uuid4().hex}.old")
+        os.replace(directory, old)
+        os.replace(staging, directory)
+        shutil.rmtree(old)
+    else:
+        os.replace(staging, directory)
+
+
+def load_model(directory: Path):
+    with open(meta_path(directory), 'r') as file:
+        meta = json.load(file)
+    if meta.get('format') != FORMAT_VERSION:
+        raise ValueError(f"Unsupported artifact format {meta.get('format')} in {directory}")
+    arrays = {
+        name: np.load(directory / f"{name}.npy", mmap_mode='r', allow_pickle=False)
+        for name in meta['arrays']
+    }
+    return COMPILED_KINDS[meta['kind']](meta, arrays)
+
+
+def artifact_size(directory: Path) -> int:
+    return sum(path.stat().st_size for path in directory.iterdir())
+
+
+if __name__ == '__main__':
+    # converts existing pickles: python -m src.demo.artifacts model.pkl [...]
+    import pickle
+
+    for filepath in sys.argv[1:]:
+        pickle_path = Path(filepath)
+        with open(pickle_path, 'rb') as file:
+            export_model(pickle.load(file), pickle_path.with_suffix(''))
+        print(f"{pickle_path} -> {pickle_path.with_suffix('')}")
@@ -0,0 +1,205 @@
+import asyncio
+import bisect
+import time
+from dataclasses import dataclass, field
+from logging import Logger
+from typing import Any, Awaitable, Callable, Sequence
+
+import numpy as np
+
+# upper bounds of the histogram buckets
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+WAIT_TIME_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+
+def _histogram(buckets: Sequence[float]) -> list[int]:
+    # the extra slot counts the values above the last bucket
+    return [0] * (len(buckets) + 1)
+
+
+@dataclass
+class BatcherStats:
+    batches: int = 0
+    items: int = 0
+    batch_size_counts: list[int] = field(default_factory=lambda: _histogram(BATCH_SIZE_BUCKETS))
+    wait_time_counts: list[int] = field(default_factory=lambda: _histogram(WAIT_TIME_BUCKETS))
+    wait_time_sum: float = 0.0
+    wait_time_max: float = 0.0
+
+
+class MicroBatcher:
+    """Groups concurrent single-sample predictions into one predict call.
+
+    Rows submitted within `window` seconds of each other (or until
+    `max_batch_size` rows are queued) are stacked into a matrix and predicted
+    together; each caller then receives its own prediction. When traffic is
+    low, a lone row is flushed right away instead of waiting for the window.
+
+    `predict` is awaited in a task of its own, so the next batch can be
+    collected while the previous one is still running.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        predict: Callable[[np.ndarray], Awaitable[Sequence[Any]]],
+        logger: Logger,
+        max_batch_size: int = 64,
+        window: float = 0.002,
+    ):
+        self.name = name
+        self.predict = predict
+        self.logger = logger
+        self.max_batch_size = max_batch_size
+        self.window = window
+        self.stats = BatcherStats()
+        self._queue: asyncio.Queue | None = None
+        self._arrived: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._flushes: set[asyncio.Task] = set()
+        self._last_batch_size = 0
+
+    def start(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._queue = asyncio.Queue()
+        self._arrived = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name=f"batcher-{self.name}")
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if self._flushes:
+            await asyncio.gather(*self._flushes, return_exceptions=True)
+        # fail whatever is still queued
+        while self._queue is not None and not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError(f"Batcher '{self.name}' stopped"))
+        self._task = None
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def submit(self, row: Sequence[float]) -> Any:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((row, future, time.perf_counter()))
+        self._arrived.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            # let the requests that are already running enqueue their rows
+            await asyncio.sleep(0)
+            self._drain(batch)
+
+            # wait for more rows only if traffic suggests they are coming
+            if len(batch) > 1 or self._last_batch_size > 1:
+                deadline = loop.time() + self.window
+                while len(batch) < self.max_batch_size:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    self._arrived.clear()
+                    try:
+                        await asyncio.wait_for(self._arrived.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._drain(batch)
+
+            flush = asyncio.create_task(self._flush(batch))
+            self._flushes.add(flush)
+            flush.add_done_callback(self._flushes.discard)
+
+    def _drain(self, batch: list):
+        while len(batch) < self.max_batch_size and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+
+    async def _flush(self, batch: list):
+        self._last_batch_size = len(batch)
+        started = time.perf_counter()
+        self._record(batch, started)
+
+        try:
+            predictions = await self.predict(np.asarray([row for row, _, _ in batch], dtype=np.float64))
+        except ValueError as e:
+            if len(batch) == 1:
+                self._fail(batch, e)
+                return
+            # a row the model rejects; predict the rows one by one, so that only the faulty ones fail
+            self.logger.warning(f"Batch prediction failed in '{self.name}', retrying row by row: {e}")
+            try:
+                await asyncio.gather(*(self._flush_one(item) for item in batch))
+            except asyncio.CancelledError:
+                self._fail(batch, RuntimeError(f"Batcher '{self.name}' stopped"))
+                raise
+            return
+        except asyncio.CancelledError:
+            self._fail(batch, RuntimeError(f"Batcher '{self.name}' stopped"))
+            raise
+        except Exception as e:
+            # e.g. an overloaded executor or a broken pool: retrying would only add load
+            self.logger.error(f"Batch prediction failed in '{self.name}': {e}")
+            self._fail(batch, e)
+            return
+
+        for (_, future, _), prediction in zip(batch, predictions):
+            # the caller may have gone away in the meantime
+            if not future.done():
+                future.set_result(prediction)
+
+    def _fail(self, batch: list, error: BaseException):
+        for _, future, _ in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    async def _flush_one(self, item: tuple):
+        row, future, _ = item
+        try:
+            prediction = (await self.predict(np.asarray([row], dtype=np.float64)))[0]
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(prediction)
+
+    def _record(self, batch: list, now: float):
+        stats = self.stats
+        stats.batches += 1
+        stats.items += len(batch)
+        stats.batch_size_counts[bisect.bisect_left(BATCH_SIZE_BUCKETS, len(batch))] += 1
+        for _, _, submitted in batch:
+            wait = now - submitted
+            stats.wait_time_sum += wait
+            stats.wait_time_max = max(stats.wait_time_max, wait)
+            stats.wait_time_counts[bisect.bisect_left(WAIT_TIME_BUCKETS, wait)] += 1
+
+    def snapshot(self) -> dict:
+        stats = self.stats
+        return {
+            'queue_depth': self.queue_depth(),
+            'max_batch_size': self.max_batch_size,
+            'window': self.window,
+            'batches': stats.batches,
+            'items': stats.items,
+            'mean_batch_size': stats.items / stats.batches if stats.batches else 0.0,
+            'batch_size_histogram': _labelled(BATCH_SIZE_BUCKETS, stats.batch_size_counts),
+            'mean_wait_time': stats.wait_time_sum / stats.items if stats.items else 0.0,
+            'max_wait_time': stats.wait_time_max,
+            'wait_time_histogram': _labelled(WAIT_TIME_BUCKETS, stats.wait_time_counts),
+        }
+
+
+def _labelled(buckets: Sequence[float], counts: list[int]) -> dict[str, int]:
+    labels = [f"<={bucket}" for bucket in buckets] + [f">{buckets[-1]}"]
+    return dict(zip(labels, counts))
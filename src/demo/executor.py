@@ -0,0 +1,148 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from logging import Logger
+from pathlib import Path
+from typing import Any, Sequence
+
+import numpy as np
+
+from .monitoring import BATCH_SIZE, PREDICT_LATENCY, REJECTED
+from .registry import ModelRegistry
+
+EXECUTOR_KINDS = ('inline', 'thread', 'process')
+
+# registry of a process-pool worker, filled by _init_worker
+_WORKER_MODELS: ModelRegistry | None = None
+
+
+class ExecutorOverloaded(Exception):
+    """Raised when the submission queue of the executor is full."""
+
+
+def _init_worker(specs: list[tuple[str, Path]], memory_budget: int):
+    global _WORKER_MODELS
+    _WORKER_MODELS = ModelRegistry(logging.getLogger("uvicorn"), memory_budget)
+    for name, path in specs:
+        _WORKER_MODELS.register(name, path)
+    _WORKER_MODELS.preload()
+
+
+def _predict_in_worker(name: str, matrix: np.ndarray) -> np.ndarray:
+    return _WORKER_MODELS.get(name).model.predict(matrix)
+
+
+def _warm_worker() -> int:
+    return os.getpid()
+
+
+class InferenceExecutor:
+    """Runs the predictions of the demo models off the event loop.
+
+    Models listed in `thread_models` (those whose predict releases the GIL)
+    run in a thread pool sharing the models of `registry`; the others run in
+    a process pool whose workers load their own copy of every model at
+    startup. With kind 'inline', predictions run on the event loop.
+
+    At most `max_pending` predictions are queued or running; callers wait up
+    to `queue_timeout` seconds for a slot, then ExecutorOverloaded is raised.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        logger: Logger,
+        kind: str = 'process',
+        workers: int | None = None,
+        thread_models: Sequence[str] = (),
+        max_pending: int = 256,
+        queue_timeout: float = 1.0,
+    ):
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind '{kind}', expected one of {EXECUTOR_KINDS}")
+        self.registry = registry
+        self.logger = logger
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.thread_models = set(thread_models)
+        self.max_pending = max_pending
+        self.queue_timeout = queue_timeout
+        self._thread_pool: ThreadPoolExecutor | None = None
+        self._process_pool: ProcessPoolExecutor | None = None
+        self._slots: asyncio.Semaphore | None = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def start(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        if self.kind == 'inline':
+            return
+        if self._thread_pool is None and (self.kind == 'thread' or self.thread_models):
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix='inference')
+        if self._process_pool is None and self.kind == 'process':
+            specs = [(name, self.registry.path_of(name)) for name in self.registry.names()]
+            self._process_pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(specs, self.registry.memory_budget),
+            )
+
+    async def warm(self):
+        """Spawns the process-pool workers so that they load the models now."""
+        self.start()
+        if self._process_pool is None:
+            return
+        loop = asyncio.get_running_loop()
+        pids = await asyncio.gather(*[
+            loop.run_in_executor(self._process_pool, _warm_worker) for _ in range(self.workers)
+        ])
+        self.logger.info(f"Inference workers ready: {len(set(pids))} processes")
+
+    def shutdown(self):
+        for pool in (self._thread_pool, self._process_pool):
+            if pool is not None:
+                pool.shutdown(wait=False, cancel_futures=True)
+        self._thread_pool = None
+        self._process_pool = None
+        self._slots = None
+
+    def _pool_for(self, name: str) -> Executor | None:
+        if self.kind == 'inline':
+            return None
+        if self.kind == 'thread' or name in self.thread_models:
+            return self._thread_pool
+        return self._process_pool
+
+    async def run(self, name: str, matrix: np.ndarray) -> Any:
+        self.start()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            REJECTED.inc(name)
+            raise ExecutorOverloaded(f"Too many pending predictions (max {self.max_pending})")
+
+        self._pending += 1
+        started_at = time.perf_counter()
+        try:
+            pool = self._pool_for(name)
+            if pool is None:
+                return self.registry.get(name).model.predict(matrix)
+            loop = asyncio.get_running_loop()
+            if pool is self._process_pool:
+                return await loop.run_in_executor(pool, _predict_in_worker, name, matrix)
+            model = self.registry.get(name).model
+            return await loop.run_in_executor(pool, model.predict, matrix)
+        finally:
+            self._pending -= 1
+            self._slots.release()
+            PREDICT_LATENCY.observe(time.perf_counter() - started_at, name)
+            BATCH_SIZE.observe(len(matrix), name)
@@ -1,15 +1,88 @@
+from ..startup import StartupProfile
+
+# created first, so that the profile covers the imports below
+PROFILE = StartupProfile()
+
+import asyncio
+import json
 import logging
+from contextlib import asynccontextmanager
 from http import HTTPStatus
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.exceptions import RequestValidationError
+from pydantic import ValidationError
 
-from .schema import IrisPayload, DigitsPayload
-from .services import serve_digits, serve_iris
+from .. import config
+from ..metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from . import artifacts
+from .executor import ExecutorOverloaded
+from .monitoring import REGISTRY
+from .schema import (
+    DigitsBatchPayload,
+    DigitsPayload,
+    IrisBatchPayload,
+    IrisPayload,
+)
+from .services import (
+    BATCHERS,
+    EXECUTOR,
+    MODELS,
+    decode_buffer,
+    serve_digits,
+    serve_digits_batch,
+    serve_digits_pixels,
+    serve_iris,
+    serve_iris_batch,
+)
 
 logger = logging.getLogger("uvicorn")
 
+# setup lifespan
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Context manager to handle application lifespan events.
+
+    Used to load the models into memory before the first request. In
+    production, models are loaded in the background, while /ready reports
+    that the application is not ready yet.
+    """
+    PROFILE.mark("import")
+    for batcher in BATCHERS:
+        batcher.start()
+
+    if config.PRODUCTION:
+        warm_up = PROFILE.warm_up_in_background(_warm_up(), logger)
+    else:
+        warm_up = None
+        await _warm_up()
+
+    yield
+
+    if warm_up is not None:
+        warm_up.cancel()
+    for batcher in BATCHERS:
+        await batcher.stop()
+    EXECUTOR.shutdown()
+
+
+async def _warm_up():
+    # unpickling imports sklearn; time it apart from reading the models
+    if any(not artifacts.is_compiled(MODELS.path_of(name)) for name in ('iris', 'digits')):
+        for module in ('sklearn.tree', 'sklearn.svm', 'sklearn.datasets'):
+            await asyncio.to_thread(PROFILE.import_module, module)
+    logger.info("Loading models...")
+    with PROFILE.phase("load models"):
+        await asyncio.to_thread(MODELS.preload, ['iris', 'digits'])
+    with PROFILE.phase("start inference workers"):
+        await EXECUTOR.warm()
+    PROFILE.mark_ready()
+    logger.info(f"Startup profile: {json.dumps(PROFILE.report())}")
+
+
 # setup FastAPI app
 app = FastAPI(
+    lifespan=lifespan,
     title='Experimental API / Demo models'
 )
 
@@ -26,9 +99,13 @@ async def use_iris(
         return {
             "message": HTTPStatus.OK.phrase,
             "status-code": HTTPStatus.OK,
-            "data": serve_iris(payload, logger)
+            "data": await serve_iris(payload, logger)
         }
-
+    except ExecutorOverloaded as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
@@ -36,24 +113,147 @@ async def use_iris(
         )
     
 
-@app.post("/digits", tags=["Models"])
+DIGITS_EXAMPLE = DigitsPayload(
+    pixels="0.0;0.0;10.0;16.0;16.0;11.0;0.0;0.0;0.0;1.0;11.0;"
+            "7.0;6.0;16.0;3.0;0.0;0.0;0.0;0.0;0.0;10.0;15.0;0.0;0.0;"
+            "0.0;0.0;0.0;0.0;15.0;7.0;0.0;0.0;0.0;0.0;0.0;0.0;15.0;"
+            "9.0;0.0;0.0;0.0;0.0;0.0;0.0;7.0;13.0;0.0;0.0;0.0;0.0;"
+            "5.0;4.0;10.0;16.0;0.0;0.0;0.0;0.0;10.0;16.0;16.0;10.0;0.0;0.0"
+)
+
+
+async def read_digits_pixels(request: Request):
+    """Reads the pixels from a JSON DigitsPayload or from a raw binary body.
+
+    Raw bodies (`application/octet-stream`) hold the 64 pixels as a buffer
+    of the dtype given in the `dtype` query parameter (uint8 by default).
+    """
+    body = await request.body()
+    if request.headers.get("content-type", "").startswith("application/octet-stream"):
+        try:
+            return decode_buffer(body, request.query_params.get("dtype", "uint8"))
+        except ValueError as e:
+            raise HTTPException(
+                status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+                detail=str(e)
+            )
+    if not body:
+        return DIGITS_EXAMPLE
+    try:
+        return DigitsPayload.model_validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+
+@app.post(
+    "/digits",
+    tags=["Models"],
+    openapi_extra={
+        "requestBody": {
+            "content": {
+                "application/json": {"schema": DigitsPayload.model_json_schema()},
+                "application/octet-stream": {"schema": {"type": "string", "format": "binary"}},
+            },
+        },
+    },
+)
 async def use_digits(
-    payload: DigitsPayload = DigitsPayload(
-        pixels="0.0;0.0;10.0;16.0;16.0;11.0;0.0;0.0;0.0;1.0;11.0;"
-                "7.0;6.0;16.0;3.0;0.0;0.0;0.0;0.0;0.0;10.0;15.0;0.0;0.0;"
-                "0.0;0.0;0.0;0.0;15.0;7.0;0.0;0.0;0.0;0.0;0.0;0.0;15.0;"
-                "9.0;0.0;0.0;0.0;0.0;0.0;0.0;7.0;13.0;0.0;0.0;0.0;0.0;"
-                "5.0;4.0;10.0;16.0;0.0;0.0;0.0;0.0;10.0;16.0;16.0;10.0;0.0;0.0"
+    payload = Depends(read_digits_pixels)
+):
+    try:
+        if isinstance(payload, DigitsPayload):
+            prediction = await serve_digits(payload, logger)
+        else:
+            prediction = await serve_digits_pixels(payload, logger)
+        return {
+            "message": HTTPStatus.OK.phrase,
+            "status-code": HTTPStatus.OK,
+            "data": prediction
+        }
+    except ExecutorOverloaded as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+
+
+@app.post("/iris/batch", tags=["Models"])
+async def use_iris_batch(
+    payload: IrisBatchPayload = IrisBatchPayload(
+        samples=[[0, 0, 0, 0]]
+    )
+):
+    try:
+        return {
+            "message": HTTPStatus.OK.phrase,
+            "status-code": HTTPStatus.OK,
+            "data": await serve_iris_batch(payload, logger)
+        }
+    except ExecutorOverloaded as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
+            detail=str(e)
+        )
+
+
+@app.post("/digits/batch", tags=["Models"])
+async def use_digits_batch(
+    payload: DigitsBatchPayload = DigitsBatchPayload(
+        samples=[[0.0] * 64]
     )
 ):
     try:
         return {
             "message": HTTPStatus.OK.phrase,
             "status-code": HTTPStatus.OK,
-            "data": serve_digits(payload, logger)
+            "data": await serve_digits_batch(payload, logger)
         }
+    except ExecutorOverloaded as e:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=HTTPStatus.UNPROCESSABLE_ENTITY,
             detail=str(e)
         )
+
+
+@app.get("/ready", tags=["Monitoring"])
+async def ready():
+    if not PROFILE.ready:
+        raise HTTPException(
+            status_code=HTTPStatus.SERVICE_UNAVAILABLE,
+            detail=PROFILE.report()
+        )
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": PROFILE.report(),
+    }
+
+
+@app.get("/metrics", tags=["Monitoring"])
+async def metrics():
+    """Exposes the metrics of the models in the Prometheus text format."""
+    return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+@app.get("/stats/batching", tags=["Monitoring"])
+async def batching_stats():
+    return {
+        "message": HTTPStatus.OK.phrase,
+        "status-code": HTTPStatus.OK,
+        "data": {batcher.name: batcher.snapshot() for batcher in BATCHERS}
+    }
@@ -0,0 +1,23 @@
+"""Metrics of the demo models, exposed on /metrics."""
+from ..metrics import SIZE_BUCKETS, MetricsRegistry
+
+REGISTRY = MetricsRegistry()
+
+PREDICT_LATENCY = REGISTRY.histogram(
+    'demo_predict_latency_seconds',
+    'Time spent predicting a batch, including the wait for a worker.',
+    ('model',),
+)
+
+BATCH_SIZE = REGISTRY.histogram(
+    'demo_batch_size',
+    'Samples predicted in a single call of the model.',
+    ('model',),
+    buckets=SIZE_BUCKETS,
+)
+
+REJECTED = REGISTRY.counter(
+    'demo_rejected_total',
+    'Predictions rejected because too many were pending.',
+    ('model',),
+)
@@ -11,4 +11,7 @@ if not MODELS_DIR.exists():
 
 IRIS_MODEL_FILEPATH = MODELS_DIR / Path('iris_classifier.pkl')
 DIGITS_MODEL_FILEPATH = MODELS_DIR / Path('digit_classifier.pkl')
+# compiled, pickle-free versions of the models above
+IRIS_MODEL_DIR = MODELS_DIR / Path('iris_classifier')
+DIGITS_MODEL_DIR = MODELS_DIR / Path('digit_classifier')
 DIGITS_EXAMPLE_FILEPATH = DATA_DIR / Path('digit_example.json')
@@ -0,0 +1,172 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from logging import Logger
+from pathlib import Path
+from typing import Any, Callable
+
+from . import artifacts
+
+
+@dataclass
+class LoadedModel:
+    model: Any
+    labels: dict[int, str]
+    mtime_ns: int
+    size: int               # estimated memory footprint
+    watched_size: int       # size of the file checked for changes
+    digest: str
+    checked_at: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class ModelEntry:
+    path: Path
+    # called once, the first time the model is loaded
+    labels_factory: Callable[[], dict[int, str]] | None = None
+    labels: dict[int, str] | None = None
+
+
+def _file_digest(path: Path) -> str:
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def _watched_file(path: Path) -> Path:
+    # compiled artifacts are swapped in as a whole, with a new meta file
+    return artifacts.meta_path(path) if path.is_dir() else path
+
+
+class ModelRegistry:
+    """Keeps the models of the demo application in memory.
+
+    Models are loaded on first use (or by `preload`) and reloaded when the
+    artifact on disk changes. When the resident models exceed the memory
+    budget, the least recently used ones are evicted; their size is estimated
+    from the size of their artifact.
+
+    An artifact is either a pickle file or a directory holding a compiled
+    model (see `artifacts`), which is memory-mapped instead of unpickled.
+    """
+
+    def __init__(self, logger: Logger, memory_budget: int, check_interval: float = 1.0):
+        self.logger = logger
+        self.memory_budget = memory_budget
+        self.check_interval = check_interval
+        self._entries: dict[str, ModelEntry] = {}
+        self._loaded: OrderedDict[str, LoadedModel] = OrderedDict()
+        self._lock = threading.RLock()
+
+    def register(
+        self,
+        name: str,
+        path: Path,
+        labels_factory: Callable[[], dict[int, str]] | None = None,
+    ):
+        with self._lock:
+            self._entries[name] = ModelEntry(path=path, labels_factory=labels_factory)
+            self._loaded.pop(name, None)
+
+    def discover(self, models_dir: Path, suffix: str = '.pkl'):
+        """Registers every artifact in `models_dir` not registered yet, by file stem.
+
+        A compiled artifact is preferred to a pickle with the same name.
+        """
+        known = {entry.path.resolve() for entry in self._entries.values()}
+        known |= {path.with_suffix('').resolve() for path in known}
+        candidates = [path for path in models_dir.iterdir() if artifacts.is_compiled(path)]
+        candidates += [
+            path for path in models_dir.glob(f'*{suffix}')
+            if not artifacts.is_compiled(path.with_suffix(''))
+        ]
+        for path in sorted(candidates):
+            if path.resolve() not in known and path.stem not in self._entries:
+                self.register(path.stem, path)
+
+    def path_of(self, name: str) -> Path:
+        return self._entries[name].path
+
+    def names(self) -> list[str]:
+        return list(self._entries)
+
+    def resident(self) -> list[str]:
+        return list(self._loaded)
+
+    def preload(self, names: list[str] | None = None):
+        for name in names if names is not None else self.names():
+            try:
+                self.get(name)
+            except Exception as e:
+                self.logger.error(f"Could not preload model '{name}': {e}")
+
+    def get(self, name: str) -> LoadedModel:
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                raise KeyError(f"Model '{name}' is not registered")
+
+            loaded = self._loaded.get(name)
+            if loaded is not None:
+                self._loaded.move_to_end(name)
+                now = time.monotonic()
+                if now - loaded.checked_at < self.check_interval:
+                    return loaded
+                loaded.checked_at = now
+                watched = _watched_file(entry.path)
+                stat = os.stat(watched)
+                if stat.st_mtime_ns == loaded.mtime_ns and stat.st_size == loaded.watched_size:
+                    return loaded
+                # the file was touched: reload only if the contents changed
+                digest = _file_digest(watched)
+                if digest == loaded.digest:
+                    loaded.mtime_ns = stat.st_mtime_ns
+                    return loaded
+                self.logger.info(f"Model '{name}' changed on disk, reloading")
+
+            loaded = self._load(entry)
+            self._loaded[name] = loaded
+            self._loaded.move_to_end(name)
+            self._evict(keep=name)
+            return loaded
+
+    def _load(self, entry: ModelEntry) -> LoadedModel:
+        self.logger.info(f"Loading model from {entry.path}")
+        watched = _watched_file(entry.path)
+        with open(watched, 'rb') as file:
+            data = file.read()
+            stat = os.fstat(file.fileno())
+
+        if entry.path.is_dir():
+            model = artifacts.load_model(entry.path)
+            size = artifacts.artifact_size(entry.path)
+        else:
+            model = pickle.loads(data)
+            size = stat.st_size
+
+        if entry.labels is None:
+            # compiled artifacts may carry their labels
+            entry.labels = getattr(model, 'labels', None) \
+                or (entry.labels_factory() if entry.labels_factory else {})
+
+        return LoadedModel(
+            model=model,
+            labels=entry.labels,
+            mtime_ns=stat.st_mtime_ns,
+            size=size,
+            watched_size=stat.st_size,
+            digest=hashlib.sha256(data).hexdigest(),
+        )
+
+    def _evict(self, keep: str):
+        total = sum(loaded.size for loaded in self._loaded.values())
+        for name in list(self._loaded):
+            if total <= self.memory_budget:
+                break
+            if name == keep:
+                continue
+            total -= self._loaded.pop(name).size
+            self.logger.info(f"Evicted model '{name}' from memory")
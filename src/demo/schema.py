@@ -1,3 +1,5 @@
+from typing import Any, Literal
+
 from pydantic import BaseModel
 
 class IrisPayload(BaseModel):
@@ -6,5 +8,23 @@ class IrisPayload(BaseModel):
     sepal_length: float
     sepal_width: float
 
+# base64-encoded buffers of uint8 or little-endian float32 values
+PixelsEncoding = Literal['base64-uint8', 'base64-float32']
+
 class DigitsPayload(BaseModel):
-    pixels: str
+    pixels: str | list[float]                   # ';'-joined string, array, or base64 buffer
+    encoding: PixelsEncoding | None = None      # required for base64 buffers
+
+# rows are validated one by one, so that a bad row does not fail the whole batch
+class IrisBatchPayload(BaseModel):
+    samples: list[Any]      # each row is a list of 4 floats or an IrisPayload object
+
+class DigitsBatchPayload(BaseModel):
+    samples: list[Any] | str            # each row is a list of 64 floats or a ';'-joined string,
+                                        # or all rows in one base64 buffer
+    encoding: PixelsEncoding | None = None
+
+class BatchResult(BaseModel):
+    index: int
+    prediction: int | str | None = None
+    error: str | None = None
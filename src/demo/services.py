@@ -1,42 +1,278 @@
-import pickle
+import base64
+import binascii
+import logging
+import math
 from logging import Logger
-from sklearn.datasets import load_iris
+from pathlib import Path
+from typing import Any, Callable
 
-from .schema import IrisPayload, DigitsPayload
+import numpy as np
+from pydantic import ValidationError
 
+from .. import config
+from . import artifacts, paths
+from .batching import MicroBatcher
+from .executor import InferenceExecutor
+from .monitoring import REGISTRY
+from .registry import ModelRegistry
+from .schema import (
+    BatchResult,
+    DigitsBatchPayload,
+    DigitsPayload,
+    IrisBatchPayload,
+    IrisPayload,
+)
 
-def serve_iris(input_payload: IrisPayload, logger: Logger) -> int:
+
+def _iris_labels() -> dict[int, str]:
+    from sklearn.datasets import load_iris
 
     iris_data = load_iris()
-    iris_species_map = {i: name for i, name in enumerate(iris_data.target_names)}
+    return {i: str(name) for i, name in enumerate(iris_data.target_names)}
+
+
+# models stay in memory between requests
+MODELS = ModelRegistry(
+    logger=logging.getLogger("uvicorn"),
+    memory_budget=config.DEMO_MODELS_MEMORY_BUDGET,
+    check_interval=config.DEMO_MODELS_CHECK_INTERVAL,
+)
+
+
+def _artifact(compiled: Path, pickled: Path) -> Path:
+    if config.DEMO_MODELS_COMPILED and artifacts.is_compiled(compiled):
+        return compiled
+    return pickled
+
+
+MODELS.register(
+    'iris',
+    _artifact(paths.IRIS_MODEL_DIR, paths.IRIS_MODEL_FILEPATH),
+    labels_factory=_iris_labels,
+)
+MODELS.register('digits', _artifact(paths.DIGITS_MODEL_DIR, paths.DIGITS_MODEL_FILEPATH))
+MODELS.discover(paths.MODELS_DIR)
+
+
+# predictions run off the event loop
+EXECUTOR = InferenceExecutor(
+    MODELS,
+    logger=logging.getLogger("uvicorn"),
+    kind=config.DEMO_EXECUTOR_KIND,
+    workers=config.DEMO_EXECUTOR_WORKERS,
+    thread_models=config.DEMO_EXECUTOR_THREAD_MODELS,
+    max_pending=config.DEMO_EXECUTOR_MAX_PENDING,
+    queue_timeout=config.DEMO_EXECUTOR_QUEUE_TIMEOUT,
+)
+
+# concurrent single-sample requests share one predict call
+IRIS_BATCHER = MicroBatcher(
+    'iris',
+    predict=lambda matrix: EXECUTOR.run('iris', matrix),
+    logger=logging.getLogger("uvicorn"),
+    max_batch_size=config.DEMO_MAX_BATCH_SIZE,
+    window=config.DEMO_BATCH_WINDOW,
+)
+DIGITS_BATCHER = MicroBatcher(
+    'digits',
+    predict=lambda matrix: EXECUTOR.run('digits', matrix),
+    logger=logging.getLogger("uvicorn"),
+    max_batch_size=config.DEMO_MAX_BATCH_SIZE,
+    window=config.DEMO_BATCH_WINDOW,
+)
+BATCHERS = [IRIS_BATCHER, DIGITS_BATCHER]
+
+REGISTRY.gauge(
+    'demo_batcher_queue_depth',
+    'Samples waiting to be batched.',
+    ('batcher',),
+    collect=lambda: {(batcher.name,): batcher.queue_depth() for batcher in BATCHERS},
+)
+REGISTRY.gauge(
+    'demo_executor_pending',
+    'Predictions running or waiting for a worker.',
+    collect=lambda: {(): EXECUTOR.pending},
+)
+REGISTRY.gauge(
+    'demo_models_resident',
+    'Models loaded in memory.',
+    collect=lambda: {(): len(MODELS.resident())},
+)
+
 
-    with open('data/models/iris_classifier.pkl', 'rb') as file:
-        logger.info("Attempting to load model")
-        model = pickle.load(file)
+async def serve_iris(input_payload: IrisPayload, logger: Logger) -> str:
 
-    raw_prediction = model.predict([
-        list(input_payload.model_dump().values())
-    ])
+    row = list(input_payload.model_dump().values())
+    # rows are stacked with the others in the batch, so check them here
+    if not all(math.isfinite(value) for value in row):
+        raise ValueError("Input contains NaN or infinity.")
 
-    prediction = int(raw_prediction[0])
-    prediction_name = iris_species_map.get(prediction, "unknown")
+    raw_prediction = await IRIS_BATCHER.submit(row)
+
+    prediction = int(raw_prediction)
+    prediction_name = MODELS.get('iris').labels.get(prediction, "unknown")
     return prediction_name
 
 
 
-def serve_digits(input_payload: DigitsPayload, logger: Logger) -> int:
+# dtypes accepted for binary buffers
+BUFFER_DTYPES = {
+    'uint8': np.dtype(np.uint8),
+    'float32': np.dtype('<f4'),
+}
+
+
+def decode_buffer(data: bytes, dtype: str) -> np.ndarray:
+    """Reads a buffer of `dtype` values, without parsing them one by one."""
+    if dtype not in BUFFER_DTYPES:
+        raise ValueError(f"Unsupported dtype '{dtype}', expected one of {list(BUFFER_DTYPES)}")
+    if len(data) % BUFFER_DTYPES[dtype].itemsize != 0:
+        raise ValueError(f"Buffer size {len(data)} is not a multiple of the size of {dtype}")
+    return np.frombuffer(data, dtype=BUFFER_DTYPES[dtype]).astype(np.float64)
+
+
+def decode_base64(data: str, encoding: str) -> np.ndarray:
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 data: {e}")
+    return decode_buffer(raw, encoding.removeprefix('base64-'))
+
+
+def decode_pixels(input_payload: DigitsPayload) -> np.ndarray:
+    pixels = input_payload.pixels
+    if isinstance(pixels, list):
+        return np.asarray(pixels, dtype=np.float64)
+    if input_payload.encoding:
+        return decode_base64(pixels, input_payload.encoding)
+
+    # legacy format: values joined by ';'; an empty value is an error
+    return np.array(pixels.split(';'), dtype=np.float64)
+
+
+async def serve_digits(input_payload: DigitsPayload, logger: Logger) -> int:
+    return await serve_digits_pixels(decode_pixels(input_payload), logger)
+
 
-    with open('data/models/digit_classifier.pkl', 'rb') as file:
-        logger.info("Attempting to load model")
-        model = pickle.load(file)
+async def serve_digits_pixels(data_points: np.ndarray, logger: Logger) -> int:
 
-    data_str = input_payload.pixels
-    data_points = [float(x) for x in data_str.split(";")]
+    model = MODELS.get('digits').model
 
-    raw_prediction = model.predict([
-        data_points
-    ])
+    # rows are stacked with the others in the batch, so check them here
+    if data_points.shape != (model.n_features_in_,):
+        raise ValueError(
+            f"X has {data_points.size} features, but the model is expecting {model.n_features_in_} features as input."
+        )
+    if not np.isfinite(data_points).all():
+        raise ValueError("Input contains NaN or infinity.")
 
-    prediction = int(raw_prediction[0])
+    raw_prediction = await DIGITS_BATCHER.submit(data_points)
+
+    prediction = int(raw_prediction)
 
     return prediction
+
+
+def _stack_rows(
+    rows: list,
+    width: int,
+    parse_row: Callable[[Any], list[float]],
+) -> tuple[np.ndarray, list[int], dict[int, str]]:
+    """Stacks the rows of a batch into a single matrix.
+
+    Returns the matrix of the valid rows, the index of each of them in the
+    batch, and the validation error of every invalid row.
+    """
+    # fast path: the batch is already a well formed 2-D array
+    try:
+        matrix = np.asarray(rows, dtype=np.float64)
+        if matrix.ndim == 2 and matrix.shape[1] == width and np.isfinite(matrix).all():
+            return matrix, list(range(len(rows))), {}
+    except (TypeError, ValueError):
+        pass
+
+    valid_rows, valid_index, errors = [], [], {}
+    for i, row in enumerate(rows):
+        try:
+            values = parse_row(row)
+            if len(values) != width:
+                raise ValueError(f"expected {width} values, got {len(values)}")
+            if not all(math.isfinite(value) for value in values):
+                raise ValueError("values must be finite numbers")
+        except (TypeError, ValueError, ValidationError) as e:
+            errors[i] = str(e)
+            continue
+        valid_rows.append(values)
+        valid_index.append(i)
+
+    matrix = np.asarray(valid_rows, dtype=np.float64).reshape(len(valid_rows), width)
+    return matrix, valid_index, errors
+
+
+async def _predict_batch(
+    name: str,
+    rows: list,
+    width: int,
+    parse_row: Callable[[Any], list[float]],
+    to_result: Callable[[Any], int | str],
+) -> list[BatchResult]:
+    matrix, valid_index, errors = _stack_rows(rows, width, parse_row)
+
+    results = [BatchResult(index=i, error=error) for i, error in errors.items()]
+    if len(valid_index) > 0:
+        # a single vectorized call for the whole batch
+        raw_predictions = await EXECUTOR.run(name, matrix)
+        results.extend(
+            BatchResult(index=i, prediction=to_result(raw))
+            for i, raw in zip(valid_index, raw_predictions)
+        )
+
+    results.sort(key=lambda result: result.index)
+    return results
+
+
+def _parse_iris_row(row: Any) -> list[float]:
+    if isinstance(row, dict):
+        return list(IrisPayload.model_validate(row).model_dump().values())
+    return [float(x) for x in row]
+
+
+def _parse_digits_row(row: Any) -> list[float]:
+    if isinstance(row, str):
+        return [float(x) for x in row.split(";")]
+    return [float(x) for x in row]
+
+
+async def serve_iris_batch(input_payload: IrisBatchPayload, logger: Logger) -> list[BatchResult]:
+
+    loaded = MODELS.get('iris')
+
+    return await _predict_batch(
+        'iris',
+        input_payload.samples,
+        width=len(IrisPayload.model_fields),
+        parse_row=_parse_iris_row,
+        to_result=lambda raw: loaded.labels.get(int(raw), "unknown"),
+    )
+
+
+async def serve_digits_batch(input_payload: DigitsBatchPayload, logger: Logger) -> list[BatchResult]:
+
+    model = MODELS.get('digits').model
+
+    samples = input_payload.samples
+    if isinstance(samples, str):
+        if not input_payload.encoding:
+            raise ValueError("encoding is required when samples is a base64 buffer")
+        matrix = decode_base64(samples, input_payload.encoding)
+        if matrix.size % model.n_features_in_ != 0:
+            raise ValueError(f"Buffer does not hold rows of {model.n_features_in_} values")
+        samples = matrix.reshape(-1, model.n_features_in_)
+
+    return await _predict_batch(
+        'digits',
+        samples,
+        width=model.n_features_in_,
+        parse_row=_parse_digits_row,
+        to_result=int,
+    )
@@ -0,0 +1,66 @@
+import asyncio
+import importlib
+import time
+from contextlib import contextmanager
+from logging import Logger
+from types import ModuleType
+from typing import Coroutine
+
+
+class StartupProfile:
+    """Records how long each step of the startup of an application takes.
+
+    Create it as early as possible in the application module, so that the
+    first phase covers the imports of the module itself.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: dict[str, float] = {}
+        self.ready_after: float | None = None
+        # why the warm-up failed, if it did
+        self.error: str | None = None
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_after is not None
+
+    @contextmanager
+    def phase(self, name: str):
+        phase_started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - phase_started
+
+    def mark(self, name: str):
+        """Records a phase that spans from the creation of the profile until now."""
+        self.phases[name] = time.perf_counter() - self.started
+
+    def import_module(self, name: str) -> ModuleType:
+        with self.phase(f"import {name}"):
+            return importlib.import_module(name)
+
+    def mark_ready(self):
+        self.ready_after = time.perf_counter() - self.started
+
+    def warm_up_in_background(self, warm_up: Coroutine, logger: Logger) -> asyncio.Task:
+        """Runs `warm_up` in a task; if it fails, the error is logged and reported."""
+        task = asyncio.create_task(warm_up)
+        task.add_done_callback(lambda task: self._warm_up_done(task, logger))
+        return task
+
+    def _warm_up_done(self, task: asyncio.Task, logger: Logger):
+        if task.cancelled() or task.exception() is None:
+            return
+        error = task.exception()
+        self.error = f"{type(error).__name__}: {error}"
+        logger.error(f"Warm-up failed, the application will not become ready: {self.error}", exc_info=error)
+
+    def report(self) -> dict:
+        return {
+            'ready': self.ready,
+            'ready_after': self.ready_after,
+            'error': self.error,
+            'phases': dict(self.phases),
+        }
@@ -0,0 +1,38 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+# settings without defaults, required to import the api application
+os.environ.setdefault('FRONTEND_HOST', 'localhost')
+os.environ.setdefault('FRONTEND_PORT', '3000')
+os.environ.setdefault('GITHUB_CLIENT_ID', 'test')
+os.environ.setdefault('GITHUB_CLIENT_SECRET', 'test')
+
+UPSTREAM_URL = 'http://upstream.test/predict'
+
+
+class MockUpstream:
+    """Answers the calls to the services with `handler`, and keeps the requests it received."""
+
+    def __init__(self):
+        self.requests: list[httpx.Request] = []
+        self.handler = lambda request: httpx.Response(200, json={'ok': 1})
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        response = self.handler(request)
+        return await response if asyncio.iscoroutine(response) else response
+
+
+@pytest.fixture
+def mock_upstream(monkeypatch) -> MockUpstream:
+    """Serves UPSTREAM_URL without a network."""
+    from src.api import services, upstream
+    from src.api.endpoints import parse_endpoint
+
+    mock = MockUpstream()
+    monkeypatch.setattr(upstream, '_client', httpx.AsyncClient(transport=httpx.MockTransport(mock.handle)))
+    monkeypatch.setitem(services.ENDPOINTS._endpoints, UPSTREAM_URL, parse_endpoint(UPSTREAM_URL))
+    return mock
@@ -0,0 +1,48 @@
+import asyncio
+
+from src.api.apikeys import APIKeyStore
+from src.api.schema import GitHubUser
+
+USER = GitHubUser(username='alice', github_id='1')
+
+
+def _store(tmp_path, cache_max_entries: int = 100) -> APIKeyStore:
+    return APIKeyStore(tmp_path / 'keys.json', cache_ttl=30.0, cache_max_entries=cache_max_entries)
+
+
+def test_issued_key_verifies_until_revoked(tmp_path):
+    store = _store(tmp_path)
+    api_key, key = store.issue(USER, 'ci', ['services:read'])
+
+    assert asyncio.run(store.verify(key)) == api_key
+    assert asyncio.run(store.verify(key[:-1])) is None
+    assert asyncio.run(store.verify('not a key')) is None
+    store.revoke(USER.github_id, api_key.key_id)
+    assert asyncio.run(store.verify(key)) is None
+
+
+def test_keys_issued_by_another_worker_are_seen(tmp_path):
+    api_key, key = _store(tmp_path).issue(USER, 'ci', ['services:read'])
+    assert asyncio.run(_store(tmp_path).verify(key)) == api_key
+
+
+def test_expired_key_is_rejected(tmp_path):
+    store = _store(tmp_path)
+    _, key = store.issue(USER, 'ci', ['services:read'], ttl=-1)
+    assert asyncio.run(store.verify(key)) is None
+
+
+def test_invalid_keys_do_not_evict_valid_ones(tmp_path, monkeypatch):
+    store = _store(tmp_path, cache_max_entries=4)
+    api_key, key = store.issue(USER, 'ci', ['services:read'])
+
+    async def run():
+        assert await store.verify(key) == api_key
+        for index in range(10):
+            assert await store.verify(f"xk_{index}_secret") is None
+        # a cached key is not looked up again
+        monkeypatch.setattr(store, '_lookup', None)
+        return await store.verify(key)
+
+    assert asyncio.run(run()) == api_key
+    assert len(store._invalid) == 4
@@ -0,0 +1,32 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+from src.demo.artifacts import load_model
+
+MODELS_DIR = Path(__file__).resolve().parent.parent / 'data' / 'models'
+MODELS = ['iris_classifier', 'digit_classifier']
+
+
+def _models(name: str):
+    with open(MODELS_DIR / f"{name}.pkl", 'rb') as file:
+        return pickle.load(file), load_model(MODELS_DIR / name)
+
+
+@pytest.mark.parametrize('name', MODELS)
+def test_compiled_model_agrees_with_pickle(name):
+    model, compiled = _models(name)
+    X = np.random.default_rng(0).uniform(0, 16, size=(500, model.n_features_in_))
+    assert (compiled.predict(X) == model.predict(X)).all()
+
+
+@pytest.mark.parametrize('name', MODELS)
+@pytest.mark.parametrize('value', [np.nan, np.inf, -np.inf])
+def test_compiled_model_rejects_non_finite_input(name, value):
+    compiled = load_model(MODELS_DIR / name)
+    X = np.ones((3, compiled.n_features_in_))
+    X[1, 0] = value
+    with pytest.raises(ValueError):
+        compiled.predict(X)
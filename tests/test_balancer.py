@@ -0,0 +1,92 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from src.api import services
+from src.api.balancer import ReplicaPool
+from src.api.endpoints import parse_endpoint
+from src.api.schema import Service
+
+LOGGER = logging.getLogger('tests')
+URLS = ['http://a.test/x', 'http://b.test/x', 'http://c.test/x']
+
+
+def _replicas(policy: str = 'least-outstanding', eject_after: int = 3):
+    pool = ReplicaPool(policy=policy, eject_after=eject_after, eject_for=30.0)
+    service = Service(executable_url=URLS[0], replica_urls=URLS[1:])
+    return pool, pool.get('svc', service)
+
+
+def test_least_outstanding_spreads_calls():
+    pool, replicas = _replicas()
+    picked = []
+    for _ in range(3):
+        replica = replicas.pick()
+        replica.outstanding += 1
+        picked.append(replica.url)
+    assert sorted(picked) == URLS
+
+
+def test_ewma_prefers_the_fastest_replica():
+    pool, replicas = _replicas(policy='ewma')
+    for replica, latency in zip(replicas.replicas, [0.3, 0.01, 0.2]):
+        pool.record(replica, latency, failed=False)
+    assert replicas.pick().url == URLS[1]
+
+
+def test_failing_replica_is_ejected_until_no_other_is_left():
+    pool, replicas = _replicas(eject_after=2)
+    failing = replicas.replicas[0]
+    pool.record(failing, 0.0, failed=True)
+    assert not failing.is_ejected(time.monotonic())
+    pool.record(failing, 0.0, failed=True)
+    assert failing.ejections == 1
+    assert all(replicas.pick().url != failing.url for _ in range(10))
+    assert replicas.pick(exclude=set(URLS[1:])) is failing
+
+
+def test_stats_survive_a_change_of_the_replicas():
+    pool, replicas = _replicas()
+    pool.record(replicas.replicas[1], 0.1, failed=False)
+    changed = pool.get('svc', Service(executable_url=URLS[1], replica_urls=['http://d.test/x']))
+    assert changed.replicas[0].requests == 1
+    assert changed.replicas[1].requests == 0
+
+
+@pytest.fixture
+def endpoints(monkeypatch):
+    """Known endpoints, so that the urls are not resolved."""
+    for url in URLS + ['not a url']:
+        monkeypatch.setitem(services.ENDPOINTS._endpoints, url, parse_endpoint(url))
+    return services.ENDPOINTS._endpoints
+
+
+def test_unusable_replica_is_skipped_and_ejected(endpoints, monkeypatch):
+    pool = ReplicaPool(policy='least-outstanding', eject_after=2, eject_for=30.0)
+    monkeypatch.setattr(services, 'REPLICAS', pool)
+    replicas = pool.get('svc', Service(executable_url='not a url', replica_urls=[URLS[0]]))
+    bad = replicas.replicas[0]
+
+    async def pick():
+        return await services._pick(replicas, set(), LOGGER)
+
+    for _ in range(2):
+        good = asyncio.run(pick())
+        assert good.url == URLS[0]
+        # the call to the usable replica
+        pool.record(good, 0.01, failed=False)
+        pool.record(good, 0.01, failed=False)
+    assert bad.failures == 2
+    assert bad.ejections == 1
+
+
+def test_no_usable_replica_raises(endpoints):
+    pool, _ = _replicas()
+    replicas = pool.get('svc', Service(executable_url='not a url', replica_urls=[URLS[0]]))
+    endpoints[URLS[0]].is_self = True
+
+    with pytest.raises(services._UnusableEndpoint):
+        asyncio.run(services._pick(replicas, set(), LOGGER))
+    assert asyncio.run(services._pick(replicas, {'not a url'}, LOGGER, untried_only=True)) is None
@@ -0,0 +1,78 @@
+import asyncio
+import logging
+
+import numpy as np
+
+from src.demo.batching import MicroBatcher
+from src.demo.executor import ExecutorOverloaded
+
+LOGGER = logging.getLogger('tests')
+
+
+def _batcher(predict, window: float = 0.01) -> tuple[MicroBatcher, list[int]]:
+    calls = []
+
+    async def counted(matrix: np.ndarray):
+        calls.append(len(matrix))
+        return await predict(matrix)
+
+    return MicroBatcher('test', counted, LOGGER, window=window), calls
+
+
+async def _submit_all(batcher: MicroBatcher, rows: list) -> list:
+    try:
+        return await asyncio.gather(*(batcher.submit(row) for row in rows), return_exceptions=True)
+    finally:
+        await batcher.stop()
+
+
+def test_concurrent_rows_share_a_batch():
+    async def predict(matrix):
+        return matrix.sum(axis=1)
+
+    batcher, calls = _batcher(predict)
+    results = asyncio.run(_submit_all(batcher, [[index, 1.0] for index in range(8)]))
+    assert results == [index + 1.0 for index in range(8)]
+    assert calls == [8]
+
+
+def test_bad_row_fails_alone():
+    async def predict(matrix):
+        if not np.isfinite(matrix).all():
+            raise ValueError("Input X contains NaN or infinity.")
+        return matrix.sum(axis=1)
+
+    batcher, calls = _batcher(predict)
+    results = asyncio.run(_submit_all(batcher, [[1.0], [np.nan], [2.0]]))
+    assert results[0] == 1.0 and results[2] == 2.0
+    assert isinstance(results[1], ValueError)
+    assert calls == [3, 1, 1, 1]
+
+
+def test_overload_fails_the_batch_without_retrying():
+    async def predict(matrix):
+        raise ExecutorOverloaded("Too many pending predictions")
+
+    batcher, calls = _batcher(predict)
+    results = asyncio.run(_submit_all(batcher, [[1.0], [2.0], [3.0]]))
+    assert all(isinstance(result, ExecutorOverloaded) for result in results)
+    assert calls == [3]
+
+
+def test_cancelled_flush_fails_its_rows():
+    async def predict(matrix):
+        await asyncio.sleep(10)
+
+    batcher, _ = _batcher(predict)
+
+    async def run():
+        submitted = asyncio.gather(*(batcher.submit([1.0]) for _ in range(2)), return_exceptions=True)
+        await asyncio.sleep(0.05)
+        for flush in list(batcher._flushes):
+            flush.cancel()
+        results = await asyncio.wait_for(submitted, 1)
+        await batcher.stop()
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
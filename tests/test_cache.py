@@ -0,0 +1,73 @@
+import asyncio
+import logging
+import time
+
+import httpx
+
+from src.api import services
+from src.api.cache import ResponseCache, payload_key
+from src.api.schema import Service, ServiceOutput
+
+from .conftest import UPSTREAM_URL
+
+LOGGER = logging.getLogger('tests')
+
+
+def _output(value) -> ServiceOutput:
+    return ServiceOutput(output={'value': value})
+
+
+def test_payload_key_ignores_key_order():
+    assert payload_key({'a': 1, 'b': [1, 2]}) == payload_key({'b': [1, 2], 'a': 1})
+    assert payload_key({'a': 1}) != payload_key({'a': 1.5})
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = ResponseCache(max_entries=2)
+    cache.put('svc', 'a', _output('a'), ttl=60)
+    cache.put('svc', 'b', _output('b'), ttl=60)
+    assert cache.get('svc', 'a') is not None
+    cache.put('svc', 'c', _output('c'), ttl=60)
+
+    assert cache.get('svc', 'b') is None
+    assert cache.get('svc', 'a').output == {'value': 'a'}
+    assert cache.stats()['evictions'] == 1
+
+
+def test_entries_expire_and_are_invalidated_by_service():
+    cache = ResponseCache(max_entries=10)
+    cache.put('svc', 'a', _output('a'), ttl=0.01)
+    cache.put('svc', 'b', _output('b'), ttl=60)
+    cache.put('other', 'b', _output('b'), ttl=60)
+    time.sleep(0.02)
+    assert cache.get('svc', 'a') is None
+
+    assert cache.invalidate('svc') == 1
+    assert cache.get('other', 'b') is not None
+
+
+def test_outputs_are_cached_only_if_the_service_opts_in(mock_upstream):
+    cached = Service(executable_url=UPSTREAM_URL, cache_ttl=60, coalesce=False)
+    uncached = Service(executable_url=UPSTREAM_URL, coalesce=False)
+
+    async def run():
+        for service_id, service in (('cache-on', cached), ('cache-off', uncached)):
+            for _ in range(3):
+                output = await services.serve_cached(service_id, service, {'x': 1}, LOGGER)
+                assert output.output == {'ok': 1}
+        services.RESPONSE_CACHE.invalidate('cache-on')
+
+    asyncio.run(run())
+    assert len(mock_upstream.requests) == 1 + 3
+
+
+def test_errors_are_not_cached(mock_upstream):
+    mock_upstream.handler = lambda request: httpx.Response(500, json={})
+    service = Service(executable_url=UPSTREAM_URL, cache_ttl=60, coalesce=False, retries=0)
+
+    async def run():
+        for _ in range(2):
+            assert (await services.serve_cached('cache-errors', service, {'x': 1}, LOGGER)).errors
+
+    asyncio.run(run())
+    assert len(mock_upstream.requests) == 2
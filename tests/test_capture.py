@@ -0,0 +1,43 @@
+import json
+import logging
+
+from src.api.capture import TrafficJournal
+
+LOGGER = logging.getLogger('tests')
+
+
+def _journal(tmp_path, **options) -> TrafficJournal:
+    options = {'max_bytes': 1 << 20, 'max_files': 3, 'max_buffered': 100, 'max_buffered_bytes': 1000} | options
+    return TrafficJournal(tmp_path, 'traffic', LOGGER, flush_interval=60, **options)
+
+
+def _entry(body: bytes) -> dict:
+    return {'ts': 0.0, 'method': 'POST', 'path': '/services/a/use', 'content_type': 'application/json', 'body': body}
+
+
+def test_buffer_is_bounded_by_bytes(tmp_path):
+    journal = _journal(tmp_path)
+    journal.start()
+    try:
+        for _ in range(3):
+            journal.record(_entry(b'"' + b'x' * 398 + b'"'))
+        journal.record(_entry(b'{}'))
+        assert journal.dropped == 1
+        assert journal.buffered_bytes == 802
+    finally:
+        journal.stop()
+    assert journal.buffered_bytes == 0
+    assert journal.written == 3
+    lines = (tmp_path / 'traffic.jsonl').read_text().splitlines()
+    assert [json.loads(line)['payload'] for line in lines][-1] == {}
+
+
+def test_files_are_rotated_by_size(tmp_path):
+    journal = _journal(tmp_path, max_bytes=1, max_files=2)
+    journal.start()
+    for index in range(3):
+        journal.record(_entry(str(index).encode()))
+        journal._flush()
+    journal.stop()
+    assert json.loads((tmp_path / 'traffic.1.jsonl').read_text())['payload'] == 2
+    assert not (tmp_path / 'traffic.2.jsonl').exists()
@@ -0,0 +1,75 @@
+import pytest
+
+from src.api.catalog import ServiceCatalog, decode_cursor, encode_cursor
+from src.api.schema import Service
+
+
+def _catalog(count: int = 10) -> ServiceCatalog:
+    catalog = ServiceCatalog()
+    catalog.rebuild({
+        f"id{index:02}": Service(name=f"Model {index}", description='iris classifier' if index % 2 else 'digits')
+        for index in range(count)
+    })
+    return catalog
+
+
+def _all_pages(catalog: ServiceCatalog, limit: int, query: str | None = None) -> list[str]:
+    ids = []
+    cursor = None
+    while True:
+        items, cursor = catalog.page(cursor, limit, query, ('id',))
+        ids += [item['id'] for item in items]
+        if cursor is None:
+            return ids
+
+
+def test_pages_cover_every_service_once_in_order():
+    catalog = _catalog()
+    assert _all_pages(catalog, limit=3) == [f"id{index:02}" for index in range(10)]
+    assert _all_pages(catalog, limit=10) == _all_pages(catalog, limit=100)
+
+
+def test_cursor_survives_the_deletion_of_its_service():
+    catalog = _catalog()
+    items, cursor = catalog.page(limit=3, fields=('id',))
+    catalog.remove(items[-1]['id'])
+    items, _ = catalog.page(cursor, limit=1, fields=('id',))
+    assert items == [{'id': 'id03'}]
+
+
+def test_search_matches_word_prefixes():
+    catalog = _catalog()
+    assert _all_pages(catalog, limit=2, query='iris CLASS') == [f"id{index:02}" for index in range(1, 10, 2)]
+    assert catalog.search('digit') == {f"id{index:02}" for index in range(0, 10, 2)}
+    assert catalog.search('iris digits') == set()
+
+    catalog.put('id01', Service(name='Renamed'))
+    assert 'id01' not in catalog.search('iris')
+    assert catalog.search('renamed') == {'id01'}
+
+
+def test_etags_change_with_the_services():
+    catalog = _catalog()
+    etag, service_etag = catalog.etag, catalog.etag_of('id01')
+    catalog.put('id02', Service(name='Other'))
+    assert catalog.etag != etag
+    assert catalog.etag_of('id01') == service_etag
+
+    catalog.put('id01', Service(name='Changed'))
+    assert catalog.etag_of('id01') != service_etag
+    catalog.remove('id01')
+    assert catalog.etag_of('id01') is None
+
+
+def test_etags_differ_across_restarts():
+    assert _catalog().etag != _catalog().etag
+
+
+@pytest.mark.parametrize('cursor', ['', '!!!', 'aGVsbG8', encode_cursor('\x00')])
+def test_malformed_cursors_are_rejected(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('id-01_x')) == 'id-01_x'
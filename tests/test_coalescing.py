@@ -0,0 +1,72 @@
+import asyncio
+import logging
+
+import httpx
+
+from src.api import services
+from src.api.schema import Service
+
+from .conftest import UPSTREAM_URL
+
+LOGGER = logging.getLogger('tests')
+
+
+def _slow(status: int = 200):
+    async def handler(request):
+        await asyncio.sleep(0.05)
+        return httpx.Response(status, json={'ok': 1})
+    return handler
+
+
+def test_identical_concurrent_calls_share_one_upstream_call(mock_upstream):
+    mock_upstream.handler = _slow()
+    service = Service(executable_url=UPSTREAM_URL, coalesce=True)
+
+    async def run():
+        return await asyncio.gather(
+            *(services.serve_cached('coalesce-on', service, {'x': 1}, LOGGER) for _ in range(5)),
+            services.serve_cached('coalesce-on', service, {'x': 2}, LOGGER),
+        )
+
+    outputs = asyncio.run(run())
+    assert all(output.output == {'ok': 1} for output in outputs)
+    assert len(mock_upstream.requests) == 2
+
+
+def test_calls_are_not_shared_unless_enabled(mock_upstream):
+    mock_upstream.handler = _slow()
+    service = Service(executable_url=UPSTREAM_URL, coalesce=False)
+
+    async def run():
+        await asyncio.gather(*(services.serve_cached('coalesce-off', service, {'x': 1}, LOGGER) for _ in range(3)))
+
+    asyncio.run(run())
+    assert len(mock_upstream.requests) == 3
+
+
+def test_shared_call_survives_the_caller_that_started_it(mock_upstream):
+    mock_upstream.handler = _slow()
+    service = Service(executable_url=UPSTREAM_URL, coalesce=True)
+
+    async def run():
+        first = asyncio.create_task(services.serve_cached('coalesce-cancel', service, {'x': 1}, LOGGER))
+        await asyncio.sleep(0.01)
+        second = asyncio.create_task(services.serve_cached('coalesce-cancel', service, {'x': 1}, LOGGER))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()).output == {'ok': 1}
+    assert len(mock_upstream.requests) == 1
+    assert not services.IN_FLIGHT_CALLS
+
+
+def test_errors_are_handed_to_every_caller(mock_upstream):
+    mock_upstream.handler = _slow(status=500)
+    service = Service(executable_url=UPSTREAM_URL, coalesce=True, retries=0)
+
+    async def run():
+        return await asyncio.gather(*(services.serve_cached('coalesce-errors', service, {'x': 1}, LOGGER) for _ in range(3)))
+
+    assert all(output.errors for output in asyncio.run(run()))
+    assert len(mock_upstream.requests) == 1
@@ -0,0 +1,83 @@
+import asyncio
+import logging
+
+import pytest
+
+from src.api.jobs import CANCELLED, RUNNING, SUCCEEDED, JobManager, JobQueueFull, SharedJobs
+from src.api.schema import ServiceOutput
+
+LOGGER = logging.getLogger('tests')
+
+
+def _manager(execute, shared: SharedJobs | None = None, **options) -> JobManager:
+    options = {'workers': 2, 'service_concurrency': lambda service_id: 2, 'max_queued': 10, 'ttl': 60.0} | options
+    return JobManager(execute, LOGGER, shared=shared, cancel_interval=0.01, **options)
+
+
+async def _echo(job):
+    await asyncio.sleep(0.01)
+    return 200, ServiceOutput(input_payload=job.payload, output=job.payload)
+
+
+async def _forever(job):
+    await asyncio.sleep(10)
+
+
+def test_wait_returns_once_the_job_finishes():
+    async def run():
+        manager = _manager(_echo)
+        job = await manager.submit('svc', 'alice', {'x': 1})
+        snapshot = await manager.wait(job.id, 'alice', timeout=1)
+        assert await manager.get(job.id, 'bob') is None
+        await manager.stop()
+        return snapshot
+
+    snapshot = asyncio.run(run())
+    assert snapshot['status'] == SUCCEEDED
+    assert snapshot['output'] == {'x': 1}
+
+
+def test_wait_returns_when_the_job_leaves_a_status():
+    async def run():
+        manager = _manager(_forever)
+        job = await manager.submit('svc', 'alice', {})
+        await asyncio.sleep(0)
+        running = await manager.wait(job.id, 'alice', timeout=1, status='queued')
+        still = await manager.wait(job.id, 'alice', timeout=0.05, status=RUNNING)
+        await manager.stop()
+        return running, still
+
+    running, still = asyncio.run(run())
+    assert running['status'] == RUNNING
+    assert still['status'] == RUNNING
+
+
+def test_queue_limit():
+    async def run():
+        manager = _manager(_forever, max_queued=1)
+        await manager.submit('svc', 'alice', {})
+        try:
+            with pytest.raises(JobQueueFull):
+                await manager.submit('svc', 'alice', {})
+        finally:
+            await manager.stop()
+
+    asyncio.run(run())
+
+
+def test_jobs_are_read_and_cancelled_from_another_worker(tmp_path):
+    async def run():
+        here = _manager(_forever, SharedJobs(tmp_path / 'jobs.sqlite3'))
+        there = _manager(_forever, SharedJobs(tmp_path / 'jobs.sqlite3'))
+        job = await here.submit('svc', 'alice', {})
+
+        assert (await there.get(job.id, 'alice'))['job_id'] == job.id
+        assert await there.get(job.id, 'bob') is None
+        snapshot, cancelled_here = await there.cancel(job.id, 'alice')
+        assert not cancelled_here
+        cancelled = await there.wait(job.id, 'alice', timeout=2)
+        await here.stop()
+        await there.stop()
+        return cancelled
+
+    assert asyncio.run(run())['status'] == CANCELLED
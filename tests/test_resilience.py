@@ -0,0 +1,97 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.api.resilience import CLOSED, HALF_OPEN, OPEN, Bulkhead, BulkheadFull, CircuitBreaker, CircuitOpen
+from src.api.services import BREAKER_FAILURES, classify_error
+
+
+def _breaker(reset_timeout: float = 60.0, half_open_probes: int = 1) -> CircuitBreaker:
+    return CircuitBreaker(failure_threshold=3, reset_timeout=reset_timeout, half_open_probes=half_open_probes)
+
+
+def _fail(breaker: CircuitBreaker, times: int):
+    for _ in range(times):
+        breaker.record(breaker.acquire(), failed=True)
+
+
+def test_opens_after_consecutive_failures():
+    breaker = _breaker()
+    _fail(breaker, 2)
+    breaker.record(breaker.acquire(), failed=False)
+    _fail(breaker, 2)
+    assert breaker.state == CLOSED
+    _fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpen) as error:
+        breaker.acquire()
+    assert 0 < error.value.retry_after <= 60
+
+
+def test_half_open_probe_closes_or_reopens():
+    breaker = _breaker(reset_timeout=0.0)
+    _fail(breaker, 3)
+    token = breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    # a single probe at a time
+    with pytest.raises(CircuitOpen):
+        breaker.acquire()
+    breaker.record(token, failed=True)
+    assert breaker.state == OPEN
+
+    token = breaker.acquire()
+    breaker.record(token, failed=False)
+    assert breaker.state == CLOSED
+
+
+def test_released_probe_lets_another_one_through():
+    breaker = _breaker(reset_timeout=0.0)
+    _fail(breaker, 3)
+    breaker.release(breaker.acquire())
+    breaker.record(breaker.acquire(), failed=False)
+    assert breaker.state == CLOSED
+
+
+def test_calls_of_an_earlier_period_are_ignored():
+    breaker = _breaker(reset_timeout=0.0)
+    started_while_closed = breaker.acquire()
+    _fail(breaker, 3)
+    stale_probe = breaker.acquire()
+    breaker.record(stale_probe, failed=True)
+    probe = breaker.acquire()
+
+    # neither closes nor reopens the circuit being probed
+    breaker.record(started_while_closed, failed=False)
+    breaker.record(stale_probe, failed=False)
+    assert breaker.state == HALF_OPEN
+    breaker.record(probe, failed=False)
+    assert breaker.state == CLOSED
+
+
+def test_only_server_side_errors_count_as_failures():
+    request = httpx.Request('POST', 'http://upstream.test/x')
+
+    def status_error(status: int) -> httpx.HTTPStatusError:
+        response = httpx.Response(status, request=request)
+        return httpx.HTTPStatusError('error', request=request, response=response)
+
+    assert classify_error(status_error(503)) in BREAKER_FAILURES
+    assert classify_error(httpx.ConnectError('refused', request=request)) in BREAKER_FAILURES
+    assert classify_error(httpx.ReadTimeout('slow', request=request)) in BREAKER_FAILURES
+    assert classify_error(status_error(404)) not in BREAKER_FAILURES
+    assert classify_error(status_error(422)) not in BREAKER_FAILURES
+
+
+def test_bulkhead_rejects_calls_beyond_its_limit():
+    bulkhead = Bulkhead(max_concurrency=1, queue_timeout=0.01)
+
+    async def run():
+        async with bulkhead.slot():
+            with pytest.raises(BulkheadFull):
+                async with bulkhead.slot():
+                    pass
+        async with bulkhead.slot():
+            return True
+
+    assert asyncio.run(run())
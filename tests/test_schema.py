@@ -0,0 +1,42 @@
+import json
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+from src.api.schema import Service, ServiceParameter
+from src.api.validation import PayloadError, compile_validator
+
+DB_DIR = Path(__file__).resolve().parent.parent / 'data' / 'db'
+
+
+def test_loads_legacy_registry():
+    with open(DB_DIR / 'services-backup.json', 'r') as file:
+        services = {key: Service.model_validate(value) for key, value in json.load(file).items()}
+
+    assert [p.data_type for p in services['iris'].parameters] == ['number'] * 4
+    assert services['digits'].parameters[0].data_type == 'string'
+
+
+def test_unknown_data_type_is_untyped():
+    assert ServiceParameter(name='x', data_type='tensor').data_type is None
+    assert ServiceParameter(name='x', data_type='').data_type is None
+    assert ServiceParameter(name='x', data_type='Integer').data_type == 'integer'
+
+
+def test_clients_cannot_send_unknown_data_types():
+    context = {'strict_data_types': True}
+    assert Service.model_validate({'parameters': [{'name': 'x', 'data_type': 'int'}]}, context=context) \
+        .parameters[0].data_type == 'integer'
+    with pytest.raises(ValidationError):
+        Service.model_validate({'parameters': [{'name': 'x', 'data_type': 'nubmer'}]}, context=context)
+    with pytest.raises(ValidationError):
+        Service.model_validate({'parameters': [{'name': 'x', 'data_type': ''}]}, context=context)
+
+
+def test_huge_integers_are_rejected_as_invalid():
+    validate = compile_validator([ServiceParameter(name='x', data_type='number')])
+    with pytest.raises(PayloadError) as error:
+        validate({'x': 10 ** 400})
+    assert error.value.errors == ["Field 'x' must be a number."]
+    assert validate({'x': '1.5'}) == {'x': 1.5}
@@ -0,0 +1,37 @@
+import asyncio
+import logging
+
+from src.startup import StartupProfile
+
+LOGGER = logging.getLogger('tests')
+
+
+def test_failed_warm_up_is_reported(caplog):
+    profile = StartupProfile()
+
+    async def warm_up():
+        raise RuntimeError("models are missing")
+
+    async def run():
+        await asyncio.gather(profile.warm_up_in_background(warm_up(), LOGGER), return_exceptions=True)
+
+    asyncio.run(run())
+    assert not profile.ready
+    assert profile.report()['error'] == "RuntimeError: models are missing"
+    assert "models are missing" in caplog.text
+
+
+def test_successful_warm_up_marks_ready():
+    profile = StartupProfile()
+
+    async def warm_up():
+        with profile.phase("load"):
+            await asyncio.sleep(0)
+        profile.mark_ready()
+
+    async def run():
+        await profile.warm_up_in_background(warm_up(), LOGGER)
+
+    asyncio.run(run())
+    assert profile.report()['ready'] and profile.report()['error'] is None
+    assert 'load' in profile.phases
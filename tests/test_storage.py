@@ -0,0 +1,135 @@
+import asyncio
+import logging
+
+import pytest
+
+from src.api import db
+from src.api.schema import Service
+from src.api.storage import JsonStore, LogStore, SqliteStore, StoreNotLoaded
+
+STORES = {
+    'json': lambda tmp_path: JsonStore(tmp_path / 'services.json'),
+    'sqlite': lambda tmp_path: SqliteStore(tmp_path / 'services.sqlite3'),
+    'log': lambda tmp_path: LogStore(tmp_path / 'services.log'),
+}
+LOGGER = logging.getLogger('tests')
+
+
+def _service(name: str) -> Service:
+    return Service(name=name, executable_url=f"http://upstream.test/{name}")
+
+
+@pytest.mark.parametrize('backend', STORES)
+def test_changes_survive_reopen(backend, tmp_path):
+    store = STORES[backend](tmp_path)
+    store.load()
+    store.put('a', _service('a'))
+    store.put('b', _service('b'))
+    store.put('a', _service('a2'))
+    store.delete('b')
+    store.compact()
+    store.put('c', _service('c'))
+    store.close()
+
+    reopened = STORES[backend](tmp_path)
+    assert reopened.load() == {'a': _service('a2'), 'c': _service('c')}
+    reopened.close()
+
+
+def test_log_store_drops_truncated_tail(tmp_path):
+    store = LogStore(tmp_path / 'services.log')
+    store.load()
+    store.put('a', _service('a'))
+    store.close()
+    with open(tmp_path / 'services.log', 'a') as file:
+        file.write('{"op": "put", "id": "b", "serv')
+
+    reopened = LogStore(tmp_path / 'services.log')
+    assert reopened.load() == {'a': _service('a')}
+    assert reopened.garbage_ratio == 0.0
+
+
+def test_log_store_compaction_drops_obsolete_records(tmp_path):
+    store = LogStore(tmp_path / 'services.log')
+    store.load()
+    for index in range(4):
+        store.put('a', _service(f"a{index}"))
+    assert store.garbage_ratio == 0.75
+
+    store.compact()
+    assert store.garbage_ratio == 0.0
+    assert len((tmp_path / 'services.log').read_text().splitlines()) == 1
+
+
+def test_store_refuses_writes_after_failed_load(tmp_path):
+    (tmp_path / 'services.json').write_text('{"a": ')
+    store = JsonStore(tmp_path / 'services.json')
+    with pytest.raises(ValueError):
+        store.load()
+    with pytest.raises(StoreNotLoaded):
+        store.put('a', _service('a'))
+    assert (tmp_path / 'services.json').read_text() == '{"a": '
+
+
+def test_sqlite_store_replays_changes_of_other_connections(tmp_path):
+    writer = SqliteStore(tmp_path / 'services.sqlite3')
+    reader = SqliteStore(tmp_path / 'services.sqlite3')
+    writer.load()
+    version = reader.version()
+
+    writer.put('a', _service('a'))
+    writer.put('b', _service('b'))
+    writer.delete('a')
+    latest, changes = reader.changes_since(version)
+    assert changes == [('a', _service('a')), ('b', _service('b')), ('a', None)]
+    assert reader.changes_since(latest) == (latest, [])
+
+    # a full save cannot be replayed change by change
+    writer.save({'c': _service('c')})
+    assert reader.changes_since(latest)[1] is None
+    writer.close()
+    reader.close()
+
+
+def test_failed_writes_leave_the_registry_unchanged(tmp_path, monkeypatch):
+    store = JsonStore(tmp_path / 'services.json')
+    store.load()
+    monkeypatch.setattr(db, '_store', store)
+    monkeypatch.setattr(db, '_write_lock', asyncio.Lock())
+    services = {}
+
+    async def run():
+        id = await db.create_service(LOGGER, services, _service('a'))
+        store.load_failed = True
+        with pytest.raises(StoreNotLoaded):
+            await db.update_service(LOGGER, services, id, _service('a2'))
+        with pytest.raises(StoreNotLoaded):
+            await db.delete_service(LOGGER, services, id)
+        with pytest.raises(StoreNotLoaded):
+            await db.create_service(LOGGER, services, _service('b'))
+        return id
+
+    id = asyncio.run(run())
+    assert services == {id: _service('a')}
+
+
+def test_sync_applies_the_changes_of_other_workers(tmp_path, monkeypatch):
+    other = SqliteStore(tmp_path / 'services.sqlite3')
+    other.load()
+    other.put('a', _service('a'))
+    monkeypatch.setattr(db, '_store', SqliteStore(tmp_path / 'services.sqlite3'))
+    monkeypatch.setattr(db, '_sync_lock', asyncio.Lock())
+    monkeypatch.setattr(db, '_synced_version', 0)
+    services = db.load_services(LOGGER)
+
+    other.put('b', _service('b'))
+    other.delete('a')
+    assert asyncio.run(db.sync_services(LOGGER, services)) == [('b', _service('b')), ('a', None)]
+    assert services == {'b': _service('b')}
+
+    # a full save is applied by loading every service again
+    other.save({'c': _service('c')})
+    asyncio.run(db.sync_services(LOGGER, services))
+    assert services == {'c': _service('c')}
+    db.close_store()
+    other.close()